@@ -0,0 +1,194 @@
+# alembic/versions/001_initial_migration.py
+"""Initial migration
+
+Revision ID: 001
+Revises: 
+Create Date: 2024-01-15 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Create users table
+    op.create_table('users',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('hashed_password', sa.String(length=255), nullable=False),
+        sa.Column('role', sa.String(length=50), nullable=True),
+        sa.Column('avatar', sa.String(length=500), nullable=True),
+        sa.Column('department', sa.String(length=255), nullable=True),
+        sa.Column('phone', sa.String(length=20), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+
+    # Create documents table
+    op.create_table('documents',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(length=500), nullable=False),
+        sa.Column('original_name', sa.String(length=500), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('size', sa.String(length=50), nullable=False),
+        sa.Column('file_path', sa.String(length=1000), nullable=False),
+        sa.Column('folder', sa.String(length=500), nullable=True),
+        sa.Column('upload_date', sa.DateTime(), nullable=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('is_processed', sa.Boolean(), nullable=True),
+        sa.Column('extracted_text', sa.Text(), nullable=True),
+        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('shared', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create document permissions table
+    op.create_table('document_permissions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('permission', sa.String(length=20), nullable=False),
+        sa.Column('granted_by', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('granted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+        sa.ForeignKeyConstraint(['granted_by'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create OCR results table
+    op.create_table('ocr_results',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('original_file', sa.String(length=500), nullable=False),
+        sa.Column('extracted_text', sa.Text(), nullable=False),
+        sa.Column('confidence', sa.Float(), nullable=True),
+        sa.Column('process_date', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('engine_used', sa.String(length=100), nullable=True),
+        sa.Column('language', sa.String(length=10), nullable=True),
+        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create chat sessions table
+    op.create_table('chat_sessions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('title', sa.String(length=500), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create chat messages table
+    op.create_table('chat_messages',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('type', sa.String(length=20), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('sources', sa.JSON(), nullable=True),
+        sa.Column('rating', sa.String(length=10), nullable=True),
+        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['chat_sessions.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create reports table
+    op.create_table('reports',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('title', sa.String(length=500), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('created_by', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_date', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('file_path', sa.String(length=1000), nullable=True),
+        sa.Column('config', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create search history table
+    op.create_table('search_history',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('query', sa.String(length=1000), nullable=False),
+        sa.Column('filters', sa.JSON(), nullable=True),
+        sa.Column('results_count', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create vector store table
+    op.create_table('vector_store',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('embedding', sa.JSON(), nullable=True),
+        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Create system settings table
+    op.create_table('system_settings',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('value', sa.JSON(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('updated_by', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['updated_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+
+    # Create activity logs table
+    op.create_table('activity_logs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action', sa.String(length=100), nullable=False),
+        sa.Column('resource_type', sa.String(length=100), nullable=True),
+        sa.Column('resource_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('ip_address', sa.String(length=45), nullable=True),
+        sa.Column('user_agent', sa.String(length=500), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+def downgrade() -> None:
+    op.drop_table('activity_logs')
+    op.drop_table('system_settings')
+    op.drop_table('vector_store')
+    op.drop_table('search_history')
+    op.drop_table('reports')
+    op.drop_table('chat_messages')
+    op.drop_table('chat_sessions')
+    op.drop_table('ocr_results')
+    op.drop_table('document_permissions')
+    op.drop_table('documents')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,79 @@
+# alembic/versions/002_compact_embeddings.py
+"""Compact binary embeddings in vector_store
+
+Existing JSON embeddings are packed into embedding_blob and the JSON value is
+set to NULL; the legacy embedding column itself is kept (VectorStore.embedding).
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from config import settings
+from services.embedding_codec import encode_embedding, decode_embedding
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+vector_store = sa.table('vector_store',
+    sa.column('id', sa.String),
+    sa.column('embedding', sa.JSON),
+    sa.column('embedding_blob', sa.LargeBinary),
+    sa.column('embedding_dtype', sa.String),
+    sa.column('embedding_scale', sa.Float),
+)
+
+def upgrade() -> None:
+    op.add_column('vector_store', sa.Column('embedding_blob', sa.LargeBinary(), nullable=True))
+    op.add_column('vector_store', sa.Column('embedding_dtype', sa.String(length=10), nullable=True))
+    op.add_column('vector_store', sa.Column('embedding_scale', sa.Float(), nullable=True))
+
+    # Convert JSON float lists to the packed format in batches, clearing the JSON value
+    conn = op.get_bind()
+    dtype = settings.VECTOR_STORAGE_DTYPE
+    while True:
+        rows = conn.execute(
+            sa.select(vector_store.c.id, vector_store.c.embedding)
+            .where(vector_store.c.embedding.isnot(None), vector_store.c.embedding_blob.is_(None))
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            blob, scale = encode_embedding(row.embedding, dtype)
+            conn.execute(
+                vector_store.update()
+                .where(vector_store.c.id == row.id)
+                .values(embedding_blob=blob, embedding_dtype=dtype, embedding_scale=scale, embedding=None)
+            )
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.select(
+            vector_store.c.id,
+            vector_store.c.embedding_blob,
+            vector_store.c.embedding_dtype,
+            vector_store.c.embedding_scale
+        ).where(vector_store.c.embedding_blob.isnot(None))
+    )
+    for row in rows.fetchall():
+        embedding = decode_embedding(row.embedding_blob, row.embedding_dtype, row.embedding_scale)
+        conn.execute(
+            vector_store.update()
+            .where(vector_store.c.id == row.id)
+            .values(embedding=[float(x) for x in embedding])
+        )
+
+    op.drop_column('vector_store', 'embedding_scale')
+    op.drop_column('vector_store', 'embedding_dtype')
+    op.drop_column('vector_store', 'embedding_blob')
@@ -0,0 +1,34 @@
+# alembic/versions/003_chat_history_indexes.py
+"""Chat history indexes and native JSON sources
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_chat_sessions_user_updated', 'chat_sessions', ['user_id', 'updated_at'])
+    op.create_index('ix_chat_messages_session_timestamp', 'chat_messages', ['session_id', 'timestamp'])
+
+    # Older rows stored sources as a JSON string holding the encoded list
+    op.execute(
+        "UPDATE chat_messages SET sources = (sources #>> '{}')::json "
+        "WHERE sources IS NOT NULL AND json_typeof(sources) = 'string'"
+    )
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE chat_messages SET sources = to_json(sources::text) "
+        "WHERE sources IS NOT NULL AND json_typeof(sources) <> 'string'"
+    )
+
+    op.drop_index('ix_chat_messages_session_timestamp', table_name='chat_messages')
+    op.drop_index('ix_chat_sessions_user_updated', table_name='chat_sessions')
@@ -0,0 +1,24 @@
+# alembic/versions/004_chat_session_summary.py
+"""Rolling conversation summary on chat sessions
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summarized_count', sa.Integer(), nullable=False, server_default='0'))
+
+def downgrade() -> None:
+    op.drop_column('chat_sessions', 'summarized_count')
+    op.drop_column('chat_sessions', 'summary')
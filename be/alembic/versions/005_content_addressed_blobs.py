@@ -0,0 +1,44 @@
+# alembic/versions/005_content_addressed_blobs.py
+"""Content-addressed file blobs shared by documents
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'file_blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.String(length=1000), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('mime_type', sa.String(length=255), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('extracted_text', sa.Text(), nullable=True),
+        sa.Column('ocr_text', sa.Text(), nullable=True),
+        sa.Column('ocr_confidence', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_documents_content_hash', 'documents', ['content_hash'])
+    op.create_foreign_key('fk_documents_content_hash', 'documents', 'file_blobs', ['content_hash'], ['sha256'])
+
+    # Existing files stay where they are and keep content_hash NULL: each is owned
+    # by a single document and deleted with it, as before.
+
+def downgrade() -> None:
+    op.drop_constraint('fk_documents_content_hash', 'documents', type_='foreignkey')
+    op.drop_index('ix_documents_content_hash', table_name='documents')
+    op.drop_column('documents', 'content_hash')
+    op.drop_table('file_blobs')
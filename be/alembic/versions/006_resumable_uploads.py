@@ -0,0 +1,42 @@
+# alembic/versions/006_resumable_uploads.py
+"""Resumable upload sessions
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('filename', sa.String(length=500), nullable=False),
+        sa.Column('total_size', sa.BigInteger(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('part_path', sa.String(length=1000), nullable=False),
+        sa.Column('received_ranges', sa.JSON(), nullable=True),
+        sa.Column('received_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upload_sessions_status_expires', 'upload_sessions', ['status', 'expires_at'])
+
+def downgrade() -> None:
+    op.drop_index('ix_upload_sessions_status_expires', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
@@ -0,0 +1,55 @@
+# alembic/versions/007_bulk_ingest_jobs.py
+"""Bulk ingest jobs and per-file items
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('folder', sa.String(length=500), nullable=True),
+        sa.Column('sources', sa.JSON(), nullable=True),
+        sa.Column('total_items', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'ingest_items',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('job_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(length=1000), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['ingest_jobs.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ingest_items_job_status', 'ingest_items', ['job_id', 'status'])
+    op.create_index('ix_ingest_items_document', 'ingest_items', ['document_id'])
+
+def downgrade() -> None:
+    op.drop_index('ix_ingest_items_document', table_name='ingest_items')
+    op.drop_index('ix_ingest_items_job_status', table_name='ingest_items')
+    op.drop_table('ingest_items')
+    op.drop_table('ingest_jobs')
@@ -0,0 +1,37 @@
+# alembic/versions/008_document_pages.py
+"""Per-page document text
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'document_pages',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('page_number', sa.Integer(), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('char_start', sa.Integer(), nullable=False),
+        sa.Column('char_end', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_document_pages_document_page', 'document_pages', ['document_id', 'page_number'], unique=True)
+
+    # Existing documents get their pages on first access (DocumentService.get_document_pages)
+
+def downgrade() -> None:
+    op.drop_index('ix_document_pages_document_page', table_name='document_pages')
+    op.drop_table('document_pages')
@@ -0,0 +1,146 @@
+# alembic/versions/009_compressed_text_store.py
+"""Move extracted and OCR text into a compressed, hash-addressed text store
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+from services.document_pages import split_pages
+from services.text_store import decode_text, encode_text, text_hash
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+# Rows are moved in small batches, each may hold megabytes of text
+BATCH_SIZE = 100
+
+# (table, key column, old text column, new hash column)
+TEXT_COLUMNS = [
+    ('documents', 'id', 'extracted_text', 'text_hash'),
+    ('ocr_results', 'id', 'extracted_text', 'text_hash'),
+    ('file_blobs', 'sha256', 'extracted_text', 'text_hash'),
+    ('file_blobs', 'sha256', 'ocr_text', 'ocr_text_hash'),
+]
+
+def _store_text(conn, text: str) -> str:
+    digest = text_hash(text)
+    exists = conn.execute(sa.text("SELECT 1 FROM text_contents WHERE hash = :hash"), {"hash": digest}).first()
+    if not exists:
+        codec, data = encode_text(text)
+        conn.execute(
+            sa.text(
+                "INSERT INTO text_contents (hash, codec, data, length, created_at) "
+                "VALUES (:hash, :codec, :data, :length, CURRENT_TIMESTAMP)"
+            ),
+            {"hash": digest, "codec": codec, "data": data, "length": len(text)}
+        )
+    return digest
+
+def _add_pages(conn, document_id, text: str):
+    has_pages = conn.execute(
+        sa.text("SELECT 1 FROM document_pages WHERE document_id = :id LIMIT 1"), {"id": document_id}
+    ).first()
+    if has_pages:
+        return
+    for number, start, end in split_pages(text):
+        conn.execute(
+            sa.text(
+                "INSERT INTO document_pages (id, document_id, page_number, text, char_start, char_end) "
+                "VALUES (:id, :document_id, :page_number, :text, :char_start, :char_end)"
+            ),
+            {
+                "id": str(uuid.uuid4()), "document_id": document_id, "page_number": number,
+                "text": text[start:end], "char_start": start, "char_end": end
+            }
+        )
+
+def _move_texts(conn, table: str, key: str, text_column: str, hash_column: str):
+    # Keyset pagination: rows are updated while the table is walked
+    last = None
+    while True:
+        query = f"SELECT {key}, {text_column} FROM {table} WHERE {text_column} IS NOT NULL AND {text_column} <> ''"
+        params = {"limit": BATCH_SIZE}
+        if last is not None:
+            query += f" AND {key} > :last"
+            params["last"] = last
+        rows = conn.execute(sa.text(query + f" ORDER BY {key} LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+
+        for row_key, text in rows:
+            digest = _store_text(conn, text)
+            conn.execute(
+                sa.text(f"UPDATE {table} SET {hash_column} = :hash WHERE {key} = :key"),
+                {"hash": digest, "key": row_key}
+            )
+            if table == 'documents':
+                # Search now runs over document_pages, every document with text needs its pages
+                _add_pages(conn, row_key, text)
+        last = rows[-1][0]
+
+def upgrade() -> None:
+    op.create_table(
+        'text_contents',
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.Column('codec', sa.String(length=10), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('length', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('documents', sa.Column('text_hash', sa.String(length=64), nullable=True))
+    op.add_column('ocr_results', sa.Column('text_hash', sa.String(length=64), nullable=True))
+    op.add_column('file_blobs', sa.Column('text_hash', sa.String(length=64), nullable=True))
+    op.add_column('file_blobs', sa.Column('ocr_text_hash', sa.String(length=64), nullable=True))
+
+    conn = op.get_bind()
+    for table, key, text_column, hash_column in TEXT_COLUMNS:
+        _move_texts(conn, table, key, text_column, hash_column)
+
+    op.create_index('ix_documents_text_hash', 'documents', ['text_hash'])
+    for table, _, _, hash_column in TEXT_COLUMNS:
+        op.create_foreign_key(
+            f'fk_{table}_{hash_column}', table, 'text_contents', [hash_column], ['hash']
+        )
+
+    op.drop_column('documents', 'extracted_text')
+    op.drop_column('ocr_results', 'extracted_text')
+    op.drop_column('file_blobs', 'extracted_text')
+    op.drop_column('file_blobs', 'ocr_text')
+
+def downgrade() -> None:
+    op.add_column('documents', sa.Column('extracted_text', sa.Text(), nullable=True))
+    op.add_column('ocr_results', sa.Column('extracted_text', sa.Text(), nullable=True))
+    op.add_column('file_blobs', sa.Column('extracted_text', sa.Text(), nullable=True))
+    op.add_column('file_blobs', sa.Column('ocr_text', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    for table, key, text_column, hash_column in TEXT_COLUMNS:
+        rows = conn.execute(sa.text(
+            f"SELECT t.{key}, c.codec, c.data FROM {table} t JOIN text_contents c ON c.hash = t.{hash_column}"
+        )).fetchall()
+        for row_key, codec, data in rows:
+            conn.execute(
+                sa.text(f"UPDATE {table} SET {text_column} = :text WHERE {key} = :key"),
+                {"text": decode_text(codec, data), "key": row_key}
+            )
+    conn.execute(sa.text("UPDATE ocr_results SET extracted_text = '' WHERE extracted_text IS NULL"))
+    op.alter_column('ocr_results', 'extracted_text', nullable=False)
+
+    for table, _, _, hash_column in TEXT_COLUMNS:
+        op.drop_constraint(f'fk_{table}_{hash_column}', table, type_='foreignkey')
+    op.drop_index('ix_documents_text_hash', table_name='documents')
+    op.drop_column('file_blobs', 'ocr_text_hash')
+    op.drop_column('file_blobs', 'text_hash')
+    op.drop_column('ocr_results', 'text_hash')
+    op.drop_column('documents', 'text_hash')
+    op.drop_table('text_contents')
@@ -0,0 +1,29 @@
+# alembic/versions/010_document_processing_pipeline.py
+"""Track the post-upload processing pipeline on documents
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('processing_status', sa.String(length=20), nullable=True))
+    op.add_column('documents', sa.Column('processing_stages', sa.JSON(), nullable=True))
+
+    # Documents indexed before the pipeline existed are done; the rest is picked up by update_search_index
+    op.execute("UPDATE documents SET processing_status = CASE WHEN is_processed THEN 'completed' ELSE 'pending' END")
+    op.create_index('ix_documents_processing_status', 'documents', ['processing_status'])
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_processing_status', table_name='documents')
+    op.drop_column('documents', 'processing_stages')
+    op.drop_column('documents', 'processing_status')
@@ -0,0 +1,149 @@
+# alembic/versions/011_folder_hierarchy.py
+"""Folder hierarchy with materialized paths and per-folder aggregates
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+import json
+import uuid
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from services.folder_service import ROOT, MAX_DEPTH, ancestor_paths, parent_path
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+def _path_type(conn):
+    # Byte-wise comparison, subtree queries are range scans (see models.FolderPath)
+    if conn.dialect.name == 'postgresql':
+        return sa.String(length=500, collation='C')
+    return sa.String(length=500)
+
+def _normalize(folder) -> str:
+    # Free-form values written before folders existed; never fail the migration on them
+    parts = [part.strip() for part in (folder or "").replace("\\", "/").split("/")]
+    parts = [part for part in parts if part and part not in (".", "..")]
+    if parts and parts[0] == ROOT:
+        parts = parts[1:]
+    return "/".join(parts[:MAX_DEPTH])[:500].strip("/") or ROOT
+
+def _size_bytes(metadata) -> int:
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    try:
+        return int((metadata or {}).get("file_size_bytes") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    path_type = _path_type(conn)
+
+    op.create_table(
+        'folders',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('parent_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('path', path_type, nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('document_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('total_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('subtree_document_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('subtree_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['parent_id'], ['folders.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_folders_user_path', 'folders', ['user_id', 'path'], unique=True)
+    op.create_index('ix_folders_parent', 'folders', ['parent_id'])
+
+    if conn.dialect.name == 'postgresql':
+        op.alter_column('documents', 'folder', type_=path_type, existing_type=sa.String(length=500))
+
+    # Normalize existing folder values and total them per (user, folder) in one pass
+    totals = {}
+    last = None
+    while True:
+        query = "SELECT id, user_id, folder, doc_metadata FROM documents"
+        params = {"limit": BATCH_SIZE}
+        if last is not None:
+            query += " WHERE id > :last"
+            params["last"] = last
+        rows = conn.execute(sa.text(query + " ORDER BY id LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+
+        for document_id, user_id, folder, metadata in rows:
+            path = _normalize(folder)
+            if path != folder:
+                conn.execute(
+                    sa.text("UPDATE documents SET folder = :folder WHERE id = :id"),
+                    {"folder": path, "id": document_id}
+                )
+            # Drivers return the id as a string or a UUID depending on the column type
+            user_id = uuid.UUID(str(user_id))
+            count, size_bytes = totals.get((user_id, path), (0, 0))
+            totals[(user_id, path)] = (count + 1, size_bytes + _size_bytes(metadata))
+        last = rows[-1][0]
+
+    # Every ancestor gets a row; subtree totals add up the folders below it
+    folders = {}
+    for (user_id, path), (count, size_bytes) in totals.items():
+        for ancestor in ancestor_paths(path):
+            folder = folders.setdefault((user_id, ancestor), {
+                "id": uuid.uuid4(), "direct": [0, 0], "subtree": [0, 0]
+            })
+            folder["subtree"][0] += count
+            folder["subtree"][1] += size_bytes
+        folders[(user_id, path)]["direct"] = [count, size_bytes]
+
+    folders_table = sa.table(
+        'folders',
+        sa.column('id', postgresql.UUID(as_uuid=True)), sa.column('user_id', postgresql.UUID(as_uuid=True)), sa.column('parent_id', postgresql.UUID(as_uuid=True)),
+        sa.column('name', sa.String()), sa.column('path', sa.String()), sa.column('depth', sa.Integer()),
+        sa.column('document_count', sa.BigInteger()), sa.column('total_bytes', sa.BigInteger()),
+        sa.column('subtree_document_count', sa.BigInteger()), sa.column('subtree_bytes', sa.BigInteger()),
+        sa.column('created_at', sa.DateTime())
+    )
+    # Parents first, for the parent_id foreign key
+    now = datetime.utcnow()
+    ordered = sorted(folders.items(), key=lambda item: len(ancestor_paths(item[0][1])))
+    for start in range(0, len(ordered), BATCH_SIZE):
+        op.bulk_insert(folders_table, [
+            {
+                "id": folder["id"],
+                "user_id": user_id,
+                "parent_id": folders[(user_id, parent_path(path))]["id"] if path != ROOT else None,
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "depth": len(ancestor_paths(path)) - 1,
+                "document_count": folder["direct"][0],
+                "total_bytes": folder["direct"][1],
+                "subtree_document_count": folder["subtree"][0],
+                "subtree_bytes": folder["subtree"][1],
+                "created_at": now
+            } for (user_id, path), folder in ordered[start:start + BATCH_SIZE]
+        ])
+
+    op.create_index('ix_documents_user_folder', 'documents', ['user_id', 'folder'])
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_user_folder', table_name='documents')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('documents', 'folder', type_=sa.String(length=500), existing_type=sa.String(length=500, collation='C'))
+    op.drop_index('ix_folders_parent', table_name='folders')
+    op.drop_index('ix_folders_user_path', table_name='folders')
+    op.drop_table('folders')
@@ -0,0 +1,87 @@
+# alembic/versions/012_document_size_bytes.py
+"""Integer document sizes, per-user storage quota
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+import json
+import os
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+from services.folder_service import ancestor_paths
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+def _metadata_size(metadata, file_path) -> int:
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    try:
+        size = int((metadata or {}).get("file_size_bytes") or 0)
+    except (TypeError, ValueError):
+        size = 0
+    if not size and file_path and os.path.exists(file_path):
+        size = os.path.getsize(file_path)
+    return size
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('storage_quota_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+
+    conn = op.get_bind()
+    # Documents in the blob store: the blob row has the exact size
+    conn.execute(sa.text(
+        "UPDATE documents SET size_bytes = "
+        "(SELECT size FROM file_blobs WHERE file_blobs.sha256 = documents.content_hash) "
+        "WHERE content_hash IS NOT NULL"
+    ))
+
+    # Older uploads: the size recorded in the metadata, or the file itself
+    while True:
+        rows = conn.execute(
+            sa.text("SELECT id, doc_metadata, file_path FROM documents WHERE size_bytes IS NULL LIMIT :limit"),
+            {"limit": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        for document_id, metadata, file_path in rows:
+            conn.execute(
+                sa.text("UPDATE documents SET size_bytes = :size WHERE id = :id"),
+                {"size": _metadata_size(metadata, file_path), "id": document_id}
+            )
+
+    op.alter_column('documents', 'size_bytes', nullable=False, server_default='0')
+
+    # Folder byte totals were backfilled from the metadata, recompute them from the new column
+    direct = {}
+    subtree = {}
+    rows = conn.execute(sa.text(
+        "SELECT user_id, folder, SUM(size_bytes) FROM documents GROUP BY user_id, folder"
+    )).fetchall()
+    for user_id, folder, size_bytes in rows:
+        user_id = uuid.UUID(str(user_id))
+        direct[(user_id, folder)] = size_bytes or 0
+        for path in ancestor_paths(folder):
+            subtree[(user_id, path)] = subtree.get((user_id, path), 0) + (size_bytes or 0)
+
+    folders = conn.execute(sa.text("SELECT id, user_id, path FROM folders")).fetchall()
+    for folder_id, user_id, path in folders:
+        key = (uuid.UUID(str(user_id)), path)
+        conn.execute(
+            sa.text("UPDATE folders SET total_bytes = :direct, subtree_bytes = :subtree WHERE id = :id"),
+            {"direct": direct.get(key, 0), "subtree": subtree.get(key, 0), "id": folder_id}
+        )
+
+def downgrade() -> None:
+    op.drop_column('documents', 'size_bytes')
+    op.drop_column('users', 'storage_quota_bytes')
@@ -0,0 +1,104 @@
+# alembic/versions/013_page_offsets_text_search.py
+"""Document pages keep only offsets into the text store, full-text search vector on text_contents
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from services.text_store import decode_text, search_vector
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+# Each row is decompressed in Python, texts may be megabytes
+BATCH_SIZE = 100
+
+text_contents = sa.table('text_contents', sa.column('hash'), sa.column('search_vector'))
+
+def _fill_search_vectors(conn):
+    last = None
+    while True:
+        query = "SELECT hash, codec, data FROM text_contents"
+        params = {"limit": BATCH_SIZE}
+        if last is not None:
+            query += " WHERE hash > :last"
+            params["last"] = last
+        rows = conn.execute(sa.text(query + " ORDER BY hash LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+
+        for digest, codec, data in rows:
+            try:
+                with conn.begin_nested():
+                    conn.execute(
+                        text_contents.update()
+                        .where(text_contents.c.hash == digest)
+                        .values(search_vector=search_vector(decode_text(codec, data)))
+                    )
+            except (sa.exc.DataError, sa.exc.OperationalError):
+                # Over the 1MB tsvector limit, the documents stay searchable by name
+                pass
+        last = rows[-1][0]
+
+def _fill_page_texts(conn):
+    last = None
+    while True:
+        query = (
+            "SELECT d.id, c.codec, c.data FROM documents d JOIN text_contents c ON c.hash = d.text_hash"
+        )
+        params = {"limit": BATCH_SIZE}
+        if last is not None:
+            query += " WHERE d.id > :last"
+            params["last"] = last
+        rows = conn.execute(sa.text(query + " ORDER BY d.id LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+
+        for document_id, codec, data in rows:
+            text = decode_text(codec, data)
+            pages = conn.execute(
+                sa.text("SELECT id, char_start, char_end FROM document_pages WHERE document_id = :id"),
+                {"id": document_id}
+            ).fetchall()
+            for page_id, start, end in pages:
+                conn.execute(
+                    sa.text("UPDATE document_pages SET text = :text WHERE id = :id"),
+                    {"text": text[start:end], "id": page_id}
+                )
+        last = rows[-1][0]
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    is_postgres = conn.dialect.name == 'postgresql'
+
+    # Page text was a second, uncompressed copy of the text already in text_contents
+    op.drop_column('document_pages', 'text')
+
+    op.add_column(
+        'text_contents',
+        sa.Column('search_vector', postgresql.TSVECTOR() if is_postgres else sa.Text(), nullable=True)
+    )
+    if is_postgres:
+        _fill_search_vectors(conn)
+        op.create_index(
+            'ix_text_contents_search_vector', 'text_contents', ['search_vector'], postgresql_using='gin'
+        )
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        op.drop_index('ix_text_contents_search_vector', table_name='text_contents')
+    op.drop_column('text_contents', 'search_vector')
+
+    op.add_column('document_pages', sa.Column('text', sa.Text(), nullable=True))
+    _fill_page_texts(conn)
+    conn.execute(sa.text("UPDATE document_pages SET text = '' WHERE text IS NULL"))
+    op.alter_column('document_pages', 'text', nullable=False)
@@ -0,0 +1,22 @@
+# alembic/versions/014_upload_session_folder.py
+"""Target folder of resumable uploads
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('upload_sessions', sa.Column('folder', sa.String(length=500), nullable=True, server_default='root'))
+
+def downgrade() -> None:
+    op.drop_column('upload_sessions', 'folder')
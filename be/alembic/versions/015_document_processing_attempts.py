@@ -0,0 +1,25 @@
+# alembic/versions/015_document_processing_attempts.py
+"""Pipeline re-queue count per document
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-20 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column(
+        'documents',
+        sa.Column('processing_attempts', sa.Integer(), nullable=False, server_default='0')
+    )
+
+def downgrade() -> None:
+    op.drop_column('documents', 'processing_attempts')
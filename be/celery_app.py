@@ -6,6 +6,8 @@ from decouple import config
 
 # Get configuration
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379')
+# Resident memory after which a worker child is replaced once its task finishes
+WORKER_MAX_MEMORY_MB = config('CELERY_WORKER_MAX_MEMORY_MB', default=2048, cast=int)
 
 # Create Celery instance
 celery_app = Celery(
@@ -16,7 +18,9 @@ celery_app = Celery(
         "tasks.document_tasks",
         "tasks.ocr_tasks", 
         "tasks.report_tasks",
-        "tasks.maintenance_tasks"
+        "tasks.maintenance_tasks",
+        "tasks.ingest_tasks",
+        "tasks.preview_tasks"
     ]
 )
 
@@ -32,6 +36,7 @@ celery_app.conf.update(
     task_soft_time_limit=25 * 60,  # 25 minutes
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    worker_max_memory_per_child=WORKER_MAX_MEMORY_MB * 1024,  # KiB
     broker_connection_retry_on_startup=True,
 )
 
@@ -47,7 +52,12 @@ celery_app.conf.beat_schedule = {
         'task': 'tasks.maintenance_tasks.backup_database',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
     },
-    # Update search index every 6 hours
+    # Compact the built-in vector index when tombstones pile up
+    'compact-vector-index': {
+        'task': 'tasks.maintenance_tasks.compact_vector_index',
+        'schedule': crontab(minute=30),  # Every hour
+    },
+    # Re-queue unfinished document processing every 6 hours
     'update-search-index': {
         'task': 'tasks.maintenance_tasks.update_search_index',
         'schedule': crontab(minute=0, hour='*/6'),  # Every 6 hours
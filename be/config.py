@@ -13,6 +13,27 @@ class Settings:
     UPLOAD_DIR: str = config('UPLOAD_DIR', default='uploads')
     MAX_FILE_SIZE: int = config('MAX_FILE_SIZE', default=100 * 1024 * 1024, cast=int)  # 100MB
     ALLOWED_EXTENSIONS: List[str] = ['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png']
+    UPLOAD_SESSION_TTL_HOURS: int = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)  # Resumable uploads expire after this
+    UPLOAD_PART_SIZE: int = config('UPLOAD_PART_SIZE', default=8 * 1024 * 1024, cast=int)  # Suggested byte range per PUT
+    BULK_MAX_UPLOAD_SIZE: int = config('BULK_MAX_UPLOAD_SIZE', default=10 * 1024 * 1024 * 1024, cast=int)  # 10GB per bulk request
+    BULK_MAX_FILES: int = config('BULK_MAX_FILES', default=10000, cast=int)  # Files (or archive entries) per bulk job
+    INGEST_BATCH_SIZE: int = config('INGEST_BATCH_SIZE', default=200, cast=int)  # Documents inserted per commit
+    STORAGE_QUOTA_BYTES: int = config('STORAGE_QUOTA_BYTES', default=0, cast=int)  # Per user, 0 = unlimited; users.storage_quota_bytes overrides it
+    
+    # Text extraction (PDF/DOCX parsing runs in worker processes)
+    EXTRACTION_WORKERS: int = config('EXTRACTION_WORKERS', default=2, cast=int)
+    EXTRACTION_TIMEOUT: int = config('EXTRACTION_TIMEOUT', default=120, cast=int)  # Seconds per file
+    EXTRACTION_MEMORY_LIMIT_MB: int = config('EXTRACTION_MEMORY_LIMIT_MB', default=1024, cast=int)  # Address space per worker, 0 = unlimited
+    
+    # Downloads: with a prefix set (e.g. /protected-files/) nginx sends files via X-Accel-Redirect
+    DOWNLOAD_ACCEL_PREFIX: str = config('DOWNLOAD_ACCEL_PREFIX', default='')
+    
+    # Page previews (WebP thumbnails rendered by Celery, LRU cache on disk)
+    PREVIEW_CACHE_MAX_BYTES: int = config('PREVIEW_CACHE_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)  # 1GB
+    PREVIEW_WAIT_SECONDS: float = config('PREVIEW_WAIT_SECONDS', default=10, cast=float)  # How long a request waits for a render
+    
+    # Post-upload processing: PDFs with fewer extracted characters per page are OCRed
+    OCR_MIN_CHARS_PER_PAGE: int = config('OCR_MIN_CHARS_PER_PAGE', default=25, cast=int)
     
     # AI Configuration
     OPENAI_API_KEY: str = config('OPENAI_API_KEY', default='')
@@ -26,10 +47,64 @@ class Settings:
     # Vector Database
     VECTOR_DB_TYPE: str = config('VECTOR_DB_TYPE', default='chromadb')
     CHROMA_DB_PATH: str = config('CHROMA_DB_PATH', default='./chroma_db')
+    # Built-in index (VECTOR_DB_TYPE=native), stored next to CHROMA_DB_PATH when empty
+    VECTOR_INDEX_PATH: str = config('VECTOR_INDEX_PATH', default='')
+    VECTOR_INDEX_HNSW_THRESHOLD: int = config('VECTOR_INDEX_HNSW_THRESHOLD', default=50000, cast=int)
+    # Embedding storage format: float32, float16 or int8 (scalar-quantized, per-vector scale)
+    VECTOR_STORAGE_DTYPE: str = config('VECTOR_STORAGE_DTYPE', default='float16')
+    # Re-score the approximate top candidates against exact float32 vectors kept on disk
+    VECTOR_RESCORE: bool = config('VECTOR_RESCORE', default=True, cast=bool)
+    # Rebuild the built-in index once this fraction of its rows are tombstones
+    VECTOR_COMPACT_TOMBSTONE_RATIO: float = config('VECTOR_COMPACT_TOMBSTONE_RATIO', default=0.2, cast=float)
+    
+    # Document chunking for the vector index
+    CHUNK_SIZE: int = config('CHUNK_SIZE', default=1000, cast=int)
+    CHUNK_OVERLAP: int = config('CHUNK_OVERLAP', default=200, cast=int)
+    INDEX_BATCH_SIZE: int = config('INDEX_BATCH_SIZE', default=64, cast=int)  # Chunks embedded per call
+    
+    # QA reranking: bm25 (no model), cross-encoder (sentence-transformers, CPU) or none
+    RERANKER_TYPE: str = config('RERANKER_TYPE', default='bm25')
+    RERANKER_MODEL: str = config('RERANKER_MODEL', default='cross-encoder/ms-marco-MiniLM-L-6-v2')
+    RERANK_CANDIDATES: int = config('RERANK_CANDIDATES', default=50, cast=int)  # Pool scored by the reranker
+    RERANK_TOP_K: int = config('RERANK_TOP_K', default=3, cast=int)  # Passages sent to the LLM
+    RERANK_BATCH_SIZE: int = config('RERANK_BATCH_SIZE', default=16, cast=int)
+    RERANK_TIMEOUT_MS: int = config('RERANK_TIMEOUT_MS', default=300, cast=int)
+    
+    # Model backends: auto picks OpenAI when OPENAI_API_KEY is set, else local models.
+    # fake / hash are offline deterministic backends for load testing.
+    LLM_BACKEND: str = config('LLM_BACKEND', default='auto')  # auto, openai, ollama, fake
+    EMBEDDING_BACKEND: str = config('EMBEDDING_BACKEND', default='auto')  # auto, openai, huggingface, hash
+    FAKE_LLM_LATENCY_MS: int = config('FAKE_LLM_LATENCY_MS', default=300, cast=int)  # Time to first token
+    FAKE_LLM_TOKENS_PER_SECOND: float = config('FAKE_LLM_TOKENS_PER_SECOND', default=50.0, cast=float)
+    FAKE_EMBEDDING_DIM: int = config('FAKE_EMBEDDING_DIM', default=384, cast=int)
+    
+    # LLM / embedding HTTP clients (shared keep-alive pool, retries with jitter)
+    LLM_TIMEOUT: float = config('LLM_TIMEOUT', default=60.0, cast=float)
+    LLM_CONNECT_TIMEOUT: float = config('LLM_CONNECT_TIMEOUT', default=5.0, cast=float)
+    LLM_MAX_CONNECTIONS: int = config('LLM_MAX_CONNECTIONS', default=20, cast=int)
+    LLM_MAX_RETRIES: int = config('LLM_MAX_RETRIES', default=3, cast=int)
+    LLM_RETRY_BASE_DELAY: float = config('LLM_RETRY_BASE_DELAY', default=0.5, cast=float)
+    LLM_RETRY_MAX_DELAY: float = config('LLM_RETRY_MAX_DELAY', default=8.0, cast=float)
+    
+    # QA scheduler: concurrent LLM requests and per-user fair queueing
+    QA_MAX_CONCURRENCY: int = config('QA_MAX_CONCURRENCY', default=4, cast=int)
+    QA_MAX_QUEUE_PER_USER: int = config('QA_MAX_QUEUE_PER_USER', default=2, cast=int)
+    QA_MAX_QUEUE_TOTAL: int = config('QA_MAX_QUEUE_TOTAL', default=50, cast=int)
+    QA_QUEUE_TIMEOUT: float = config('QA_QUEUE_TIMEOUT', default=30.0, cast=float)  # Seconds, then 429
+    
+    # Prompt budget shared by conversation memory and document context
+    QA_CONTEXT_TOKEN_BUDGET: int = config('QA_CONTEXT_TOKEN_BUDGET', default=3000, cast=int)
+    CHAT_HISTORY_TOKEN_SHARE: float = config('CHAT_HISTORY_TOKEN_SHARE', default=0.3, cast=float)
+    CHAT_HISTORY_TURNS: int = config('CHAT_HISTORY_TURNS', default=3, cast=int)  # Turns kept verbatim
+    CHAT_SUMMARY_MAX_TOKENS: int = config('CHAT_SUMMARY_MAX_TOKENS', default=300, cast=int)
     
     # Redis (for caching and task queue)
     REDIS_URL: str = config('REDIS_URL', default='redis://localhost:6379')
     
+    # Startup: "background" warms up OCR/QA after the server starts accepting requests,
+    # "lazy" loads them on first use, "eager" blocks startup until they are loaded
+    STARTUP_MODE: str = config('STARTUP_MODE', default='background')
+    
     # Environment
     DEBUG: bool = config('DEBUG', default=False, cast=bool)
     ENVIRONMENT: str = config('ENVIRONMENT', default='development')
@@ -37,4 +112,10 @@ class Settings:
     # CORS
     CORS_ORIGINS: List[str] = config('CORS_ORIGINS', default='http://localhost:3000,http://localhost:3001', cast=lambda x: x.split(','))
 
+    def __init__(self):
+        if not 0 <= self.CHUNK_OVERLAP < self.CHUNK_SIZE:
+            raise ValueError(
+                f"CHUNK_OVERLAP ({self.CHUNK_OVERLAP}) must be smaller than CHUNK_SIZE ({self.CHUNK_SIZE})"
+            )
+
 settings = Settings()
\ No newline at end of file
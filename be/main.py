@@ -1,27 +1,34 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 import os
+import asyncio
 from datetime import datetime
 from typing import List, Optional
 
-from database import get_db, engine, Base
+from database import get_db, engine, Base, settings
 from models import User, Document, OCRResult, ChatSession, Report
 from schemas import *
 # Fix the import paths
 from database import create_access_token, verify_token, hash_password, verify_password
 from services.document_service import DocumentService
+from services.resumable_upload import ResumableUploadService
+from services.bulk_ingest import BulkIngestService
+from services.folder_service import FolderService
 from services.ocr_service import OCRService
 from services.search_service import SearchService
 from services.qa_service import QAService
 from services.search_service import ReportService
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+from services.warmup import WarmupService
+from services.qa_scheduler import QAScheduler, QueueFullError
+from services.metrics import metrics
+from services.llm_clients import close_http_clients
+from services.extraction import shutdown_extraction_executor
 
 app = FastAPI(
     title="SmartDoc API",
@@ -47,12 +54,43 @@ os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Services
-document_service = DocumentService()
-ocr_service = OCRService()
-search_service = SearchService()
+qa_scheduler = QAScheduler(
+    max_concurrency=settings.QA_MAX_CONCURRENCY,
+    max_queue_per_user=settings.QA_MAX_QUEUE_PER_USER,
+    max_queue_total=settings.QA_MAX_QUEUE_TOTAL,
+    queue_timeout=settings.QA_QUEUE_TIMEOUT
+)
 qa_service = QAService()
+document_service = DocumentService(qa_service=qa_service)
+resumable_upload_service = ResumableUploadService(document_service)
+bulk_ingest_service = BulkIngestService(document_service)
+folder_service = FolderService()
+ocr_service = OCRService(qa_service=qa_service)
+search_service = SearchService()
 report_service = ReportService()
 
+# Heavy subsystems (torch/easyocr, langchain/chromadb) and table creation run after
+# the server is up, see STARTUP_MODE in settings
+warmup_service = WarmupService()
+warmup_service.register("database", lambda: Base.metadata.create_all(bind=engine))
+warmup_service.register("qa", qa_service.warm_up)
+warmup_service.register("ocr", ocr_service.warm_up)
+
+@app.on_event("startup")
+async def start_warmup():
+    if settings.STARTUP_MODE == "eager":
+        await warmup_service.run()
+    elif settings.STARTUP_MODE == "lazy":
+        warmup_service.mark_lazy(["qa", "ocr"])
+        asyncio.create_task(warmup_service.run(["database"]))
+    else:
+        asyncio.create_task(warmup_service.run())
+
+@app.on_event("shutdown")
+async def close_clients():
+    await close_http_clients()
+    shutdown_extraction_executor()
+
 # Auth dependency
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -78,6 +116,17 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
+# Readiness probe - 503 until the warm-up of required subsystems has finished
+@app.get("/ready")
+async def readiness_check():
+    status = warmup_service.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# Prometheus metrics of this worker process
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ======================= AUTH ENDPOINTS =======================
 
 @app.post("/api/auth/login")
@@ -161,14 +210,119 @@ async def get_documents(
         db, current_user.id, page, limit, search, type_filter
     )
 
-@app.post("/api/documents/upload")
+# The multipart body is parsed as a stream by DocumentService, so the form is
+# described here for the OpenAPI docs instead of through an UploadFile parameter
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+@app.post("/api/documents/upload", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_document(
-    file: UploadFile = File(...),
+    request: Request,
+    folder: str = "root",
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Upload tài liệu mới"""
-    return await document_service.upload_document(db, file, current_user.id)
+    return await document_service.upload_document(db, request, current_user.id, folder)
+
+BULK_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"]
+                }
+            }
+        }
+    }
+}
+
+@app.post("/api/documents/bulk", openapi_extra=BULK_REQUEST_BODY)
+async def bulk_ingest(
+    request: Request,
+    folder: str = "root",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Nhập hàng loạt tài liệu (nhiều file hoặc file ZIP), trả về job id"""
+    return await bulk_ingest_service.start_job(db, request, current_user.id, folder)
+
+@app.get("/api/documents/bulk/{job_id}")
+async def get_bulk_ingest_job(
+    job_id: str,
+    status: Optional[str] = None,
+    page: int = 1,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tiến độ job nhập hàng loạt, kèm trạng thái từng file"""
+    return await bulk_ingest_service.get_job(db, job_id, current_user.id, status, page, min(limit, 1000))
+
+# Resumable uploads: create a session, PUT byte ranges (Content-Range) in any order,
+# check the status to resume after a dropped connection, then complete
+@app.post("/api/documents/uploads")
+async def create_upload_session(
+    data: UploadSessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tạo phiên upload nhiều phần"""
+    return await resumable_upload_service.create_session(db, data, current_user.id)
+
+@app.get("/api/documents/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Trạng thái phiên upload (các khoảng byte đã nhận)"""
+    return await resumable_upload_service.get_status(db, upload_id, current_user.id)
+
+@app.put("/api/documents/uploads/{upload_id}", openapi_extra={
+    "requestBody": {"required": True, "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}
+})
+async def upload_range(
+    upload_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Gửi một khoảng byte của file (header Content-Range: bytes start-end/total)"""
+    return await resumable_upload_service.upload_range(db, upload_id, request, current_user.id)
+
+@app.post("/api/documents/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Hoàn tất upload: kiểm tra checksum và tạo tài liệu"""
+    return await resumable_upload_service.complete(db, upload_id, current_user.id)
+
+@app.delete("/api/documents/uploads/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Huỷ phiên upload"""
+    return await resumable_upload_service.abort(db, upload_id, current_user.id)
 
 @app.delete("/api/documents/{document_id}")
 async def delete_document(
@@ -179,6 +333,59 @@ async def delete_document(
     """Xóa tài liệu"""
     return await document_service.delete_document(db, document_id, current_user.id)
 
+@app.get("/api/documents/{document_id}/download")
+async def download_document(
+    document_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tải file gốc của tài liệu (hỗ trợ Range cho trình xem PDF)"""
+    return await document_service.download_document(db, request, document_id, current_user.id)
+
+@app.get("/api/documents/{document_id}/preview")
+async def get_document_preview(
+    document_id: str,
+    request: Request,
+    page: int = 1,
+    size: str = "small",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Ảnh xem trước WebP của một trang (size: small, medium)"""
+    return await document_service.get_document_preview(db, request, document_id, current_user.id, max(page, 1), size)
+
+@app.get("/api/documents/{document_id}/text")
+async def get_document_text(
+    document_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Toàn bộ nội dung text của tài liệu (stream)"""
+    chunks = await document_service.get_document_text_stream(db, document_id, current_user.id)
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+
+@app.get("/api/documents/{document_id}/pages")
+async def get_document_pages(
+    document_id: str,
+    start: int = Query(1, ge=1),
+    end: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Nội dung theo trang của tài liệu (các trang start..end)"""
+    return await document_service.get_document_pages(db, document_id, current_user.id, max(start, 1), end)
+
+@app.put("/api/documents/{document_id}/folder")
+async def move_document(
+    document_id: str,
+    data: DocumentMove,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Chuyển tài liệu sang thư mục khác"""
+    return await document_service.move_document(db, document_id, data.folder, current_user.id)
+
 @app.post("/api/documents/{document_id}/share")
 async def share_document(
     document_id: str,
@@ -189,6 +396,55 @@ async def share_document(
     """Chia sẻ tài liệu"""
     return await document_service.share_document(db, document_id, share_data, current_user.id)
 
+# ======================= FOLDER ENDPOINTS =======================
+
+@app.get("/api/folders")
+async def get_folder(
+    path: str = "root",
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Nội dung thư mục (thư mục con, tài liệu, tổng số và dung lượng cả cây con)"""
+    return await folder_service.get_folder(db, current_user.id, path, page, limit)
+
+@app.post("/api/folders")
+async def create_folder(
+    data: FolderCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tạo thư mục"""
+    return await folder_service.create_folder(db, current_user.id, data.name, data.parent)
+
+@app.put("/api/folders/{folder_id}")
+async def update_folder(
+    folder_id: str,
+    data: FolderUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Đổi tên hoặc chuyển thư mục"""
+    return await folder_service.update_folder(db, current_user.id, folder_id, data.name, data.parent)
+
+@app.delete("/api/folders/{folder_id}")
+async def delete_folder(
+    folder_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Xóa thư mục rỗng"""
+    return await folder_service.delete_folder(db, current_user.id, folder_id)
+
+@app.get("/api/storage/usage")
+async def get_storage_usage(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Dung lượng lưu trữ đang dùng, hạn mức và dung lượng theo thư mục"""
+    return await folder_service.get_usage(db, current_user.id)
+
 # ======================= OCR ENDPOINTS =======================
 
 @app.post("/api/ocr/process")
@@ -256,15 +512,24 @@ async def ask_question(
     db: Session = Depends(get_db)
 ):
     """Đặt câu hỏi"""
-    return await qa_service.ask_question(db, qa_request, current_user.id)
+    try:
+        async with qa_scheduler.slot(current_user.id):
+            return await qa_service.ask_question(db, qa_request, current_user.id)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Hệ thống đang bận, vui lòng thử lại sau",
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
 @app.get("/api/qa/history")
 async def get_qa_history(
+    limit: int = 10,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Lấy lịch sử hỏi đáp"""
-    return await qa_service.get_history(db, current_user.id)
+    return await qa_service.get_history(db, current_user.id, min(max(limit, 1), 50))
 
 @app.post("/api/qa/sessions")
 async def create_chat_session(
@@ -278,11 +543,24 @@ async def create_chat_session(
 @app.get("/api/qa/sessions/{session_id}")
 async def get_chat_session(
     session_id: str,
+    before: Optional[str] = None,
+    limit: int = 50,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy chi tiết phiên chat"""
-    return await qa_service.get_session(db, session_id, current_user.id)
+    """Lấy chi tiết phiên chat (phân trang tin nhắn bằng cursor `before`)"""
+    return await qa_service.get_session(db, session_id, current_user.id, before, min(max(limit, 1), 200))
+
+@app.get("/api/admin/qa/latency")
+async def get_qa_latency(
+    hours: int = 24,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Phân vị thời gian từng giai đoạn hỏi đáp (chỉ admin)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Chỉ admin mới có quyền xem thống kê")
+    return await qa_service.get_latency_stats(db, min(max(hours, 1), 24 * 30))
 
 # ======================= REPORT ENDPOINTS =======================
 
@@ -315,11 +593,12 @@ async def get_report(
 @app.get("/api/reports/{report_id}/download")
 async def download_report(
     report_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Tải báo cáo"""
-    return await report_service.download_report(db, report_id, current_user.id)
+    return await report_service.download_report(db, request, report_id, current_user.id)
 
 # ======================= SETTINGS ENDPOINTS =======================
 
@@ -365,8 +644,9 @@ async def get_dashboard_stats(
     db: Session = Depends(get_db)
 ):
     """Lấy thống kê cho dashboard"""
-    # Get counts for user's documents
-    total_documents = db.query(Document).filter(Document.user_id == current_user.id).count()
+    # Document count and storage come from the usage counters
+    total_documents, used_bytes = FolderService.usage(db, current_user.id)
+    quota_bytes = FolderService.quota(db, current_user.id)
     total_ocr = db.query(OCRResult).filter(OCRResult.user_id == current_user.id).count()
     total_reports = db.query(Report).filter(Report.created_by == current_user.id).count()
     
@@ -377,6 +657,8 @@ async def get_dashboard_stats(
     
     return {
         "total_documents": total_documents,
+        "storage_used_bytes": used_bytes,
+        "storage_quota_bytes": quota_bytes or None,
         "total_ocr_processed": total_ocr,
         "total_questions": 0,  # Will be implemented with chat history
         "total_reports": total_reports,
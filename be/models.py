@@ -1,11 +1,18 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON, LargeBinary, Index, BigInteger
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from datetime import datetime
 import uuid
 
+# Folder paths are compared byte-wise so that a subtree is one index range ("a/b/" <= path < "a/b0");
+# the default collation of most Postgres databases ignores punctuation and would break the range
+FolderPath = String(500).with_variant(String(500, collation="C"), "postgresql")
+
+# Full-text index of a stored text for keyword search (Postgres), other databases leave it empty
+SearchVector = Text().with_variant(TSVECTOR(), "postgresql")
+
 Base = declarative_base()
 
 class User(Base):
@@ -19,6 +26,7 @@ class User(Base):
     avatar = Column(String(500), nullable=True)
     department = Column(String(255), nullable=True)
     phone = Column(String(20), nullable=True)
+    storage_quota_bytes = Column(BigInteger, nullable=True)  # None: settings.STORAGE_QUOTA_BYTES
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -36,20 +44,174 @@ class Document(Base):
     name = Column(String(500), nullable=False)
     original_name = Column(String(500), nullable=False)
     type = Column(String(100), nullable=False)  # PDF, DOCX, etc.
-    size = Column(String(50), nullable=False)
+    size = Column(String(50), nullable=False)  # Human readable, for display
+    size_bytes = Column(BigInteger, default=0, nullable=False)
     file_path = Column(String(1000), nullable=False)
-    folder = Column(String(500), default="root")
+    folder = Column(FolderPath, default="root")  # Folder.path, or "root"
     upload_date = Column(DateTime, default=datetime.utcnow)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     is_processed = Column(Boolean, default=False)
-    extracted_text = Column(Text, nullable=True)
+    processing_status = Column(String(20), default="pending", index=True)  # pending, queued, extracting, ocr, indexing, completed, failed
+    processing_stages = Column(JSON, nullable=True)  # Per-stage status, timing and error, see services.document_pipeline
+    processing_attempts = Column(Integer, default=0, nullable=False)  # Times re-queued by tasks.maintenance_tasks.update_search_index
+    text_hash = Column(String(64), ForeignKey("text_contents.hash"), nullable=True, index=True)  # Extracted text, see TextContent
     doc_metadata = Column(JSON, nullable=True)  # Changed from 'metadata' to 'doc_metadata'
     shared = Column(Boolean, default=False)
+    content_hash = Column(String(64), ForeignKey("file_blobs.sha256"), nullable=True, index=True)  # sha256 of the stored blob
     
     # Relationships
     user = relationship("User", back_populates="documents")
     permissions = relationship("DocumentPermission", back_populates="document")
     ocr_result = relationship("OCRResult", back_populates="document", uselist=False)
+    text_content = relationship("TextContent")
+    pages = relationship(
+        "DocumentPage", back_populates="document", order_by="DocumentPage.page_number",
+        cascade="all, delete-orphan", passive_deletes=True
+    )
+    
+    __table_args__ = (
+        Index("ix_documents_user_folder", "user_id", "folder"),
+    )
+    
+    @property
+    def extracted_text(self):
+        # Loaded (and decompressed) on first access only, set through services.document_pages.set_document_text
+        return self.text_content.text if self.text_content is not None else None
+
+class Folder(Base):
+    __tablename__ = "folders"
+    
+    # Materialized path: "a/b/c" is the folder c inside a/b; "root" (no row) is the top level
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    parent_id = Column(UUID(as_uuid=True), ForeignKey("folders.id"), nullable=True)  # None for top-level folders
+    name = Column(String(255), nullable=False)
+    path = Column(FolderPath, nullable=False)
+    depth = Column(Integer, nullable=False)  # 1 for top-level folders
+    # Maintained incrementally by services.folder_service on upload, delete and move
+    document_count = Column(BigInteger, default=0, nullable=False)  # Documents directly in this folder
+    total_bytes = Column(BigInteger, default=0, nullable=False)
+    subtree_document_count = Column(BigInteger, default=0, nullable=False)  # Including all subfolders
+    subtree_bytes = Column(BigInteger, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_folders_user_path", "user_id", "path", unique=True),
+        Index("ix_folders_parent", "parent_id"),
+    )
+
+class DocumentPage(Base):
+    __tablename__ = "document_pages"
+    
+    # Page boundaries, so consumers can read the pages they need instead of the whole extracted_text;
+    # the text itself is sliced out of the document's TextContent (services.document_pages.page_texts)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    page_number = Column(Integer, nullable=False)  # 1-based
+    char_start = Column(Integer, nullable=False)  # Offsets of the page text within extracted_text
+    char_end = Column(Integer, nullable=False)
+    
+    # Relationships
+    document = relationship("Document", back_populates="pages")
+    
+    __table_args__ = (
+        Index("ix_document_pages_document_page", "document_id", "page_number", unique=True),
+    )
+
+class FileBlob(Base):
+    __tablename__ = "file_blobs"
+    
+    # Uploaded files are stored once per distinct content, documents reference them by hash
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String(1000), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    mime_type = Column(String(255), nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)
+    text_hash = Column(String(64), ForeignKey("text_contents.hash"), nullable=True)  # Text extraction result shared by all documents with this content
+    ocr_text_hash = Column(String(64), ForeignKey("text_contents.hash"), nullable=True)  # OCR result shared the same way
+    ocr_confidence = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    text_content = relationship("TextContent", foreign_keys=[text_hash])
+    ocr_content = relationship("TextContent", foreign_keys=[ocr_text_hash])
+
+class TextContent(Base):
+    __tablename__ = "text_contents"
+    
+    # Extracted and OCR text, compressed and stored once per distinct content
+    hash = Column(String(64), primary_key=True)  # sha256 of the UTF-8 text
+    codec = Column(String(10), nullable=False)  # zstd, zlib
+    data = Column(LargeBinary, nullable=False)
+    length = Column(Integer, nullable=False)  # Characters
+    search_vector = deferred(Column(SearchVector, nullable=True))  # Distinct words, see TextStore.put
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_text_contents_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    
+    @property
+    def text(self) -> str:
+        # Rows are immutable, so the decompressed text is kept for the lifetime of the instance
+        if "_text" not in self.__dict__:
+            from services.text_store import decode_text
+            self.__dict__["_text"] = decode_text(self.codec, self.data)
+        return self.__dict__["_text"]
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    filename = Column(String(500), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # Checksum declared by the client, verified on completion
+    part_path = Column(String(1000), nullable=False)
+    folder = Column(String(500), default="root")  # Target folder of the document created on completion
+    received_ranges = Column(JSON, nullable=True)  # Sorted, merged [start, end) byte ranges already written
+    received_bytes = Column(BigInteger, default=0, nullable=False)
+    status = Column(String(20), default="active")  # active, completed, aborted, expired
+    document_id = Column(UUID(as_uuid=True), nullable=True)  # Document created on completion (no FK, it may be deleted later)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_upload_sessions_status_expires", "status", "expires_at"),
+    )
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    status = Column(String(20), default="queued")  # queued, expanding, processing, completed, failed
+    folder = Column(String(500), default="root")  # Target folder, archive paths are appended below it
+    sources = Column(JSON, nullable=True)  # Uploaded files/archives waiting to be expanded
+    total_items = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class IngestItem(Base):
+    __tablename__ = "ingest_items"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("ingest_jobs.id"), nullable=False)
+    name = Column(String(1000), nullable=False)  # File name, or path inside the archive
+    size = Column(BigInteger, nullable=True)
+    document_id = Column(UUID(as_uuid=True), nullable=True)  # No FK, the document may be deleted later
+    status = Column(String(20), default="stored")  # stored, processed, skipped, failed
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_ingest_items_job_status", "job_id", "status"),
+        Index("ix_ingest_items_document", "document_id"),
+    )
 
 class DocumentPermission(Base):
     __tablename__ = "document_permissions"
@@ -73,7 +235,7 @@ class OCRResult(Base):
     document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     original_file = Column(String(500), nullable=False)
-    extracted_text = Column(Text, nullable=False)
+    text_hash = Column(String(64), ForeignKey("text_contents.hash"), nullable=True)  # Recognized text, see TextContent
     confidence = Column(Float, default=0.0)
     process_date = Column(DateTime, default=datetime.utcnow)
     status = Column(String(50), default="processing")  # processing, completed, failed
@@ -84,6 +246,11 @@ class OCRResult(Base):
     # Relationships
     document = relationship("Document", back_populates="ocr_result")
     user = relationship("User", back_populates="ocr_results")
+    text_content = relationship("TextContent")
+    
+    @property
+    def extracted_text(self) -> str:
+        return self.text_content.text if self.text_content is not None else ""
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -93,10 +260,16 @@ class ChatSession(Base):
     title = Column(String(500), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    summary = Column(Text, nullable=True)  # Running summary of turns older than the verbatim window
+    summarized_count = Column(Integer, default=0, nullable=False)  # Oldest messages folded into summary
     
     # Relationships
     user = relationship("User", back_populates="chat_sessions")
     messages = relationship("ChatMessage", back_populates="session")
+    
+    __table_args__ = (
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -112,6 +285,10 @@ class ChatMessage(Base):
     
     # Relationships
     session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        Index("ix_chat_messages_session_timestamp", "session_id", "timestamp"),
+    )
 
 class Report(Base):
     __tablename__ = "reports"
@@ -150,7 +327,10 @@ class VectorStore(Base):
     document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(JSON, nullable=True)  # Store as JSON for simplicity
+    embedding = Column(JSON, nullable=True)  # Legacy JSON list, converted to embedding_blob by migration 002
+    embedding_blob = Column(LargeBinary, nullable=True)  # Packed float32/float16/int8 array
+    embedding_dtype = Column(String(10), nullable=True)  # float32, float16, int8
+    embedding_scale = Column(Float, nullable=True)  # Per-vector scale for int8
     vec_metadata = Column(JSON, nullable=True)  # Changed from 'metadata' to 'vec_metadata'
     created_at = Column(DateTime, default=datetime.utcnow)
     
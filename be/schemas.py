@@ -72,6 +72,9 @@ class DocumentUpdate(BaseModel):
     shared: Optional[bool] = None
     doc_metadata: Optional[Dict[str, Any]] = None  # Updated field name
 
+class DocumentMove(BaseModel):
+    folder: str  # Target folder path, "root" for the top level
+
 class DocumentShare(BaseModel):
     user_email: str  # Changed from EmailStr to str
     permission: str = Field(..., pattern="^(read|write|admin)$")
@@ -306,6 +309,16 @@ class PaginatedResponse(BaseModel):
     limit: int
     pages: int
 
+# ======================= FOLDER SCHEMAS =======================
+
+class FolderCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    parent: str = "root"  # Path of the parent folder
+
+class FolderUpdate(BaseModel):
+    name: Optional[str] = Field(None, min_length=1, max_length=255)  # Rename
+    parent: Optional[str] = None  # Move under this folder path
+
 # ======================= FILE UPLOAD SCHEMAS =======================
 
 class FileUploadResponse(BaseModel):
@@ -316,6 +329,12 @@ class FileUploadResponse(BaseModel):
     file_path: str
     upload_date: datetime
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+    folder: str = "root"
+
 class UploadProgress(BaseModel):
     filename: str
     progress: float
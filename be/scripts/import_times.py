@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Measure import time of the API entrypoint, grouped by top-level package
+Run this in your be/ directory: python scripts/import_times.py [module]
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Packages that must not be imported when the API module is loaded
+HEAVY_PACKAGES = ["torch", "easyocr", "langchain", "langchain_community", "chromadb", "sentence_transformers"]
+
+def measure(module: str):
+    """Run `python -X importtime -c "import <module>"` and parse its report"""
+
+    be_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=be_dir,
+        capture_output=True,
+        text=True
+    )
+
+    if proc.returncode != 0:
+        print(f"❌ import {module} failed:")
+        print(proc.stderr.splitlines()[-1] if proc.stderr else "")
+        sys.exit(1)
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    self_time = defaultdict(int)
+    total_us = 0
+    imported = set()
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        us = int(parts[0].strip())
+        name = parts[2].strip()
+        top_level = name.split(".")[0]
+
+        self_time[top_level] += us
+        total_us += us
+        imported.add(top_level)
+
+    return self_time, total_us, imported
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+
+    self_time, total_us, imported = measure(module)
+
+    print(f"Import time breakdown for '{module}'")
+    print("=" * 40)
+    for package, us in sorted(self_time.items(), key=lambda item: item[1], reverse=True)[:25]:
+        print(f"{package:<30} {us / 1000:>8.1f} ms")
+    print("-" * 40)
+    print(f"{'TOTAL':<30} {total_us / 1000:>8.1f} ms")
+
+    heavy = [package for package in HEAVY_PACKAGES if package in imported]
+    if heavy:
+        print(f"\n⚠️  Heavy packages imported eagerly: {', '.join(heavy)}")
+        sys.exit(1)
+
+    print("\n✅ No heavy packages imported at startup")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+QA load test with the offline fake backends (no API keys, no Ollama needed)
+Run this in your be/ directory: python scripts/qa_load_test.py --questions 200 --concurrency 16
+
+Seeds synthetic documents for a load-test user, indexes them with the hash
+embedder, then runs concurrent conversations (several turns per chat session,
+so history and summaries are exercised) through the same scheduler and
+QAService code path as /api/qa/ask. Reports throughput and the per-stage
+latency that ask_question records in msg_metadata.
+
+By default everything goes to a throwaway sqlite database and vector index in a
+temporary directory; --use-configured-db writes to DATABASE_URL instead (the
+vector index stays temporary, hash embeddings must never reach the real one).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def configure(args) -> str:
+    """Backends and storage, set before settings are loaded; returns the temporary directory"""
+    work_dir = tempfile.mkdtemp(prefix="qa-load-")
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ.setdefault("EMBEDDING_BACKEND", "hash")
+    os.environ["VECTOR_DB_TYPE"] = "native"
+    # 384-dim hash vectors would fix the dimension of a real index
+    os.environ["VECTOR_INDEX_PATH"] = os.path.join(work_dir, "vector_index")
+    os.environ["CHROMA_DB_PATH"] = os.path.join(work_dir, "chroma_db")
+    if not args.use_configured_db:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'qa_load.db')}"
+    return work_dir
+
+TOPICS = [
+    "ngân sách", "hợp đồng", "nhân sự", "bảo hiểm", "thuế", "đào tạo",
+    "mua sắm", "an toàn", "công nghệ", "báo cáo", "kiểm toán", "dự án",
+]
+
+def synthetic_document(rng: random.Random, pages: int) -> str:
+    parts = []
+    for page in range(1, pages + 1):
+        topic = rng.choice(TOPICS)
+        sentences = [
+            f"Điều {rng.randint(1, 40)} quy định về {topic} của đơn vị năm {rng.randint(2015, 2025)}.",
+            f"Mức chi cho {topic} là {rng.randint(1, 900)} triệu đồng theo kế hoạch.",
+            f"Phòng {rng.choice(TOPICS)} chịu trách nhiệm phối hợp thực hiện {topic}.",
+        ]
+        parts.append(f"--- Trang {page} ---\n" + " ".join(rng.choice(sentences) for _ in range(30)))
+    return "\n\n".join(parts)
+
+async def seed(db, qa_service, documents: int, pages: int):
+    from models import User, Document
+    from services.document_pages import set_document_text
+
+    user = User(
+        name="QA load test",
+        email=f"qa-load-{uuid.uuid4().hex[:8]}@smartdoc.local",
+        hashed_password="!",
+        role="user"
+    )
+    db.add(user)
+    db.commit()
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    for i in range(documents):
+        text = synthetic_document(rng, pages)
+        document = Document(
+            name=f"Tài liệu kiểm thử {i + 1}",
+            original_name=f"load-test-{i + 1}.txt",
+            type="TXT",
+            size=f"{len(text) / 1024:.1f} KB",
+            file_path="",
+            user_id=user.id,
+            is_processed=True
+        )
+        set_document_text(db, document, text)
+        db.add(document)
+        db.commit()
+        await qa_service.index_document(document.id, text, {"title": document.name})
+    print(f"Seeded and indexed {documents} documents in {time.perf_counter() - start:.1f}s")
+
+    return user.id
+
+async def run(args):
+    from database import SessionLocal, settings
+    from models import Base, User, Document, ChatSession, ChatMessage, VectorStore
+    from database import engine
+    from schemas import QARequest
+    from sqlalchemy import select
+    from services.qa_service import QAService, QA_STAGES
+    from services.metrics import percentile
+    from services.qa_scheduler import QAScheduler, QueueFullError
+
+    Base.metadata.create_all(bind=engine)
+
+    qa_service = QAService()
+    qa_service.warm_up()
+    if not qa_service.answer_chain or not qa_service.vector_store:
+        print("❌ QA service could not initialize the fake backends (is LangChain installed?)")
+        sys.exit(1)
+
+    scheduler = QAScheduler(
+        max_concurrency=settings.QA_MAX_CONCURRENCY,
+        max_queue_per_user=args.questions,
+        max_queue_total=args.questions,
+        queue_timeout=3600
+    )
+
+    db = SessionLocal()
+    user_id = await seed(db, qa_service, args.documents, args.pages)
+    db.close()
+
+    latencies = []
+    rng = random.Random(7)
+    questions = [
+        f"Mức chi cho {rng.choice(TOPICS)} năm {rng.randint(2015, 2025)} là bao nhiêu?"
+        for _ in range(args.questions)
+    ]
+    # Turns of one conversation are sequential, conversations run concurrently
+    turns = max(1, args.turns)
+    conversations = [questions[i:i + turns] for i in range(0, len(questions), turns)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = defaultdict(int)
+    last_error = []
+
+    async def ask(question, session_id):
+        db = SessionLocal()
+        start = time.perf_counter()
+        try:
+            async with scheduler.slot(user_id):
+                result = await qa_service.ask_question(
+                    db, QARequest(question=question, session_id=session_id), user_id
+                )
+            latencies.append(time.perf_counter() - start)
+            return result.get("session_id") or session_id
+        except QueueFullError:
+            errors["429"] += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            last_error[:] = [getattr(e, "detail", None) or str(e)]
+        finally:
+            db.close()
+        return session_id
+
+    async def converse(turn_questions):
+        async with semaphore:
+            session_id = None
+            for question in turn_questions:
+                session_id = await ask(question, session_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(converse(turn_questions) for turn_questions in conversations))
+    elapsed = time.perf_counter() - start
+
+    completed = len(latencies)
+    print(f"\nQA load test: {args.questions} questions in {len(conversations)} conversations "
+          f"of up to {turns} turns, concurrency {args.concurrency}, "
+          f"QA_MAX_CONCURRENCY {settings.QA_MAX_CONCURRENCY}")
+    print("=" * 64)
+    print(f"Completed: {completed}  Errors: {dict(errors) or 0}")
+    if last_error:
+        print(f"Last error: {last_error[0]}")
+    print(f"Throughput: {completed / elapsed:.2f} questions/s over {elapsed:.1f}s")
+    print("-" * 64)
+    print(f"Client latency: p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms (includes scheduler queueing)")
+    print("-" * 64)
+
+    # Per-stage timings recorded by ask_question in msg_metadata
+    db = SessionLocal()
+    session_ids = select(ChatSession.id).where(ChatSession.user_id == user_id)
+    rows = db.query(ChatMessage.msg_metadata).filter(
+        ChatMessage.session_id.in_(session_ids), ChatMessage.type == "assistant"
+    ).all()
+    db.close()
+
+    stages = defaultdict(list)
+    counts = defaultdict(list)
+    for (metadata,) in rows:
+        for stage, ms in (metadata or {}).get("timings_ms", {}).items():
+            stages[stage].append(ms)
+        for name, value in (metadata or {}).get("counts", {}).items():
+            counts[name].append(value)
+
+    print(f"{'stage':<12} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage in QA_STAGES:
+        values = stages.get(stage, [])
+        print(f"{stage:<12} {len(values):>7} {percentile(values, 50):>10.1f} {percentile(values, 95):>10.1f} "
+              f"{percentile(values, 99):>10.1f} {max(values, default=0):>10.1f}")
+    print("-" * 64)
+    for name, values in counts.items():
+        print(f"{name:<16} avg {sum(values) / len(values):>8.1f}  max {max(values):>6}")
+
+    if not args.keep:
+        db = SessionLocal()
+        session_ids = [row.id for row in db.query(ChatSession.id).filter(ChatSession.user_id == user_id)]
+        document_ids = [d.id for d in db.query(Document.id).filter(Document.user_id == user_id)]
+        for document_id in document_ids:
+            await qa_service.remove_document(document_id)
+        db.query(ChatMessage).filter(ChatMessage.session_id.in_(session_ids)).delete(synchronize_session=False)
+        db.query(ChatSession).filter(ChatSession.user_id == user_id).delete(synchronize_session=False)
+        db.query(VectorStore).filter(VectorStore.document_id.in_(document_ids)).delete(synchronize_session=False)
+        db.query(Document).filter(Document.user_id == user_id).delete(synchronize_session=False)
+        db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QA load test with fake LLM/embedding backends")
+    parser.add_argument("--documents", type=int, default=50, help="synthetic documents to seed")
+    parser.add_argument("--pages", type=int, default=5, help="pages per document")
+    parser.add_argument("--questions", type=int, default=200, help="questions to ask")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent conversations")
+    parser.add_argument("--turns", type=int, default=6, help="questions per chat session")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded data (and the temporary directory)")
+    parser.add_argument(
+        "--use-configured-db", action="store_true",
+        help="write to DATABASE_URL instead of a temporary sqlite database"
+    )
+    args = parser.parse_args()
+    work_dir = configure(args)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if args.keep:
+            print(f"Load test data kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
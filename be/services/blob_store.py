@@ -0,0 +1,168 @@
+# app/services/blob_store.py
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import FileBlob
+from services.upload_stream import StagedFile
+from services.text_store import TextStore
+
+# Suffix of blob files released by a transaction that has not committed yet
+RELEASED_SUFFIX = ".released"
+
+# Files found in the blob directory this many names are looked up per query
+GC_BATCH = 1000
+
+class BlobStore:
+    """Kho file theo nội dung: mỗi nội dung (sha256) chỉ lưu một lần trên đĩa.
+
+    Các Document cùng nội dung trỏ chung một blob; ref_count đếm số document đang
+    tham chiếu, file chỉ bị xoá khi document cuối cùng bị xoá. Mọi thay đổi
+    ref_count đều khoá dòng file_blobs (SELECT ... FOR UPDATE) nên upload và xoá
+    đồng thời cùng một nội dung không giẫm lên nhau.
+    """
+
+    def __init__(self, upload_dir: str):
+        self.root = os.path.join(upload_dir, "blobs")
+
+    def path_for(self, sha256: str) -> str:
+        # Two levels of fan-out keep directories small
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def _lock(self, db: Session, sha256: str) -> Optional[FileBlob]:
+        return db.query(FileBlob).filter(FileBlob.sha256 == sha256).with_for_update().first()
+
+    def _place(self, staged: StagedFile) -> str:
+        path = self.path_for(staged.sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Staging lives under the upload dir, so this is a rename rather than a copy
+        os.replace(staged.path, path)
+        return path
+
+    def adopt(self, db: Session, staged: StagedFile) -> FileBlob:
+        """Nhận file staging vào kho và tăng ref_count (chưa commit, caller commit cùng Document)"""
+
+        blob = self._lock(db, staged.sha256)
+        if blob is None:
+            path = self._place(staged)
+            blob = FileBlob(
+                sha256=staged.sha256,
+                path=path,
+                size=staged.size,
+                mime_type=staged.mime_type,
+                ref_count=0
+            )
+            try:
+                with db.begin_nested():
+                    db.add(blob)
+            except IntegrityError:
+                # Someone stored the same content concurrently, the file we placed is identical
+                blob = self._lock(db, staged.sha256)
+        elif not os.path.exists(blob.path):
+            # The row survived but the file is gone, restore it from this upload
+            blob.path = self._place(staged)
+        else:
+            staged.discard()
+
+        blob.ref_count += 1
+        blob.last_used_at = datetime.utcnow()
+        return blob
+
+    def release(self, db: Session, sha256: str) -> bool:
+        """Giảm ref_count; khi về 0 thì xoá blob. Trả về True nếu file sẽ bị xoá khi commit.
+
+        Trong lúc còn giữ khoá dòng, file được đổi tên ra khỏi đường dẫn của blob,
+        nên một upload cùng nội dung đang chờ khoá sẽ đặt file mới vào đó mà không
+        bị xoá mất. File chỉ bị xoá sau khi commit thành công; rollback thì trả nó
+        về chỗ cũ. File còn sót lại (tiến trình dừng giữa chừng) do collect_garbage dọn.
+        """
+
+        blob = self._lock(db, sha256)
+        if blob is None:
+            return False
+
+        blob.ref_count = max(blob.ref_count - 1, 0)
+        if blob.ref_count > 0:
+            return False
+
+        db.delete(blob)
+        db.flush()
+        if os.path.exists(blob.path):
+            released = f"{blob.path}.{uuid.uuid4().hex}{RELEASED_SUFFIX}"
+            os.replace(blob.path, released)
+            self._on_outcome(db, blob.path, released)
+        return True
+
+    @staticmethod
+    def _on_outcome(db: Session, path: str, released: str):
+        """Xoá file đã release sau khi commit, trả về chỗ cũ nếu rollback"""
+
+        # Whichever fires first handles the file, the other then finds nothing to do
+        def after_commit(session):
+            if os.path.exists(released):
+                os.remove(released)
+
+        def after_rollback(session):
+            # Unless a new upload of the same content already took its place
+            if os.path.exists(released) and not os.path.exists(path):
+                os.replace(released, path)
+
+        event.listen(db, "after_commit", after_commit, once=True)
+        event.listen(db, "after_rollback", after_rollback, once=True)
+
+    def collect_garbage(self, db: Session, min_age_hours: int = 1) -> int:
+        """Xoá các file trong kho không còn dòng file_blobs nào (kể cả file release còn sót)"""
+
+        # Recent files may belong to a transaction that has not committed its row yet
+        cutoff = time.time() - min_age_hours * 3600
+        candidates = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        candidates.append((name, path))
+                except FileNotFoundError:
+                    continue
+
+        removed = 0
+        for start in range(0, len(candidates), GC_BATCH):
+            batch = candidates[start:start + GC_BATCH]
+            known = {
+                sha256 for (sha256,) in db.query(FileBlob.sha256).filter(
+                    FileBlob.sha256.in_([name for name, _ in batch])
+                )
+            }
+            for name, path in batch:
+                if name in known:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    @staticmethod
+    def remember_text(db: Session, sha256: Optional[str], text: str):
+        """Lưu kết quả trích xuất text vào blob để document cùng nội dung dùng lại"""
+        if sha256 and text:
+            content = TextStore.put(db, text)
+            db.query(FileBlob).filter(FileBlob.sha256 == sha256).update(
+                {FileBlob.text_hash: content.hash}, synchronize_session=False
+            )
+
+    @staticmethod
+    def remember_ocr(db: Session, sha256: Optional[str], text: str, confidence: float):
+        """Lưu kết quả OCR vào blob để document cùng nội dung dùng lại"""
+        if sha256 and text:
+            content = TextStore.put(db, text)
+            db.query(FileBlob).filter(FileBlob.sha256 == sha256).update(
+                {FileBlob.ocr_text_hash: content.hash, FileBlob.ocr_confidence: confidence}, synchronize_session=False
+            )
@@ -0,0 +1,343 @@
+# app/services/bulk_ingest.py
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import datetime
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, Request
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import IngestJob, IngestItem
+from database import settings, SessionLocal
+from services.upload_stream import StagedFile, StagingWriter, stream_multipart_files
+from services.document_pipeline import enqueue_pipeline
+from services.folder_service import (
+    FolderService, ROOT, normalize_path, join_path, group_by_folder, quota_exceeded_error
+)
+
+ZIP_READ_BLOCK = 1024 * 1024
+
+# Items that still have work pending; the job is complete once none are left
+PENDING_STATUSES = ("stored",)
+
+
+class BulkIngestService:
+    """Nhập hàng loạt file hoặc file ZIP thành Document.
+
+    API chỉ stream các file upload xuống thư mục của job rồi trả về job id. Celery
+    (tasks.ingest_tasks) giải nén từng entry của ZIP thẳng vào blob store (không
+    bung cả archive ra đĩa), tạo Document theo lô INGEST_BATCH_SIZE mỗi commit,
+    và đẩy việc trích xuất/đánh index của từng tài liệu sang các task riêng.
+    """
+
+    def __init__(self, document_service):
+        self.document_service = document_service
+        self.ingest_dir = os.path.join(settings.UPLOAD_DIR, ".ingest")
+
+    def _job_dir(self, job_id) -> str:
+        return os.path.join(self.ingest_dir, str(job_id))
+
+    def _validate_filename(self, filename: str):
+        if not filename.lower().endswith(".zip"):
+            self.document_service._validate_filename(filename)
+
+    def _max_size(self, filename: str) -> int:
+        # An archive may hold many documents, each entry is checked against MAX_FILE_SIZE later
+        return settings.BULK_MAX_UPLOAD_SIZE if filename.lower().endswith(".zip") else settings.MAX_FILE_SIZE
+
+    async def start_job(self, db: Session, request: Request, user_id: UUID, folder: str = "root"):
+        """Nhận các file của request (field `files`) và xếp job vào hàng đợi Celery"""
+
+        folder = normalize_path(folder)
+        job_id = uuid.uuid4()
+        staged = await stream_multipart_files(
+            request,
+            staging_dir=self._job_dir(job_id),
+            max_size=self._max_size,
+            field_name="files",
+            validate_filename=self._validate_filename,
+            max_files=settings.BULK_MAX_FILES,
+            max_total_size=settings.BULK_MAX_UPLOAD_SIZE
+        )
+
+        job = IngestJob(
+            id=job_id,
+            user_id=user_id,
+            status="queued",
+            folder=folder,
+            sources=[
+                {
+                    "filename": item.filename,
+                    "path": item.path,
+                    "size": item.size,
+                    "sha256": item.sha256,
+                    "mime_type": item.mime_type
+                } for item in staged
+            ]
+        )
+        db.add(job)
+        db.commit()
+
+        try:
+            from tasks.ingest_tasks import ingest_bulk_job
+            ingest_bulk_job.delay(str(job_id))
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"Could not queue ingest job: {e}"
+            db.commit()
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+            raise HTTPException(status_code=503, detail="Không thể đưa job nhập tài liệu vào hàng đợi")
+
+        return {
+            "job_id": str(job_id),
+            "status": job.status,
+            "files": len(staged),
+            "message": "Đã nhận file, đang nhập tài liệu..."
+        }
+
+    async def get_job(
+        self,
+        db: Session,
+        job_id: str,
+        user_id: UUID,
+        status: Optional[str] = None,
+        page: int = 1,
+        limit: int = 100
+    ):
+        """Tiến độ job: số lượng theo trạng thái và danh sách item (phân trang)"""
+
+        try:
+            job_id = UUID(str(job_id))
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Không tìm thấy job nhập tài liệu")
+
+        job = db.query(IngestJob).filter(IngestJob.id == job_id, IngestJob.user_id == user_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Không tìm thấy job nhập tài liệu")
+
+        counts = dict(
+            db.query(IngestItem.status, func.count(IngestItem.id))
+            .filter(IngestItem.job_id == job.id)
+            .group_by(IngestItem.status)
+            .all()
+        )
+
+        # Extraction tasks report per item; the job finishes with the last of them
+        if job.status == "processing" and not any(counts.get(s) for s in PENDING_STATUSES):
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+
+        query = db.query(IngestItem).filter(IngestItem.job_id == job.id)
+        if status:
+            query = query.filter(IngestItem.status == status)
+        items = query.order_by(IngestItem.name).offset((page - 1) * limit).limit(limit).all()
+
+        return {
+            "job_id": str(job.id),
+            "status": job.status,
+            "error": job.error,
+            "total": job.total_items,
+            "counts": counts,
+            "created_at": job.created_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            "items": [
+                {
+                    "name": item.name,
+                    "size": item.size,
+                    "status": item.status,
+                    "document_id": str(item.document_id) if item.document_id else None,
+                    "error": item.error
+                } for item in items
+            ],
+            "page": page,
+            "limit": limit
+        }
+
+    # ----------------------------------------------------------------- worker side
+
+    async def run_job(self, job_id: str) -> dict:
+        """Giải nén, lưu blob và tạo Document cho mọi file của job (chạy trong Celery)"""
+
+        db = SessionLocal()
+        try:
+            job = db.query(IngestJob).filter(IngestJob.id == UUID(job_id)).first()
+            if not job or job.status not in ("queued", "expanding"):
+                return {"status": "skipped"}
+
+            job.status = "expanding"
+            db.commit()
+
+            batch: List[Tuple[StagedFile, str, str]] = []
+            skipped: List[IngestItem] = []
+            document_ids: List[str] = []
+
+            async def flush():
+                if batch or skipped:
+                    document_ids.extend(self._store_batch(db, job, batch, skipped))
+                    batch.clear()
+                    skipped.clear()
+
+            for source in job.sources or []:
+                if source["filename"].lower().endswith(".zip"):
+                    await self._expand_archive(job, source, batch, skipped, flush)
+                else:
+                    staged = StagedFile(
+                        source["path"], source["filename"], source["size"], source["sha256"], source["mime_type"]
+                    )
+                    batch.append((staged, job.folder, source["filename"]))
+                    if len(batch) >= settings.INGEST_BATCH_SIZE:
+                        await flush()
+            await flush()
+
+            job.status = "processing"
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            job = db.query(IngestJob).filter(IngestJob.id == UUID(job_id)).first()
+            if job:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+            raise
+        finally:
+            db.close()
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+        return {"status": "processing", "documents": len(document_ids)}
+
+    async def _expand_archive(self, job: IngestJob, source: dict, batch, skipped, flush):
+        """Stream từng entry của ZIP vào file staging (đã băm sha256) rồi đưa vào lô"""
+
+        try:
+            archive = zipfile.ZipFile(source["path"])
+        except zipfile.BadZipFile as e:
+            skipped.append(self._item(job, source["filename"], source["size"], "failed", f"ZIP không hợp lệ: {e}"))
+            return
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+
+                name = f"{source['filename']}/{info.filename}"
+                filename = os.path.basename(info.filename)
+                error = self._entry_error(filename, info.file_size)
+                if error:
+                    skipped.append(self._item(job, name, info.file_size, "skipped", error))
+                    continue
+                try:
+                    folder = self._entry_folder(job.folder, info.filename)
+                except HTTPException as e:
+                    # Too deep or too long once appended to the job folder
+                    skipped.append(self._item(job, name, info.file_size, "failed", e.detail))
+                    continue
+
+                writer = await StagingWriter(self._job_dir(job.id), settings.MAX_FILE_SIZE).open()
+                try:
+                    with archive.open(info) as entry:
+                        while block := entry.read(ZIP_READ_BLOCK):
+                            # The size limit is enforced on the bytes actually inflated
+                            await writer.write(block)
+                    staged = await writer.finish(filename)
+                except HTTPException as e:
+                    skipped.append(self._item(job, name, info.file_size, "skipped", e.detail))
+                    continue
+                except Exception as e:
+                    await writer.abort()
+                    skipped.append(self._item(job, name, info.file_size, "failed", str(e)))
+                    continue
+
+                batch.append((staged, folder, name))
+                if len(batch) >= settings.INGEST_BATCH_SIZE:
+                    await flush()
+
+    def _entry_error(self, filename: str, size: int) -> Optional[str]:
+        if not filename or filename.startswith("."):
+            return "Bỏ qua file ẩn"
+        if filename.lower().endswith(".zip"):
+            return "Không hỗ trợ ZIP lồng nhau"
+        try:
+            self.document_service._validate_filename(filename)
+        except HTTPException as e:
+            return e.detail
+        if size > settings.MAX_FILE_SIZE:
+            return f"File quá lớn. Kích thước tối đa: {settings.MAX_FILE_SIZE / (1024*1024):.0f}MB"
+        return None
+
+    @staticmethod
+    def _entry_folder(base: str, entry_path: str) -> str:
+        """Thư mục trong archive được nối vào thư mục đích của job (đã chuẩn hoá, 400 nếu quá sâu/dài)"""
+        parts = os.path.dirname(entry_path.replace("\\", "/")).split("/")
+        directory = "/".join(part for part in parts if part.strip() not in ("", ".", ".."))
+        if not directory:
+            return base
+        # The same normalized path is used for the document and for the folder counters
+        return normalize_path(join_path(base, directory) if base != ROOT else directory)
+
+    @staticmethod
+    def _item(job: IngestJob, name: str, size: Optional[int], status: str, error: Optional[str] = None) -> IngestItem:
+        return IngestItem(id=uuid.uuid4(), job_id=job.id, name=name[:1000], size=size, status=status, error=error)
+
+    def _store_batch(self, db: Session, job: IngestJob, batch, skipped) -> List[str]:
+        """Lưu một lô: nhận blob, tạo Document và IngestItem trong một commit, rồi fan-out xử lý"""
+
+        documents = []
+        items = list(skipped)
+        try:
+            batch = self._within_quota(db, job, batch, items)
+
+            # Usage counters first, one update per folder: a rejected file never reaches the blob store
+            for (user_id, folder), (count, size_bytes) in group_by_folder(
+                (job.user_id, folder, staged.size) for staged, folder, _ in batch
+            ).items():
+                FolderService.add_documents(db, user_id, folder, count, size_bytes, enforce_quota=True)
+
+            for staged, folder, name in batch:
+                blob = self.document_service.blob_store.adopt(db, staged)
+                document = self.document_service.build_document(staged, blob, job.user_id, folder=folder)
+                documents.append(document)
+                items.append(self._item(job, name, staged.size, "stored"))
+                items[-1].document_id = document.id
+
+            db.add_all(documents)
+            db.add_all(items)
+            job.total_items += len(items)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for staged, _, _ in batch:
+                staged.discard()
+            raise
+
+        # One task chain per document: extraction (or reuse of cached text), OCR if needed, indexing
+        document_ids = [str(document.id) for document in documents]
+        if document_ids and not enqueue_pipeline(document_ids):
+            raise RuntimeError("Could not queue document processing")
+
+        return document_ids
+
+    def _within_quota(self, db: Session, job: IngestJob, batch, items: List[IngestItem]):
+        """Các file của lô còn vừa hạn mức; file vượt hạn mức thành IngestItem lỗi, các file khác vẫn được nhập"""
+
+        quota = FolderService.quota(db, job.user_id)
+        if not quota:
+            return batch
+
+        # Locked until the batch commits, concurrent uploads are checked after this batch
+        used = FolderService.locked_usage(db, job.user_id)
+        accepted = []
+        for staged, folder, name in batch:
+            if used + staged.size > quota:
+                items.append(self._item(job, name, staged.size, "failed", quota_exceeded_error(quota).detail))
+                staged.discard()
+                continue
+            used += staged.size
+            accepted.append((staged, folder, name))
+        return accepted
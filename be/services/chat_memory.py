@@ -0,0 +1,51 @@
+# app/services/chat_memory.py
+from typing import List, Optional
+
+# Vietnamese text with diacritics tokenizes to roughly one token per 3 characters
+CHARS_PER_TOKEN = 3
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Ước lượng số token (không cần tokenizer của model)"""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt văn bản để không vượt quá max_tokens"""
+    max_chars = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+def format_message(message_type: str, content: str) -> str:
+    speaker = "Người dùng" if message_type == "user" else "Trợ lý"
+    return f"{speaker}: {content}"
+
+def build_history(summary: Optional[str], recent_messages: List, max_tokens: int) -> str:
+    """Ghép tóm tắt hội thoại và các lượt gần nhất trong giới hạn max_tokens.
+
+    Tóm tắt được ưu tiên, sau đó thêm các tin nhắn từ mới đến cũ cho tới khi hết
+    ngân sách; `recent_messages` theo thứ tự thời gian tăng dần.
+    """
+    parts = []
+    used = 0
+    if summary:
+        summary_text = truncate_to_tokens(summary, max_tokens // 2)
+        parts.append(f"Tóm tắt các lượt trước: {summary_text}")
+        used += estimate_tokens(parts[0])
+
+    turns = []
+    for message in reversed(recent_messages):
+        line = format_message(message.type, message.content)
+        remaining = max_tokens - used
+        if remaining <= 0:
+            break
+        if estimate_tokens(line) > remaining:
+            # Only the newest message may be shortened, older ones are dropped
+            if turns:
+                break
+            line = truncate_to_tokens(line, remaining)
+        turns.insert(0, line)
+        used += estimate_tokens(line)
+
+    return "\n".join(parts + turns)
@@ -0,0 +1,137 @@
+# app/services/chunker.py
+import re
+from typing import Iterator, Dict, Any, Optional
+
+# Page separator written by OCRService._process_pdf and extraction.join_pages
+PAGE_MARKER = re.compile(r'^--- Trang (\d+) ---$')
+
+# Uppercase letters of the Vietnamese alphabet (À-Ỹ as a range also contains lowercase ones)
+_UPPER = "A-Z" + "".join(
+    char for char in map(chr, [*range(0xC0, 0x1B0), *range(0x1EA0, 0x1EFA)]) if char.isupper()
+)
+
+# Structural headings common in Vietnamese administrative / technical documents
+HEADING = re.compile(
+    r'^(?:'
+    r'#{1,6}\s+\S.*'                                              # Markdown heading
+    r'|(?:CHƯƠNG|Chương|PHẦN|Phần|MỤC|Mục|ĐIỀU|Điều)\s+[\dIVXLC]+\b.*'  # Chương I, Điều 5...
+    r'|[IVXLC]+\.\s+\S.*'                                         # I. Tổng quan
+    rf'|\d+(?:\.\d+)+\.?\s+[{_UPPER}][^.]{{0,100}}'                 # 1.2 Phạm vi áp dụng
+    # A single number is only a heading on a short line: "3 Người tham gia đã ký..." is not
+    rf'|\d+\.\s+[{_UPPER}][^.:;,]{{0,60}}'                          # 1. Giới thiệu
+    r')$'
+)
+
+_LINE = re.compile(r'[^\n]*\n?')
+
+
+def _iter_lines(text: str) -> Iterator[tuple]:
+    """Duyệt từng dòng kèm vị trí bắt đầu, không tạo list toàn bộ dòng"""
+    for match in _LINE.finditer(text):
+        if not match.group():
+            break
+        yield match.start(), match.group()
+
+
+def iter_chunks(
+    text: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200
+) -> Iterator[Dict[str, Any]]:
+    """Cắt văn bản thành các chunk theo trang và tiêu đề.
+
+    Chunk không vượt qua ranh giới trang ("--- Trang N ---") hay tiêu đề; phần
+    overlap chỉ áp dụng giữa các chunk trong cùng một mục. Mỗi chunk là dict
+    gồm text, page, heading, start, end (vị trí ký tự trong `text`) và chunk_index.
+    Bộ nhớ dùng chỉ phụ thuộc chunk_size, không phụ thuộc độ dài tài liệu.
+    """
+    if not 0 <= chunk_overlap < chunk_size:
+        # The overlap alone would fill every chunk, cutting would never advance
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+
+    page: Optional[int] = None
+    heading: Optional[str] = None
+    pieces = []  # (start, end) of lines in the current chunk
+    size = 0
+    chunk_index = 0
+
+    def emit():
+        nonlocal chunk_index
+        start, end = pieces[0][0], pieces[-1][1]
+        chunk_text = text[start:end]
+        stripped = chunk_text.strip()
+        if not stripped:
+            return None
+        start += len(chunk_text) - len(chunk_text.lstrip())
+        chunk = {
+            "text": stripped,
+            "page": page,
+            "heading": heading,
+            "start": start,
+            "end": start + len(stripped),
+            "chunk_index": chunk_index,
+        }
+        chunk_index += 1
+        return chunk
+
+    def carry_overlap():
+        """Giữ lại tối đa chunk_overlap ký tự cuối cho chunk tiếp theo"""
+        kept, kept_size = [], 0
+        for start, end in reversed(pieces):
+            if kept_size >= chunk_overlap:
+                break
+            start = max(start, end - (chunk_overlap - kept_size))
+            kept.insert(0, (start, end))
+            kept_size += end - start
+        return kept, kept_size
+
+    for line_start, line in _iter_lines(text):
+        stripped = line.strip()
+
+        page_match = PAGE_MARKER.match(stripped)
+        if page_match or (stripped and HEADING.match(stripped)):
+            # Hard boundary: flush without overlap
+            if pieces:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+            pieces, size = [], 0
+            if page_match:
+                page = int(page_match.group(1))
+                heading = None
+                continue
+            heading = stripped[:200]
+
+        # Prefer to cut between lines; lines longer than a chunk are cut to fill it
+        line_end = line_start + len(line)
+        pos = line_start
+        while pos < line_end:
+            remaining = line_end - pos
+            if size + remaining <= chunk_size:
+                pieces.append((pos, line_end))
+                size += remaining
+                break
+
+            if remaining <= chunk_size and pieces and pos == line_start:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                pieces, size = carry_overlap()
+                if size + remaining > chunk_size:
+                    pieces, size = [], 0
+                continue
+
+            room = chunk_size - size
+            if room > 0:
+                pieces.append((pos, pos + room))
+                size += room
+                pos += room
+            chunk = emit()
+            if chunk:
+                yield chunk
+            pieces, size = carry_overlap()
+
+    if pieces:
+        chunk = emit()
+        if chunk:
+            yield chunk
@@ -0,0 +1,68 @@
+# app/services/document_pages.py
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Document, DocumentPage, TextContent
+from services.chunker import PAGE_MARKER
+from services.text_store import TextStore
+
+def split_pages(text: str) -> List[Tuple[int, int, int]]:
+    """Vị trí (page_number, start, end) của text từng trang trong `text`.
+
+    Trang được xác định bởi dấu "--- Trang N ---" (PDF và OCR); văn bản không có
+    dấu trang (DOCX, TXT...) được coi là một trang duy nhất.
+    """
+    markers = []
+    position = 0
+    for line in text.splitlines(keepends=True):
+        match = PAGE_MARKER.match(line.strip())
+        # Numbers must increase (page numbers are unique); anything else is part of the text
+        if match and (not markers or int(match.group(1)) > markers[-1][0]):
+            markers.append((int(match.group(1)), position, position + len(line)))
+        position += len(line)
+
+    if not markers:
+        return [(1, 0, len(text))] if text.strip() else []
+
+    pages = []
+    for index, (number, _, body_start) in enumerate(markers):
+        body_end = markers[index + 1][1] if index + 1 < len(markers) else len(text)
+        # Trim the blank lines around the page body, offsets still point into `text`
+        body = text[body_start:body_end]
+        start = body_start + len(body) - len(body.lstrip())
+        end = max(start, body_start + len(body.rstrip()))
+        pages.append((number, start, end))
+    return pages
+
+def set_document_text(db: Session, document: Document, text: str):
+    """Lưu text đã trích xuất của document (kho text nén) và tạo lại các dòng document_pages"""
+    set_document_content(document, TextStore.put(db, text or ""))
+
+def set_document_content(document: Document, content: TextContent):
+    """Như set_document_text, với text đã có trong kho (ví dụ của blob cùng nội dung)"""
+    text = content.text
+    document.text_content = content
+    document.is_processed = True
+    # Only the offsets: the text is already in the (compressed, shared) text store
+    document.pages = [
+        DocumentPage(document_id=document.id, page_number=number, char_start=start, char_end=end)
+        for number, start, end in split_pages(text)
+    ]
+
+def page_texts(content: Optional[TextContent], pages: List[DocumentPage]) -> List[str]:
+    """Text của các trang, cắt từ text của tài liệu (chỉ giải nén tới cuối trang cuối cùng)"""
+    if not pages or content is None:
+        return ["" for _ in pages]
+    text = TextStore.read_prefix(content, max(page.char_end for page in pages))
+    return [text[page.char_start:page.char_end] for page in pages]
+
+def get_pages(db: Session, document_id, start: int = 1, end: Optional[int] = None) -> List[DocumentPage]:
+    """Các trang [start, end] (tính cả hai đầu) của tài liệu"""
+    query = db.query(DocumentPage).filter(
+        DocumentPage.document_id == document_id,
+        DocumentPage.page_number >= start
+    )
+    if end is not None:
+        query = query.filter(DocumentPage.page_number <= end)
+    return query.order_by(DocumentPage.page_number).all()
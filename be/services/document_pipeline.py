@@ -0,0 +1,247 @@
+# app/services/document_pipeline.py
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from models import Document, FileBlob, IngestItem
+from database import settings, SessionLocal
+from services.blob_store import BlobStore
+from services.document_pages import set_document_text, set_document_content, split_pages
+
+# Stages run in this order; each records its status and timing in Document.processing_stages
+STAGES = ("extract", "ocr", "index")
+
+# Document.processing_status while a stage runs
+STAGE_STATUS = {"extract": "extracting", "ocr": "ocr", "index": "indexing"}
+
+TEXT_TYPES = ("PDF", "DOC", "DOCX", "TXT")
+OCR_TYPES = ("PDF", "JPG", "JPEG", "PNG")
+
+# In-process pipeline runs (no broker), referenced until done so they are not garbage collected
+_background_runs = set()
+
+
+class DocumentPipeline:
+    """Xử lý tài liệu sau khi upload: trích xuất text → OCR (nếu cần) → đánh index.
+
+    Mỗi bước là một hàm riêng để Celery chạy thành chuỗi task (xem
+    tasks.document_tasks), và tự bỏ qua khi không có việc: text đã có từ blob
+    cùng nội dung thì không trích xuất lại, PDF có text thì không OCR, bản sao
+    của tài liệu đã index thì chép chunk thay vì embed lại. Trạng thái, thời
+    gian và lỗi của từng bước được lưu vào Document.processing_stages.
+    """
+
+    def __init__(self, qa_service=None):
+        self.qa_service = qa_service
+
+    @staticmethod
+    def _load(db: Session, document_id) -> Optional[Document]:
+        return db.query(Document).filter(Document.id == UUID(str(document_id))).first()
+
+    @staticmethod
+    def _record(document: Document, stage: str, **values):
+        stages = dict(document.processing_stages or {})
+        stages[stage] = {**stages.get(stage, {}), **values}
+        # Reassign: in-place changes to a JSON column are not tracked
+        document.processing_stages = stages
+
+    @contextmanager
+    def _stage(self, db: Session, document: Document, stage: str):
+        """Ghi trạng thái running/completed/skipped/failed và thời gian của một bước"""
+
+        started = time.perf_counter()
+        document.processing_status = STAGE_STATUS[stage]
+        self._record(document, stage, status="running", started_at=datetime.utcnow().isoformat(), error=None)
+        db.commit()
+
+        result = {"status": "completed"}
+        try:
+            yield result
+        except Exception as e:
+            db.rollback()
+            document.processing_status = "failed"
+            self._record(
+                document, stage, status="failed", error=str(e)[:1000],
+                duration_ms=round((time.perf_counter() - started) * 1000)
+            )
+            _update_ingest_item(db, document.id, "failed", f"{stage}: {e}")
+            db.commit()
+            raise
+
+        self._record(document, stage, **result, duration_ms=round((time.perf_counter() - started) * 1000))
+        db.commit()
+
+    async def extract(self, document_id) -> bool:
+        """Bước 1: trích xuất text PDF/DOCX/TXT (dùng lại kết quả của blob cùng nội dung)"""
+
+        db = SessionLocal()
+        try:
+            document = self._load(db, document_id)
+            if not document:
+                return False
+
+            with self._stage(db, document, "extract") as result:
+                if document.text_hash:
+                    result.update(status="skipped", reason="text already available")
+                elif document.type.upper() not in TEXT_TYPES:
+                    result.update(status="skipped", reason="no text layer")
+                elif not document.file_path or not os.path.exists(document.file_path):
+                    raise FileNotFoundError("Stored file is missing")
+                else:
+                    from services.document_service import DocumentService, EXTRACTION_ERROR_PREFIXES
+                    text = await DocumentService().extract_text(db, document)
+                    if not text.startswith(EXTRACTION_ERROR_PREFIXES):
+                        set_document_text(db, document, text)
+                        result.update(chars=len(text), pages=len(split_pages(text)))
+                    elif document.type.upper() in OCR_TYPES:
+                        # A PDF pypdf cannot read may still OCR fine, let the next stage try
+                        result.update(status="failed", error=text)
+                    else:
+                        raise ValueError(text)
+            return True
+        finally:
+            db.close()
+
+    @staticmethod
+    def _needs_ocr(document: Document) -> bool:
+        file_type = document.type.upper()
+        if file_type not in OCR_TYPES:
+            return False
+        if file_type != "PDF":
+            return not document.text_hash
+        # Scanned PDFs have (almost) no text layer
+        extract = (document.processing_stages or {}).get("extract", {})
+        if "chars" not in extract:
+            return not document.text_hash
+        return extract["chars"] < settings.OCR_MIN_CHARS_PER_PAGE * max(extract.get("pages", 1), 1)
+
+    async def ocr(self, document_id) -> bool:
+        """Bước 2: OCR ảnh và PDF scan (không có lớp text)"""
+
+        db = SessionLocal()
+        try:
+            document = self._load(db, document_id)
+            if not document:
+                return False
+
+            with self._stage(db, document, "ocr") as result:
+                if not self._needs_ocr(document):
+                    result.update(status="skipped", reason="not needed")
+                    return True
+
+                blob = db.get(FileBlob, document.content_hash) if document.content_hash else None
+                if blob and blob.ocr_content is not None:
+                    set_document_content(document, blob.ocr_content)
+                    result.update(reused=True, chars=blob.ocr_content.length, confidence=blob.ocr_confidence)
+                    return True
+
+                from services.ocr_service import OCRService
+                ocr_service = OCRService()
+                if document.type.upper() == "PDF":
+                    text, confidence = await ocr_service._process_pdf(document.file_path)
+                else:
+                    text, confidence = await ocr_service._process_image(document.file_path)
+
+                set_document_text(db, document, text)
+                BlobStore.remember_ocr(db, document.content_hash, text, confidence)
+                result.update(chars=len(text), confidence=confidence)
+            return True
+        finally:
+            db.close()
+
+    async def index(self, document_id) -> bool:
+        """Bước 3: đánh index vector (chép chunk của bản trùng nội dung nếu có)"""
+
+        db = SessionLocal()
+        try:
+            document = self._load(db, document_id)
+            if not document:
+                return False
+
+            with self._stage(db, document, "index") as result:
+                text = document.extracted_text
+                if not text or not text.strip():
+                    raise ValueError("No text to index")
+
+                qa_service = self.qa_service
+                if qa_service is None:
+                    from services.qa_service import QAService
+                    qa_service = self.qa_service = QAService()
+
+                metadata = {
+                    "title": document.name,
+                    "type": document.type,
+                    "upload_date": document.upload_date.isoformat()
+                }
+                copied = await qa_service.index_document_from_duplicate(
+                    document.id, document.content_hash, text, metadata
+                )
+                if not copied and not await qa_service.index_document(document.id, text, metadata):
+                    raise RuntimeError("Could not index document")
+                result.update(copied_from_duplicate=copied)
+
+            document.processing_status = "completed"
+            _update_ingest_item(db, document.id, "processed")
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def run(self, document_id) -> bool:
+        """Chạy lần lượt mọi bước trong tiến trình hiện tại"""
+        for stage in STAGES:
+            if not await getattr(self, stage)(document_id):
+                return False
+        return True
+
+
+def _update_ingest_item(db: Session, document_id, status: str, error: str = None):
+    """Báo kết quả xử lý cho item của job nhập hàng loạt (nếu tài liệu đến từ đó)"""
+    db.query(IngestItem).filter(
+        IngestItem.document_id == UUID(str(document_id)),
+        IngestItem.status == "stored"
+    ).update({IngestItem.status: status, IngestItem.error: error}, synchronize_session=False)
+
+
+def enqueue_pipeline(document_ids: Iterable) -> bool:
+    """Đưa chuỗi task xử lý của từng tài liệu vào Celery; False nếu không kết nối được broker"""
+    try:
+        from celery import chain
+        from tasks.document_tasks import extract_document_text, ocr_document, index_document
+        for document_id in document_ids:
+            document_id = str(document_id)
+            chain(
+                extract_document_text.si(document_id),
+                ocr_document.si(document_id),
+                index_document.si(document_id)
+            ).apply_async()
+        return True
+    except Exception as e:
+        print(f"Warning: Could not queue document processing: {e}")
+        return False
+
+async def start_pipeline(document_ids: Iterable, qa_service=None):
+    """Xếp tài liệu vào pipeline xử lý; nếu không có Celery thì chạy nền trong tiến trình này"""
+    document_ids = [str(document_id) for document_id in document_ids]
+    # Publishing to the broker is blocking network I/O (and may wait on a reconnect)
+    if await asyncio.to_thread(enqueue_pipeline, document_ids):
+        return
+
+    pipeline = DocumentPipeline(qa_service)
+
+    async def run_all():
+        for document_id in document_ids:
+            try:
+                await pipeline.run(document_id)
+            except Exception as e:
+                print(f"Warning: Processing document {document_id} failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(run_all())
+    _background_runs.add(task)
+    task.add_done_callback(_background_runs.discard)
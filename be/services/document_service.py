@@ -1,101 +1,145 @@
 # app/services/document_service.py
 import os
+import uuid
 import shutil
+import asyncio
 import aiofiles
-from fastapi import HTTPException, UploadFile
+from fastapi import HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from typing import Optional, List
+from sqlalchemy import or_, and_, func
+from typing import Iterator, Optional, List
 from uuid import UUID
-import magic
 from datetime import datetime
 
-from models import Document, User, DocumentPermission
+from models import Document, User, DocumentPermission, VectorStore, FileBlob, DocumentPage
 from schemas import DocumentShare
 from database import settings
+from services.upload_stream import stream_multipart_file, StagedFile
+from services.blob_store import BlobStore
+from services.text_store import TextStore, text_contains
+from services.file_delivery import serve_file, strong_etag
+from services.previews import (
+    get_preview_cache, preview_key, PreviewUnavailable, PREVIEW_SIZES, PREVIEWABLE_TYPES, PREVIEW_CACHE_CONTROL
+)
+from services.extraction import get_extraction_executor
+from services.document_pages import set_document_text, set_document_content, get_pages, page_texts
+from services.document_pipeline import start_pipeline
+from services.folder_service import FolderService, normalize_path
+
+# Extractors report failures as text, such results are not cached on the blob
+EXTRACTION_ERROR_PREFIXES = ("Lỗi khi đọc", "Không thể trích xuất")
+
+# How often a preview request checks whether the Celery render has finished
+PREVIEW_POLL_SECONDS = 0.1
 
 class DocumentService:
-    def __init__(self):
+    def __init__(self, qa_service=None):
         self.upload_dir = settings.UPLOAD_DIR
+        # Used to drop a deleted document's chunks from the vector store
+        self.qa_service = qa_service
+        self.blob_store = BlobStore(self.upload_dir)
         os.makedirs(self.upload_dir, exist_ok=True)
 
-    async def upload_document(self, db: Session, file: UploadFile, user_id: UUID):
-        """Upload và lưu trữ tài liệu"""
-        
-        # Validate file
-        if not file.filename:
+    def _validate_filename(self, filename: str):
+        """Kiểm tra tên và phần mở rộng file trước khi nhận nội dung"""
+        if not filename:
             raise HTTPException(status_code=400, detail="Tên file không hợp lệ")
         
-        # Check file extension
-        file_ext = file.filename.split('.')[-1].lower()
+        file_ext = filename.split('.')[-1].lower()
         if file_ext not in settings.ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400, 
                 detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(settings.ALLOWED_EXTENSIONS)}"
             )
+
+    async def upload_document(self, db: Session, request: Request, user_id: UUID, folder: str = "root"):
+        """Upload và lưu trữ tài liệu (body được stream thẳng xuống đĩa)"""
         
-        # Check file size
-        file.file.seek(0, 2)  # Move to end of file
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset to beginning
-        
-        if file_size > settings.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File quá lớn. Kích thước tối đa: {settings.MAX_FILE_SIZE / (1024*1024):.0f}MB"
-            )
-        
-        # Create user directory
-        user_dir = os.path.join(self.upload_dir, str(user_id))
-        os.makedirs(user_dir, exist_ok=True)
+        folder = normalize_path(folder)
+        # Reject before reading the body when the user is already at the quota
+        FolderService.check_quota(db, user_id)
         
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
-        file_path = os.path.join(user_dir, safe_filename)
+        # Stream the multipart body into a staging file: constant memory per upload,
+        # size limit enforced while reading, sha256 and MIME type computed on the way
+        staged = await stream_multipart_file(
+            request,
+            staging_dir=os.path.join(self.upload_dir, ".staging"),
+            max_size=settings.MAX_FILE_SIZE,
+            validate_filename=self._validate_filename
+        )
+        return await self.create_document(db, staged, user_id, folder)
+
+    async def create_document(self, db: Session, staged: StagedFile, user_id: UUID, folder: str = "root"):
+        """Tạo Document từ file đã nhận đủ (upload thường hoặc upload nhiều phần)"""
         
         try:
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+            # Usage counters (and the quota) first: a rejected upload never reaches the blob store
+            FolderService.add_documents(db, user_id, normalize_path(folder), 1, staged.size, enforce_quota=True)
             
-            # Detect MIME type
-            mime_type = magic.from_file(file_path, mime=True)
-            
-            # Create document record
-            document = Document(
-                name=file.filename,
-                original_name=file.filename,
-                type=file_ext.upper(),
-                size=self._format_file_size(file_size),
-                file_path=file_path,
-                user_id=user_id,
-                doc_metadata={  # Use new column name
-                    "mime_type": mime_type,
-                    "file_size_bytes": file_size,
-                    "upload_timestamp": datetime.now().isoformat()
-                }
-            )
+            # Identical content is stored once: the document points at the shared blob
+            blob = self.blob_store.adopt(db, staged)
+            document = self.build_document(staged, blob, user_id, folder=folder)
             
             db.add(document)
             db.commit()
             db.refresh(document)
             
-            return {
-                "id": str(document.id),
-                "name": document.name,
-                "type": document.type,
-                "size": document.size,
-                "upload_date": document.upload_date.isoformat(),
-                "message": "File đã được tải lên thành công"
-            }
-            
+        except HTTPException:
+            db.rollback()
+            staged.discard()
+            raise
         except Exception as e:
-            # Clean up file if database save fails
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            db.rollback()
+            # Clean up the staging file if it was not moved into the blob store
+            staged.discard()
             raise HTTPException(status_code=500, detail=f"Lỗi khi lưu file: {str(e)}")
+        
+        # Extract → OCR if needed → index, in Celery (or in this process without a broker)
+        await start_pipeline([document.id], self.qa_service)
+        
+        return {
+            "id": str(document.id),
+            "name": document.name,
+            "type": document.type,
+            "size": document.size,
+            "upload_date": document.upload_date.isoformat(),
+            "folder": document.folder,
+            "processing_status": document.processing_status,
+            "message": "File đã được tải lên thành công"
+        }
+
+    def build_document(self, staged: StagedFile, blob: FileBlob, user_id: UUID, folder: str = "root") -> Document:
+        """Tạo (chưa lưu) Document trỏ tới blob đã nhận file staging"""
+        
+        filename = staged.filename
+        file_ext = filename.split('.')[-1].lower()
+        
+        document = Document(
+            id=uuid.uuid4(),
+            name=filename,
+            original_name=filename,
+            type=file_ext.upper(),
+            size=self._format_file_size(staged.size),
+            size_bytes=staged.size,
+            file_path=blob.path,
+            content_hash=blob.sha256,
+            folder=normalize_path(folder),
+            user_id=user_id,
+            processing_status="queued",
+            doc_metadata={  # Use new column name
+                "mime_type": staged.mime_type,
+                "file_size_bytes": staged.size,
+                "sha256": staged.sha256,
+                "upload_timestamp": datetime.now().isoformat()
+            }
+        )
+        
+        # Same content was extracted (or OCRed) before, no need to process the file again
+        content = blob.ocr_content or blob.text_content
+        if content is not None:
+            set_document_content(document, content)
+        
+        return document
 
     async def get_documents(
         self, 
@@ -128,7 +172,7 @@ class DocumentService:
             query = query.filter(
                 or_(
                     Document.name.ilike(f"%{search}%"),
-                    Document.extracted_text.ilike(f"%{search}%")
+                    text_contains(search)
                 )
             )
         
@@ -154,7 +198,9 @@ class DocumentService:
                     "folder": doc.folder,
                     "shared": doc.shared,
                     "is_processed": doc.is_processed,
-                    "is_owner": doc.user_id == user_id
+                    "processing_status": doc.processing_status,
+                    "is_owner": doc.user_id == user_id,
+                    "preview_url": f"/api/documents/{doc.id}/preview" if doc.type.upper() in PREVIEWABLE_TYPES else None
                 } for doc in documents
             ],
             "total": total,
@@ -176,20 +222,66 @@ class DocumentService:
         if not document:
             raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu hoặc bạn không có quyền xóa")
         
+        deleted_id = document.id
+        
         try:
-            # Delete physical file
-            if os.path.exists(document.file_path):
-                os.remove(document.file_path)
-            
-            # Delete from database
+            # Delete chunks and the document in one transaction
+            db.query(VectorStore).filter(
+                VectorStore.document_id == deleted_id
+            ).delete(synchronize_session=False)
+            db.query(DocumentPage).filter(
+                DocumentPage.document_id == deleted_id
+            ).delete(synchronize_session=False)
+            FolderService.document_removed(db, document)
             db.delete(document)
+            
+            if document.content_hash:
+                # Shared blob: the file is only removed when no other document uses it
+                self.blob_store.release(db, document.content_hash)
             db.commit()
             
-            return {"message": "Tài liệu đã được xóa thành công"}
+            # Files uploaded before the blob store are owned by a single document
+            if not document.content_hash and document.file_path and os.path.exists(document.file_path):
+                os.remove(document.file_path)
             
         except Exception as e:
             db.rollback()
             raise HTTPException(status_code=500, detail=f"Lỗi khi xóa tài liệu: {str(e)}")
+        
+        # Tombstone the vectors, a failure here only leaves garbage for compaction
+        if self.qa_service:
+            await self.qa_service.remove_document(deleted_id)
+        
+        return {"message": "Tài liệu đã được xóa thành công"}
+
+    async def move_document(self, db: Session, document_id: str, folder: str, user_id: UUID):
+        """Chuyển tài liệu sang thư mục khác"""
+        
+        document = db.query(Document).filter(
+            and_(
+                Document.id == document_id,
+                Document.user_id == user_id  # Only owner can move
+            )
+        ).first()
+        
+        if not document:
+            raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu hoặc bạn không có quyền chuyển")
+        
+        try:
+            FolderService.move_document(db, document, folder)
+            db.commit()
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi chuyển tài liệu: {str(e)}")
+        
+        return {
+            "id": str(document.id),
+            "folder": document.folder,
+            "message": "Tài liệu đã được chuyển"
+        }
 
     async def share_document(self, db: Session, document_id: str, share_data: DocumentShare, user_id: UUID):
         """Chia sẻ tài liệu với người dùng khác"""
@@ -242,10 +334,9 @@ class DocumentService:
             "permission": share_data.permission
         }
 
-    async def get_document_content(self, db: Session, document_id: str, user_id: UUID):
-        """Lấy nội dung tài liệu"""
+    def _get_accessible_document(self, db: Session, document_id: str, user_id: UUID) -> Document:
+        """Tài liệu của người dùng hoặc được chia sẻ cho họ, 404 nếu không có quyền"""
         
-        # Check if user has access to document
         document = db.query(Document).filter(
             and_(
                 Document.id == document_id,
@@ -265,6 +356,12 @@ class DocumentService:
         
         if not document:
             raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu hoặc bạn không có quyền truy cập")
+        return document
+
+    async def get_document_content(self, db: Session, document_id: str, user_id: UUID):
+        """Lấy nội dung tài liệu"""
+        
+        document = self._get_accessible_document(db, document_id, user_id)
         
         try:
             if document.extracted_text:
@@ -276,11 +373,10 @@ class DocumentService:
                 }
             else:
                 # If no extracted text, try to extract based on file type
-                content = await self._extract_text_from_file(document.file_path, document.type)
+                content = await self._extract_or_raise(db, document)
                 
                 # Save extracted text for future use
-                document.extracted_text = content
-                document.is_processed = True
+                set_document_text(db, document, content)
                 db.commit()
                 
                 return {
@@ -290,9 +386,168 @@ class DocumentService:
                     "type": document.type
                 }
                 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Lỗi khi đọc nội dung tài liệu: {str(e)}")
 
+    async def download_document(self, db: Session, request: Request, document_id: str, user_id: UUID):
+        """Tải file gốc của tài liệu (hỗ trợ Range và GET có điều kiện)"""
+        
+        document = self._get_accessible_document(db, document_id, user_id)
+        if not document.file_path or not os.path.exists(document.file_path):
+            raise HTTPException(status_code=404, detail="File tài liệu không tồn tại")
+        
+        return serve_file(
+            request,
+            document.file_path,
+            filename=document.original_name,
+            media_type=(document.doc_metadata or {}).get("mime_type"),
+            # Blobs are addressed by content, the hash is a strong validator
+            etag=strong_etag(document.content_hash) if document.content_hash else None
+        )
+
+    async def get_document_preview(
+        self,
+        db: Session,
+        request: Request,
+        document_id: str,
+        user_id: UUID,
+        page: int = 1,
+        size: str = "small"
+    ):
+        """Ảnh xem trước (WebP) của một trang tài liệu, render bởi Celery và lưu cache"""
+        
+        if size not in PREVIEW_SIZES:
+            raise HTTPException(status_code=400, detail=f"Kích thước không hợp lệ. Hỗ trợ: {', '.join(PREVIEW_SIZES)}")
+        
+        document = self._get_accessible_document(db, document_id, user_id)
+        if document.type.upper() not in PREVIEWABLE_TYPES:
+            raise HTTPException(status_code=404, detail="Không có ảnh xem trước cho loại tài liệu này")
+        
+        # Page count is known once the text has been extracted
+        last_page = db.query(func.max(DocumentPage.page_number)).filter(DocumentPage.document_id == document.id).scalar()
+        if last_page and page > last_page:
+            raise HTTPException(status_code=404, detail="Trang không tồn tại")
+        
+        cache = get_preview_cache()
+        key = preview_key(document)
+        path = cache.get(key, page, size)
+        
+        if path is None:
+            path = await self._wait_for_preview(cache, key, document, page, size)
+        
+        return serve_file(
+            request,
+            path,
+            filename=f"{os.path.splitext(document.name)[0]}-{page}-{size}.webp",
+            media_type="image/webp",
+            etag=strong_etag(f"{key}-p{page}-{size}"),
+            cache_control=PREVIEW_CACHE_CONTROL,
+            disposition="inline"
+        )
+
+    async def _wait_for_preview(self, cache, key: str, document: Document, page: int, size: str) -> str:
+        """Đưa việc render vào Celery rồi chờ ảnh xuất hiện trong cache (tối đa PREVIEW_WAIT_SECONDS)"""
+        
+        try:
+            from tasks.preview_tasks import render_document_preview
+            render_document_preview.delay(str(document.id), page)
+        except Exception as e:
+            # No worker available (e.g. local development): render here, off the event loop
+            print(f"Warning: Could not queue preview rendering, rendering inline: {e}")
+            try:
+                await asyncio.to_thread(cache.render, key, document.file_path, document.type, page)
+            except PreviewUnavailable:
+                raise HTTPException(status_code=404, detail="Trang không tồn tại")
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Lỗi khi tạo ảnh xem trước: {str(e)}")
+            return cache.path_for(key, page, size)
+        
+        deadline = asyncio.get_running_loop().time() + settings.PREVIEW_WAIT_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(PREVIEW_POLL_SECONDS)
+            path = cache.get(key, page, size)
+            if path:
+                return path
+        
+        raise HTTPException(
+            status_code=503,
+            detail="Ảnh xem trước đang được tạo, vui lòng thử lại sau",
+            headers={"Retry-After": "2"}
+        )
+
+    async def get_document_text_stream(self, db: Session, document_id: str, user_id: UUID) -> Iterator[str]:
+        """Text đã trích xuất của tài liệu theo từng đoạn, giải nén dần khi gửi đi"""
+        
+        document = self._get_accessible_document(db, document_id, user_id)
+        if document.text_content is None:
+            raise HTTPException(status_code=404, detail="Tài liệu chưa được trích xuất nội dung")
+        return TextStore.iter_text(document.text_content)
+
+    async def get_document_pages(
+        self,
+        db: Session,
+        document_id: str,
+        user_id: UUID,
+        start: int = 1,
+        end: Optional[int] = None
+    ):
+        """Text của các trang [start, end] của tài liệu, không tải toàn bộ extracted_text"""
+        
+        document = self._get_accessible_document(db, document_id, user_id)
+        
+        pages = get_pages(db, document.id, start, end)
+        if not pages and not db.query(DocumentPage.id).filter(DocumentPage.document_id == document.id).first():
+            # Documents processed before per-page storage: split their text once
+            text = document.extracted_text or await self._extract_or_raise(db, document)
+            set_document_text(db, document, text)
+            db.commit()
+            pages = get_pages(db, document.id, start, end)
+        
+        return {
+            "id": str(document.id),
+            "name": document.name,
+            "total_pages": db.query(DocumentPage).filter(DocumentPage.document_id == document.id).count(),
+            "pages": [
+                {
+                    "page": page.page_number,
+                    "content": content,
+                    "start": page.char_start,
+                    "end": page.char_end
+                } for page, content in zip(pages, page_texts(document.text_content, pages))
+            ]
+        }
+
+    async def extract_text(self, db: Session, document: Document) -> str:
+        """Trích xuất text của tài liệu, dùng lại kết quả đã có của blob cùng nội dung"""
+        
+        blob = db.get(FileBlob, document.content_hash) if document.content_hash else None
+        if blob and blob.text_content is not None:
+            return blob.text_content.text
+        
+        content = await self._extract_text_from_file(document.file_path, document.type)
+        if not content.startswith(EXTRACTION_ERROR_PREFIXES):
+            self.blob_store.remember_text(db, document.content_hash, content)
+        return content
+
+    async def _extract_or_raise(self, db: Session, document: Document) -> str:
+        """Như extract_text, nhưng báo lỗi 422 thay vì trả về thông báo lỗi như thể đó là nội dung
+        (thông báo lỗi không bao giờ được lưu làm text của tài liệu)"""
+        
+        content = await self.extract_text(db, document)
+        if content.startswith(EXTRACTION_ERROR_PREFIXES):
+            raise HTTPException(status_code=422, detail=content)
+        return content
+
+    @staticmethod
+    def _index_metadata(document: Document) -> dict:
+        return {
+            "title": document.name,
+            "type": document.type,
+            "upload_date": document.upload_date.isoformat()
+        }
+
     async def _extract_text_from_file(self, file_path: str, file_type: str) -> str:
         """Trích xuất text từ file dựa vào loại file"""
         
@@ -306,26 +561,16 @@ class DocumentService:
             return "Không thể trích xuất text từ loại file này"
 
     async def _extract_from_pdf(self, file_path: str) -> str:
-        """Trích xuất text từ PDF"""
+        """Trích xuất text từ PDF (chạy trong process pool)"""
         try:
-            from pypdf import PdfReader
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            return await get_extraction_executor().extract("PDF", file_path)
         except Exception as e:
             return f"Lỗi khi đọc PDF: {str(e)}"
 
     async def _extract_from_docx(self, file_path: str) -> str:
-        """Trích xuất text từ DOCX"""
+        """Trích xuất text từ DOCX (chạy trong process pool)"""
         try:
-            from docx import Document as DocxDocument
-            doc = DocxDocument(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
+            return await get_extraction_executor().extract("DOCX", file_path)
         except Exception as e:
             return f"Lỗi khi đọc DOCX: {str(e)}"
 
@@ -0,0 +1,46 @@
+# app/services/embedding_codec.py
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Compact binary formats for embeddings:
+#   float32 - 4 bytes/dim, exact
+#   float16 - 2 bytes/dim, ~3 significant digits
+#   int8    - 1 byte/dim + one float32 scale per vector (x ~= code * scale)
+EMBEDDING_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Lượng tử hoá ma trận (n x dim) float32, trả về (codes, scales hoặc None)"""
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype != "int8":
+        return vectors.astype(EMBEDDING_DTYPES[dtype]), None
+
+    # Symmetric scalar quantization with one scale per vector
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[..., None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Giải lượng tử về float32"""
+    vectors = np.asarray(codes).astype(np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[..., None]
+    return vectors
+
+def encode_embedding(embedding, dtype: str) -> Tuple[bytes, Optional[float]]:
+    """Mã hoá một embedding thành bytes để lưu trong cột embedding_blob"""
+    codes, scales = quantize(np.asarray(embedding, dtype=np.float32)[None, :], dtype)
+    return codes[0].tobytes(), (float(scales[0]) if scales is not None else None)
+
+def decode_embedding(blob: bytes, dtype: str, scale: Optional[float] = None) -> np.ndarray:
+    """Giải mã embedding_blob về vector float32"""
+    codes = np.frombuffer(blob, dtype=EMBEDDING_DTYPES[dtype])
+    return dequantize(codes[None, :], None if scale is None else np.array([scale]))[0]
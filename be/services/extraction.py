@@ -0,0 +1,253 @@
+# app/services/extraction.py
+import asyncio
+import multiprocessing
+import resource
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+# PDF/DOCX parsing is CPU bound and runs for seconds on large files. It runs in
+# worker processes so it neither blocks the event loop nor holds the GIL, and so
+# a pathological file can be killed without taking the API down with it.
+# Only the standard library is imported at module level: spawned workers import
+# this module and should start quickly.
+
+# Extra time the parent waits after the worker's own deadline before killing it
+KILL_GRACE_SECONDS = 5
+
+# Large PDFs are split into one page range per worker. Every range re-opens and
+# re-parses the file, so ranges are never shorter than this
+MIN_PAGES_PER_TASK = 25
+
+
+class ExtractionError(Exception):
+    """Không trích xuất được text (file lỗi, vượt giới hạn bộ nhớ, worker bị dừng...)"""
+
+
+class ExtractionTimeout(ExtractionError):
+    """Trích xuất vượt quá thời gian cho phép"""
+
+
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path: str, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """Text của các trang [start, end) của PDF"""
+    from pypdf import PdfReader
+    pages = PdfReader(path).pages
+    end = len(pages) if end is None else min(end, len(pages))
+    return [(pages[i].extract_text() or "").strip() for i in range(start, end)]
+
+def join_pages(pages: List[str]) -> str:
+    """Ghép text các trang với dấu trang "--- Trang N ---" (như kết quả OCR), một lần cấp phát"""
+    return "\n\n".join(f"--- Trang {number} ---\n{text}" for number, text in enumerate(pages, 1))
+
+def extract_pdf(path: str) -> str:
+    return join_pages(extract_pdf_pages(path))
+
+def extract_docx(path: str) -> str:
+    from docx import Document as DocxDocument
+    doc = DocxDocument(path)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs).strip()
+
+EXTRACTORS = {
+    "PDF": extract_pdf,
+    "DOC": extract_docx,
+    "DOCX": extract_docx,
+}
+
+
+@contextmanager
+def _deadline(seconds: Optional[float]):
+    """Ngắt công việc bằng SIGALRM sau `seconds` giây (chỉ có tác dụng ở main thread)"""
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise ExtractionTimeout(f"Extraction exceeded {seconds:g}s")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def run_with_deadline(timeout: Optional[float], func: Callable, *args):
+    """Chạy func(*args) với deadline; dùng được cả trong worker lẫn inline"""
+    try:
+        with _deadline(timeout):
+            return func(*args)
+    except MemoryError:
+        raise ExtractionError("Extraction exceeded the worker memory limit")
+
+@contextmanager
+def _address_space_cap(memory_limit_mb: int):
+    """Tạm giới hạn address space của chính process này ở mức hiện tại + memory_limit_mb
+    (trích xuất inline), vượt quá thì cấp phát ném MemoryError thay vì process bị kill"""
+    try:
+        with open("/proc/self/statm") as f:
+            used = int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        used = None
+    if not memory_limit_mb or used is None:
+        yield
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = used + memory_limit_mb * 1024 * 1024
+    for current in (soft, hard):
+        if current != resource.RLIM_INFINITY:
+            limit = min(limit, current)
+    # Only the soft limit is lowered, so it can be raised back afterwards
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+def _init_worker(memory_limit_mb: int):
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ExtractionExecutor:
+    """Process pool trích xuất text, giới hạn thời gian và bộ nhớ cho từng file.
+
+    Mỗi worker bị giới hạn address space (RLIMIT_AS) và mỗi file có deadline
+    riêng. PDF lớn được chia thành các khoảng trang chạy song song trên các
+    worker rồi ghép lại theo thứ tự trang. Số tác vụ chạy đồng thời không vượt
+    quá số worker. Nếu worker không dừng khi hết giờ
+    (kẹt trong C code) hoặc chết, pool bị huỷ và tạo lại ở lần gọi sau.
+
+    Trong worker Celery (process daemon, không được tạo process con) việc trích
+    xuất chạy inline, không chia trang, với cùng deadline và cùng giới hạn bộ nhớ
+    (soft RLIMIT_AS của chính worker, hạ xuống trong lúc trích xuất rồi trả lại);
+    worker_max_memory_per_child trong celery_app thay các worker đã phình to.
+    """
+
+    def __init__(self, workers: int, timeout: float, memory_limit_mb: int = 0):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots = None  # (event loop, semaphore)
+
+    @staticmethod
+    def inline_only() -> bool:
+        # Celery prefork children are daemonic and cannot start worker processes
+        return multiprocessing.current_process().daemon
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a process that runs threads (uvicorn, DB pools) is unsafe
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,)
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # Workers stuck in native code ignore the alarm, so kill them outright
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots[0] is not loop:
+            self._slots = (loop, asyncio.Semaphore(self.workers))
+        return self._slots[1]
+
+    async def _submit(self, deadline: float, func: Callable, *args):
+        """Chạy func trong pool với phần thời gian còn lại đến deadline (theo loop.time())"""
+        async with self._get_slots():
+            loop = asyncio.get_running_loop()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise ExtractionTimeout(f"Extraction exceeded {self.timeout:g}s")
+
+            pool = self._get_pool()
+            future = loop.run_in_executor(pool, run_with_deadline, remaining, func, *args)
+            try:
+                return await asyncio.wait_for(future, remaining + KILL_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                self._reset_pool(pool)
+                raise ExtractionTimeout(f"Extraction exceeded {self.timeout:g}s")
+            except BrokenProcessPool:
+                # Worker died, usually killed for exceeding its memory
+                self._reset_pool(pool)
+                raise ExtractionError("Extraction worker terminated unexpectedly")
+
+    async def extract(self, file_type: str, path: str) -> str:
+        file_type = file_type.upper()
+        if file_type not in EXTRACTORS:
+            raise ExtractionError(f"Unsupported file type: {file_type}")
+
+        if self.inline_only():
+            # Nothing else runs on a Celery task's event loop, blocking it is fine
+            with _address_space_cap(self.memory_limit_mb):
+                return run_with_deadline(self.timeout, EXTRACTORS[file_type], path)
+
+        # The timeout covers the whole file, however many page ranges it is split into
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        if file_type == "PDF":
+            return join_pages(await self._extract_pdf_pages(deadline, path))
+        return await self._submit(deadline, EXTRACTORS[file_type], path)
+
+    async def _extract_pdf_pages(self, deadline: float, path: str) -> List[str]:
+        """Chia PDF thành các khoảng trang liên tiếp và trích xuất song song trên các worker"""
+        count = await self._submit(deadline, pdf_page_count, path)
+        size = max(MIN_PAGES_PER_TASK, -(-count // self.workers))
+        if count <= size:
+            return await self._submit(deadline, extract_pdf_pages, path, 0, count)
+
+        ranges = await asyncio.gather(*(
+            self._submit(deadline, extract_pdf_pages, path, start, start + size)
+            for start in range(0, count, size)
+        ))
+        return [page for pages in ranges for page in pages]
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            self._reset_pool(pool)
+
+
+_executor: Optional[ExtractionExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_extraction_executor() -> ExtractionExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from database import settings
+                _executor = ExtractionExecutor(
+                    workers=settings.EXTRACTION_WORKERS,
+                    timeout=settings.EXTRACTION_TIMEOUT,
+                    memory_limit_mb=settings.EXTRACTION_MEMORY_LIMIT_MB
+                )
+    return _executor
+
+def shutdown_extraction_executor():
+    """Dừng các worker trích xuất (gọi khi tắt server)"""
+    if _executor is not None:
+        _executor.shutdown()
@@ -0,0 +1,96 @@
+# app/services/fake_llm.py
+import asyncio
+import hashlib
+import re
+import time
+from typing import List
+
+import numpy as np
+
+# Offline, deterministic backends for benchmarking the QA pipeline without API
+# keys or a running Ollama (LLM_BACKEND=fake, EMBEDDING_BACKEND=hash).
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+class HashEmbeddings:
+    """Embedding bằng feature hashing: cùng văn bản luôn cho cùng vector.
+
+    Mỗi từ và cặp từ liền nhau được băm vào một chiều (kèm dấu), nên các đoạn có
+    nhiều từ chung vẫn gần nhau và vector search cho kết quả có nghĩa.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        tokens = _tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+def fake_answer(prompt: str, max_tokens: int) -> List[str]:
+    """Câu trả lời xác định, lấy từ phần ngữ cảnh trong prompt"""
+    context = prompt.split("Ngữ cảnh từ các tài liệu:", 1)[-1]
+    words = re.findall(r'\S+', context)[:max_tokens] or ["Không", "có", "ngữ", "cảnh."]
+    return ["Dựa", " trên", " tài", " liệu:"] + [f" {word}" for word in words]
+
+
+def create_fake_llm(first_token_latency_ms: int, tokens_per_second: float, max_tokens: int = 128):
+    """Tạo LLM giả (LangChain LLM) có độ trễ token đầu và tốc độ sinh token cấu hình được"""
+    from langchain_core.language_models.llms import LLM
+    from langchain_core.outputs import GenerationChunk
+
+    class FakeStreamingLLM(LLM):
+        first_token_latency: float
+        token_interval: float
+        max_tokens: int
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-streaming"
+
+        def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+            tokens = fake_answer(prompt, self.max_tokens)
+            time.sleep(self.first_token_latency + self.token_interval * len(tokens))
+            return "".join(tokens)
+
+        def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.first_token_latency)
+            for token in fake_answer(prompt, self.max_tokens):
+                yield GenerationChunk(text=token)
+                time.sleep(self.token_interval)
+
+        async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.first_token_latency)
+            for token in fake_answer(prompt, self.max_tokens):
+                yield GenerationChunk(text=token)
+                await asyncio.sleep(self.token_interval)
+
+    return FakeStreamingLLM(
+        first_token_latency=first_token_latency_ms / 1000.0,
+        token_interval=1.0 / tokens_per_second if tokens_per_second > 0 else 0.0,
+        max_tokens=max_tokens
+    )
@@ -0,0 +1,180 @@
+# app/services/file_delivery.py
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import FileResponse, Response
+
+from database import settings
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Downloads need a valid token, so browsers may keep a copy but must revalidate it (cheap with ETag)
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse chỉ gửi khoảng byte [offset, offset + length) của file (206 Partial Content)"""
+
+    def __init__(self, path: str, offset: int, length: int, **kwargs):
+        self.offset = offset
+        self.length = length
+        super().__init__(path, status_code=206, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("content-length", str(self.length))
+        super().set_stat_headers(stat_result)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # File shrank underneath us, end the response rather than hang the client
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+def strong_etag(value: str) -> str:
+    return f'"{value}"'
+
+def stat_etag(stat_result: os.stat_result, key: str = "") -> str:
+    """ETag cho file không có hash nội dung; file đã lưu không bị ghi đè nên mtime/size đủ phân biệt"""
+    return strong_etag(f"{key}{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}")
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Khoảng byte (offset, length) của header Range, None nếu gửi cả file.
+
+    Chỉ hỗ trợ một khoảng; nhiều khoảng (multipart/byteranges) được trả cả file,
+    điều RFC 9110 cho phép. Khoảng nằm ngoài file trả 416.
+    """
+    match = RANGE_HEADER.match((header or "").strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = min(int(end), size)
+        if length == 0:
+            raise HTTPException(status_code=416, detail="Khoảng byte không hợp lệ", headers={"Content-Range": f"bytes */{size}"})
+        return size - length, length
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Khoảng byte không hợp lệ", headers={"Content-Range": f"bytes */{size}"})
+    return start, end - start + 1
+
+def _not_modified(request: Request, etag: str, stat_result: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _accel_path(path: str) -> Optional[str]:
+    """Đường dẫn nội bộ cho X-Accel-Redirect nếu file nằm trong UPLOAD_DIR và đã cấu hình prefix"""
+    prefix = settings.DOWNLOAD_ACCEL_PREFIX
+    if not prefix:
+        return None
+    root = os.path.realpath(settings.UPLOAD_DIR)
+    real = os.path.realpath(path)
+    if os.path.commonpath([root, real]) != root:
+        return None
+    return prefix.rstrip("/") + "/" + os.path.relpath(real, root).replace(os.sep, "/")
+
+def serve_file(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: Optional[str] = None,
+    etag: Optional[str] = None,
+    cache_control: str = DOWNLOAD_CACHE_CONTROL,
+    disposition: str = "attachment"
+) -> Response:
+    """Trả file (sau khi đã kiểm tra quyền) với ETag, GET có điều kiện và Range.
+
+    Khi cấu hình DOWNLOAD_ACCEL_PREFIX, nginx gửi file qua X-Accel-Redirect
+    (sendfile, tự xử lý Range) và worker API không đọc byte nào của file. Nếu
+    không, file được đọc từng khối 64KB, không bao giờ nạp cả file vào bộ nhớ.
+    """
+
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File không tồn tại")
+
+    etag = etag or stat_etag(stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes"
+    }
+
+    if _not_modified(request, etag, stat_result):
+        return Response(status_code=304, headers=headers)
+
+    accel_path = _accel_path(path)
+    if accel_path:
+        # nginx serves the bytes (and ranges) from its internal location, keeping these headers
+        headers["X-Accel-Redirect"] = accel_path
+        headers["Content-Disposition"] = content_disposition(filename, disposition)
+        return Response(headers=headers, media_type=media_type or guess_type(filename)[0])
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # A stale If-Range means the client's partial copy is outdated: send the whole file
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range(request.headers.get("range"), stat_result.st_size)
+
+    if byte_range is None:
+        return FileResponse(
+            path, headers=headers, media_type=media_type, filename=filename,
+            stat_result=stat_result, method=request.method, content_disposition_type=disposition
+        )
+
+    offset, length = byte_range
+    headers["Content-Range"] = f"bytes {offset}-{offset + length - 1}/{stat_result.st_size}"
+    return RangeFileResponse(
+        path, offset, length, headers=headers, media_type=media_type, filename=filename,
+        stat_result=stat_result, method=request.method, content_disposition_type=disposition
+    )
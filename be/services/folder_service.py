@@ -0,0 +1,368 @@
+# app/services/folder_service.py
+import uuid
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, func, literal, true, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Document, Folder, User
+from database import settings
+
+ROOT = "root"
+MAX_PATH_LENGTH = 500
+MAX_DEPTH = 32
+
+# The character right after "/" in byte order: everything below "a/b" sorts in ["a/b/", "a/b0")
+_AFTER_SEPARATOR = chr(ord("/") + 1)
+
+
+def normalize_path(path: Optional[str]) -> str:
+    """Chuẩn hoá đường dẫn thư mục: "/a//b/" → "a/b", rỗng hoặc "/" → "root" """
+    parts = [part.strip() for part in (path or "").replace("\\", "/").split("/")]
+    parts = [part for part in parts if part]
+    # "root/a" is the folder a at the top level
+    if parts and parts[0] == ROOT:
+        parts = parts[1:]
+    if any(part in (".", "..") for part in parts) or len(parts) > MAX_DEPTH:
+        raise HTTPException(status_code=400, detail="Đường dẫn thư mục không hợp lệ")
+
+    path = "/".join(parts)
+    if len(path) > MAX_PATH_LENGTH:
+        raise HTTPException(status_code=400, detail="Đường dẫn thư mục quá dài")
+    return path or ROOT
+
+def join_path(parent: str, name: str) -> str:
+    return name if parent == ROOT else f"{parent}/{name}"
+
+def parent_path(path: str) -> str:
+    return path.rsplit("/", 1)[0] if "/" in path else ROOT
+
+def ancestor_paths(path: str) -> List[str]:
+    """"a/b/c" → ["root", "a", "a/b", "a/b/c"]"""
+    if path == ROOT:
+        return [ROOT]
+    parts = path.split("/")
+    return [ROOT] + ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+def in_subtree(column, path: str):
+    """Điều kiện "column nằm trong thư mục path hoặc thư mục con", dạng khoảng trên index (không dùng LIKE)"""
+    if path == ROOT:
+        return true()
+    return or_(column == path, and_(column >= path + "/", column < path + _AFTER_SEPARATOR))
+
+def document_bytes(document: Document) -> int:
+    return document.size_bytes or 0
+
+def group_by_folder(entries) -> Dict[Tuple[UUID, str], Tuple[int, int]]:
+    """(user_id, folder, size_bytes) → {(user_id, folder): (số tài liệu, dung lượng)}, để cập nhật mỗi thư mục một lần"""
+    totals = {}
+    for user_id, folder, size_bytes in entries:
+        count, total = totals.get((user_id, folder), (0, 0))
+        totals[(user_id, folder)] = (count + 1, total + size_bytes)
+    return totals
+
+def quota_exceeded_error(quota: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Vượt quá dung lượng lưu trữ cho phép ({quota / (1024*1024):.0f}MB)"
+    )
+
+
+class FolderService:
+    """Cây thư mục của người dùng, lưu dạng materialized path.
+
+    Mỗi thư mục giữ số tài liệu và dung lượng của riêng nó và của cả cây con;
+    các số này được cộng dồn khi upload, xoá hay chuyển tài liệu/thư mục
+    (UPDATE trên các thư mục cha, số thư mục cha bằng độ sâu), nên xem một thư
+    mục không phải đếm lại hàng chục nghìn tài liệu bên dưới. Thư mục "root"
+    của mỗi người dùng cũng là một dòng, tổng của nó là dung lượng người dùng
+    đang dùng (hạn mức được kiểm tra trên dòng này).
+    """
+
+    @staticmethod
+    def _validate_name(name: Optional[str]) -> str:
+        name = (name or "").strip()
+        if not name or name in (".", "..", ROOT) or "/" in name or "\\" in name or len(name) > 255:
+            raise HTTPException(status_code=400, detail="Tên thư mục không hợp lệ")
+        return name
+
+    @staticmethod
+    def ensure_path(db: Session, user_id: UUID, path: str) -> Folder:
+        """Tạo (chưa commit) các thư mục còn thiếu trên đường dẫn, trả về thư mục cuối cùng"""
+
+        paths = ancestor_paths(path)
+        existing = {
+            folder.path: folder
+            for folder in db.query(Folder).filter(Folder.user_id == user_id, Folder.path.in_(paths))
+        }
+
+        parent = None
+        for depth, folder_path in enumerate(paths):
+            folder = existing.get(folder_path)
+            if folder is None:
+                folder = Folder(
+                    id=uuid.uuid4(),
+                    user_id=user_id,
+                    parent_id=parent.id if parent else None,
+                    name=folder_path.rsplit("/", 1)[-1],
+                    path=folder_path,
+                    depth=depth
+                )
+                try:
+                    with db.begin_nested():
+                        db.add(folder)
+                except IntegrityError:
+                    # Created concurrently by another request
+                    folder = db.query(Folder).filter(Folder.user_id == user_id, Folder.path == folder_path).one()
+            parent = folder
+        return parent
+
+    @staticmethod
+    def apply_delta(db: Session, user_id: UUID, path: str, count: int, size_bytes: int, include_self: bool = True):
+        """Cộng số tài liệu và dung lượng vào thư mục path và các thư mục cha (chưa commit).
+
+        Dùng UPDATE cộng dồn trong SQL chứ không đọc rồi ghi lại, nên các upload
+        đồng thời vào cùng thư mục không ghi đè số của nhau.
+        """
+        if not count and not size_bytes:
+            return
+
+        paths = ancestor_paths(path) if include_self else ancestor_paths(parent_path(path))
+        db.query(Folder).filter(Folder.user_id == user_id, Folder.path.in_(paths)).update({
+            Folder.subtree_document_count: Folder.subtree_document_count + count,
+            Folder.subtree_bytes: Folder.subtree_bytes + size_bytes
+        }, synchronize_session=False)
+        if include_self:
+            db.query(Folder).filter(Folder.user_id == user_id, Folder.path == path).update({
+                Folder.document_count: Folder.document_count + count,
+                Folder.total_bytes: Folder.total_bytes + size_bytes
+            }, synchronize_session=False)
+
+    @classmethod
+    def add_documents(
+        cls, db: Session, user_id: UUID, path: str, count: int, size_bytes: int, enforce_quota: bool = False
+    ):
+        cls.ensure_path(db, user_id, path)
+        cls.apply_delta(db, user_id, path, count, size_bytes)
+        if enforce_quota and size_bytes > 0:
+            # The UPDATE above holds the root row lock until commit, so concurrent uploads
+            # of the same user are checked one after the other against the new total
+            cls.check_quota(db, user_id)
+
+    @staticmethod
+    def usage(db: Session, user_id: UUID) -> Tuple[int, int]:
+        """(số tài liệu, số byte) người dùng đang dùng, đọc từ dòng root"""
+        row = db.query(Folder.subtree_document_count, Folder.subtree_bytes).filter(
+            Folder.user_id == user_id, Folder.path == ROOT
+        ).first()
+        return (row[0], row[1]) if row else (0, 0)
+
+    @classmethod
+    def locked_usage(cls, db: Session, user_id: UUID) -> int:
+        """Số byte đang dùng, khoá dòng root tới khi commit (kiểm tra hạn mức cho nhiều file một lúc)"""
+        cls.ensure_path(db, user_id, ROOT)
+        return db.query(Folder.subtree_bytes).filter(
+            Folder.user_id == user_id, Folder.path == ROOT
+        ).with_for_update().scalar() or 0
+
+    @staticmethod
+    def quota(db: Session, user_id: UUID) -> int:
+        """Hạn mức dung lượng của người dùng (byte), 0 là không giới hạn"""
+        quota = db.query(User.storage_quota_bytes).filter(User.id == user_id).scalar()
+        return quota if quota is not None else settings.STORAGE_QUOTA_BYTES
+
+    @classmethod
+    def check_quota(cls, db: Session, user_id: UUID, incoming_bytes: int = 0):
+        """413 nếu dung lượng đang dùng cộng incoming_bytes vượt hạn mức"""
+        quota = cls.quota(db, user_id)
+        if quota and cls.usage(db, user_id)[1] + incoming_bytes > quota:
+            raise quota_exceeded_error(quota)
+
+    @classmethod
+    def document_added(cls, db: Session, document: Document):
+        cls.add_documents(db, document.user_id, document.folder or ROOT, 1, document_bytes(document))
+
+    @classmethod
+    def document_removed(cls, db: Session, document: Document):
+        cls.apply_delta(db, document.user_id, document.folder or ROOT, -1, -document_bytes(document))
+
+    @classmethod
+    def move_document(cls, db: Session, document: Document, path: str):
+        """Chuyển tài liệu sang thư mục khác (tạo thư mục nếu chưa có, chưa commit)"""
+        path = normalize_path(path)
+        if path == (document.folder or ROOT):
+            return
+        cls.document_removed(db, document)
+        document.folder = path
+        cls.document_added(db, document)
+
+    @staticmethod
+    def _folder_info(folder: Folder) -> Dict:
+        return {
+            "id": str(folder.id),
+            "name": folder.name,
+            "path": folder.path,
+            "parent_id": str(folder.parent_id) if folder.parent_id else None,
+            "document_count": folder.document_count,
+            "total_bytes": folder.total_bytes,
+            "subtree_document_count": folder.subtree_document_count,
+            "subtree_bytes": folder.subtree_bytes,
+            "created_at": folder.created_at.isoformat() if folder.created_at else None
+        }
+
+    def _get_own_folder(self, db: Session, folder_id: str, user_id: UUID) -> Folder:
+        folder = db.query(Folder).filter(Folder.id == folder_id, Folder.user_id == user_id).first()
+        if not folder:
+            raise HTTPException(status_code=404, detail="Không tìm thấy thư mục")
+        return folder
+
+    async def get_folder(self, db: Session, user_id: UUID, path: str = ROOT, page: int = 1, limit: int = 50):
+        """Nội dung một thư mục: tổng của nó, các thư mục con và một trang tài liệu nằm trực tiếp trong đó"""
+
+        path = normalize_path(path)
+        folder = db.query(Folder).filter(Folder.user_id == user_id, Folder.path == path).first()
+        if folder is None:
+            if path != ROOT:
+                raise HTTPException(status_code=404, detail="Không tìm thấy thư mục")
+            # Nothing uploaded yet, the root row is created with the first document
+            return {"folder": None, "folders": [], "documents": [], "total": 0, "page": page, "limit": limit, "pages": 0}
+
+        children = db.query(Folder).filter(Folder.parent_id == folder.id).order_by(Folder.name).all()
+
+        # Served by ix_documents_user_folder, the total comes from the folder row
+        documents = db.query(Document).filter(
+            Document.user_id == user_id,
+            Document.folder == path
+        ).order_by(Document.upload_date.desc()).offset((page - 1) * limit).limit(limit).all()
+
+        return {
+            "folder": self._folder_info(folder),
+            "folders": [self._folder_info(child) for child in children],
+            "documents": [
+                {
+                    "id": str(doc.id),
+                    "name": doc.name,
+                    "type": doc.type,
+                    "size": doc.size,
+                    "upload_date": doc.upload_date.isoformat(),
+                    "processing_status": doc.processing_status
+                } for doc in documents
+            ],
+            "total": folder.document_count,
+            "page": page,
+            "limit": limit,
+            "pages": (folder.document_count + limit - 1) // limit
+        }
+
+    async def get_usage(self, db: Session, user_id: UUID):
+        """Dung lượng đang dùng, hạn mức và tổng của từng thư mục cấp một"""
+
+        document_count, used_bytes = self.usage(db, user_id)
+        quota = self.quota(db, user_id)
+        folders = db.query(Folder).filter(
+            Folder.user_id == user_id, Folder.depth == 1
+        ).order_by(Folder.subtree_bytes.desc()).all()
+
+        return {
+            "document_count": document_count,
+            "used_bytes": used_bytes,
+            "quota_bytes": quota or None,
+            "used_percent": round(used_bytes * 100 / quota, 1) if quota else None,
+            "folders": [self._folder_info(folder) for folder in folders]
+        }
+
+    async def create_folder(self, db: Session, user_id: UUID, name: str, parent: str = ROOT):
+        """Tạo thư mục mới trong thư mục parent"""
+
+        path = join_path(normalize_path(parent), self._validate_name(name))
+        if len(path) > MAX_PATH_LENGTH:
+            raise HTTPException(status_code=400, detail="Đường dẫn thư mục quá dài")
+        if db.query(Folder.id).filter(Folder.user_id == user_id, Folder.path == path).first():
+            raise HTTPException(status_code=400, detail="Thư mục đã tồn tại")
+
+        try:
+            folder = self.ensure_path(db, user_id, path)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi tạo thư mục: {str(e)}")
+        return self._folder_info(folder)
+
+    async def update_folder(
+        self, db: Session, user_id: UUID, folder_id: str, name: Optional[str] = None, parent: Optional[str] = None
+    ):
+        """Đổi tên và/hoặc chuyển thư mục (cùng toàn bộ thư mục con và tài liệu bên trong)"""
+
+        folder = self._get_own_folder(db, folder_id, user_id)
+        if folder.path == ROOT:
+            raise HTTPException(status_code=400, detail="Không thể đổi tên hoặc chuyển thư mục gốc")
+
+        old_path = folder.path
+        new_parent = normalize_path(parent) if parent is not None else parent_path(old_path)
+        new_name = self._validate_name(name) if name is not None else folder.name
+        new_path = join_path(new_parent, new_name)
+        if new_path == old_path:
+            return self._folder_info(folder)
+
+        if new_path.startswith(old_path + "/"):
+            raise HTTPException(status_code=400, detail="Không thể chuyển thư mục vào chính nó")
+        if len(new_path) > MAX_PATH_LENGTH:
+            raise HTTPException(status_code=400, detail="Đường dẫn thư mục quá dài")
+        if db.query(Folder.id).filter(Folder.user_id == user_id, Folder.path == new_path).first():
+            raise HTTPException(status_code=400, detail="Thư mục đã tồn tại")
+
+        try:
+            count, size_bytes = folder.subtree_document_count, folder.subtree_bytes
+            self.apply_delta(db, user_id, old_path, -count, -size_bytes, include_self=False)
+
+            # One range update per table rewrites the prefix of the whole subtree
+            suffix_start = len(old_path) + 1
+            depth_change = new_path.count("/") - old_path.count("/")
+            db.query(Folder).filter(Folder.user_id == user_id, in_subtree(Folder.path, old_path)).update({
+                Folder.path: literal(new_path, String) + func.substr(Folder.path, suffix_start, type_=String),
+                Folder.depth: Folder.depth + depth_change
+            }, synchronize_session=False)
+            db.query(Document).filter(Document.user_id == user_id, in_subtree(Document.folder, old_path)).update({
+                Document.folder: literal(new_path, String) + func.substr(Document.folder, suffix_start, type_=String)
+            }, synchronize_session=False)
+            db.expire_all()
+
+            folder = self._get_own_folder(db, folder_id, user_id)
+            folder.parent_id = self.ensure_path(db, user_id, new_parent).id
+            folder.name = new_name
+            self.apply_delta(db, user_id, new_path, count, size_bytes, include_self=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi cập nhật thư mục: {str(e)}")
+
+        db.refresh(folder)
+        return self._folder_info(folder)
+
+    async def delete_folder(self, db: Session, user_id: UUID, folder_id: str):
+        """Xoá thư mục rỗng (cùng các thư mục con rỗng)"""
+
+        folder = self._get_own_folder(db, folder_id, user_id)
+        if folder.path == ROOT:
+            raise HTTPException(status_code=400, detail="Không thể xoá thư mục gốc")
+        if folder.subtree_document_count > 0:
+            raise HTTPException(status_code=400, detail="Thư mục vẫn còn tài liệu")
+
+        try:
+            # Deepest first, each folder is deleted before its parent
+            subtree = db.query(Folder).filter(
+                Folder.user_id == user_id, in_subtree(Folder.path, folder.path)
+            ).order_by(Folder.depth.desc()).all()
+            for child in subtree:
+                db.delete(child)
+                db.flush()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi xoá thư mục: {str(e)}")
+
+        return {"message": "Thư mục đã được xóa thành công"}
+
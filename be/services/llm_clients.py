@@ -0,0 +1,105 @@
+# app/services/llm_clients.py
+import asyncio
+import random
+import threading
+from typing import Optional
+
+import httpx
+
+from database import settings
+
+# One pooled HTTP client per process (sync for Celery/indexing, async for the
+# API event loop), so keep-alive connections and TLS sessions are reused
+# across questions instead of being set up per call.
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_openai_clients = {}
+_lock = threading.Lock()
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+        keepalive_expiry=30.0
+    )
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+    return _http_client
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    if _async_http_client is None:
+        with _lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return _async_http_client
+
+def get_openai_clients(api_key: str):
+    """Trả về (OpenAI, AsyncOpenAI) dùng chung connection pool; retry do with_retries đảm nhiệm"""
+    if api_key not in _openai_clients:
+        import openai
+        with _lock:
+            if api_key not in _openai_clients:
+                _openai_clients[api_key] = (
+                    openai.OpenAI(api_key=api_key, http_client=get_http_client(), max_retries=0),
+                    openai.AsyncOpenAI(api_key=api_key, http_client=get_async_http_client(), max_retries=0),
+                )
+    return _openai_clients[api_key]
+
+async def close_http_clients():
+    """Đóng các connection pool (gọi khi tắt server)"""
+    global _http_client, _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
+    _openai_clients.clear()
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff với full jitter để các request lỗi không retry cùng lúc"""
+    cap = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+async def with_retries(func, *args, **kwargs):
+    """Gọi coroutine function, thử lại các lỗi tạm thời (mạng, 429, 5xx)"""
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+async def astream_with_retries(runnable, inputs):
+    """Stream từ runnable; chỉ retry khi chưa nhận được token nào"""
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        received = False
+        try:
+            async for chunk in runnable.astream(inputs):
+                received = True
+                yield chunk
+            return
+        except Exception as e:
+            if received or attempt >= settings.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
@@ -0,0 +1,163 @@
+# app/services/metrics.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional
+
+# In-process metrics exported in the Prometheus text format at /metrics.
+# Each API worker process keeps its own values.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    items = list(key) + list(extra or ())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, description: str, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, description, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter, name, description)
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._register(Gauge, name, description)
+
+    def histogram(self, name: str, description: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        """Xuất toàn bộ metrics theo định dạng text của Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Phân vị p (0-100) theo nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageTimer:
+    """Đo thời gian từng giai đoạn của một request (ms) và các số đếm đi kèm"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = round(self.timings.get(name, 0.0) + seconds * 1000, 1)
+
+    def count(self, name: str, value: int):
+        self.counts[name] = value
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Thời gian các giai đoạn đến hiện tại (kèm total) và các số đếm, để lưu vào DB"""
+        timings = dict(self.timings)
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return {"timings_ms": timings, "counts": dict(self.counts)}
+
+    def finish(self, histogram: Histogram):
+        """Ghi tổng thời gian và đẩy tất cả các giai đoạn vào histogram (label stage)"""
+        self.record("total", time.perf_counter() - self.started)
+        for name, ms in self.timings.items():
+            histogram.observe(ms / 1000, stage=name)
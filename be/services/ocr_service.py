@@ -1,37 +1,111 @@
 # app/services/ocr_service.py
 import os
 import asyncio
+import threading
 from fastapi import HTTPException, UploadFile
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 from uuid import UUID
-import aiofiles
 from datetime import datetime
-from PIL import Image
-import pytesseract
-import easyocr
-from pdf2image import convert_from_path
-import numpy as np
 
-from models import OCRResult, Document
+from models import OCRResult, Document, FileBlob
 from schemas import OCRResultUpdate
 from database import settings
+from services.upload_stream import StagingWriter
+from services.blob_store import BlobStore
+from services.document_pages import set_document_content
+from services.text_store import TextStore
+from services.document_pipeline import start_pipeline
+from services.folder_service import FolderService, ROOT
+from services.extraction import join_pages, pdf_page_count
+
+# Read size when copying an UploadFile into staging
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Scanned PDFs are rasterized a few pages at a time: one A4 page at 300 DPI is ~9MB
+# in grayscale (~26MB in RGB), so memory stays flat whatever the page count
+OCR_DPI = 300
+OCR_PAGE_WINDOW = 2
+
+# PIL, pytesseract, pdf2image and especially easyocr (which pulls in torch) are
+# imported inside the methods that use them so that importing this module stays cheap.
+
+def _pdf_page_count(pdf_path: str) -> int:
+    try:
+        # Same poppler build that rasterizes the pages
+        from pdf2image import pdfinfo_from_path
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+    except Exception:
+        return pdf_page_count(pdf_path)
+
+def iter_pdf_pages(pdf_path: str, dpi: int = OCR_DPI, window: int = OCR_PAGE_WINDOW) -> Iterator[Tuple[int, object]]:
+    """Lần lượt từng trang PDF dưới dạng ảnh (số trang bắt đầu từ 1).
+
+    Mỗi lần chỉ rasterize `window` trang (first_page/last_page của pdftoppm) và
+    giải phóng ảnh của trang trước khi sang trang sau, nên bộ nhớ không tăng theo
+    số trang. Ảnh grayscale: Tesseract/EasyOCR không cần màu.
+    """
+    from pdf2image import convert_from_path
+
+    page_count = _pdf_page_count(pdf_path)
+    for first in range(1, page_count + 1, window):
+        last = min(first + window - 1, page_count)
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, grayscale=True)
+        while images:
+            image = images.pop(0)
+            try:
+                yield first, image
+            finally:
+                image.close()
+            first += 1
+
 
 class OCRService:
-    def __init__(self):
+    def __init__(self, qa_service=None):
         self.upload_dir = settings.UPLOAD_DIR
         self.tesseract_cmd = settings.TESSERACT_CMD
-        
-        # Initialize EasyOCR reader
-        try:
-            self.easyocr_reader = easyocr.Reader(['vi', 'en'])
-        except Exception as e:
-            print(f"Warning: Could not initialize EasyOCR: {e}")
-            self.easyocr_reader = None
+        self.blob_store = BlobStore(self.upload_dir)
+        # Used to re-index a document after its OCR text is edited
+        self.qa_service = qa_service
+        
+        # EasyOCR reader is built on first use (or by warm_up), it loads torch models
+        self._easyocr_reader = None
+        self._easyocr_loaded = False
+        self._init_lock = threading.Lock()
+
+    @property
+    def easyocr_reader(self):
+        """EasyOCR reader, khởi tạo ở lần dùng đầu tiên"""
+        if not self._easyocr_loaded:
+            with self._init_lock:
+                if not self._easyocr_loaded:
+                    try:
+                        import easyocr
+                        self._easyocr_reader = easyocr.Reader(['vi', 'en'])
+                    except Exception as e:
+                        print(f"Warning: Could not initialize EasyOCR: {e}")
+                        self._easyocr_reader = None
+                    self._easyocr_loaded = True
+        return self._easyocr_reader
+
+    def _get_pytesseract(self):
+        """Import pytesseract và cấu hình đường dẫn Tesseract"""
+        import pytesseract
         
         # Set Tesseract command path if specified
         if self.tesseract_cmd:
             pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+        return pytesseract
+
+    def warm_up(self):
+        """Nạp trước các thư viện OCR (chạy trong thread nền khi khởi động)"""
+        self._get_pytesseract()
+        from PIL import Image
+        from pdf2image import convert_from_path
+        
+        # Only the configured engine is worth loading ahead of time
+        if settings.DEFAULT_OCR_ENGINE == "easyocr":
+            self.easyocr_reader
 
     async def process_file(self, db: Session, file: UploadFile, user_id: UUID):
         """Xử lý OCR cho file upload"""
@@ -49,55 +123,81 @@ class OCRService:
                 detail=f"Định dạng file không được hỗ trợ cho OCR. Chỉ chấp nhận: {', '.join(supported_formats)}"
             )
         
-        # Create temp directory for processing
-        temp_dir = os.path.join(self.upload_dir, "temp", str(user_id))
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Save uploaded file temporarily
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_filename = f"{timestamp}_{file.filename}"
-        temp_file_path = os.path.join(temp_dir, temp_filename)
+        # Stream the upload into staging (hashing on the way), then store it by content
+        writer = await StagingWriter(os.path.join(self.upload_dir, ".staging"), settings.MAX_FILE_SIZE).open()
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await writer.write(chunk)
+        except HTTPException:
+            raise
+        except Exception as e:
+            await writer.abort()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý file: {str(e)}")
+        staged = await writer.finish(file.filename)
         
         try:
-            async with aiofiles.open(temp_file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+            # Usage counters (and the quota) first: a rejected upload never reaches the blob store
+            FolderService.add_documents(db, user_id, ROOT, 1, staged.size, enforce_quota=True)
+            blob = self.blob_store.adopt(db, staged)
             
             # First, save the file as a document
-            document = await self._create_document_record(db, file.filename, temp_file_path, user_id)
+            document = self._create_document_record(db, file.filename, blob, user_id)
             
             # Create OCR result record with processing status
             ocr_result = OCRResult(
                 document_id=document.id,
                 user_id=user_id,
                 original_file=file.filename,
-                extracted_text="",
                 confidence=0.0,
                 status="processing",
                 engine_used=settings.DEFAULT_OCR_ENGINE
             )
             
+            if blob.ocr_content is not None:
+                # The same content was OCR'd before, reuse that result
+                ocr_result.text_content = blob.ocr_content
+                ocr_result.confidence = blob.ocr_confidence or 0.0
+                ocr_result.status = "completed"
+                ocr_result.ocr_metadata = {
+                    "processing_time": datetime.now().isoformat(),
+                    "text_length": blob.ocr_content.length,
+                    "reused_from_blob": blob.sha256
+                }
+                set_document_content(document, blob.ocr_content)
+            
             db.add(ocr_result)
             db.commit()
             db.refresh(ocr_result)
             
-            # Process OCR asynchronously
-            asyncio.create_task(self._process_ocr_async(
-                db, ocr_result.id, temp_file_path, file_ext, document.id
-            ))
-            
+        except HTTPException:
+            db.rollback()
+            staged.discard()
+            raise
+        except Exception as e:
+            db.rollback()
+            staged.discard()
+            raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý file: {str(e)}")
+        
+        if ocr_result.status == "completed":
+            await start_pipeline([document.id], self.qa_service)
             return {
                 "id": ocr_result.id,
                 "document_id": document.id,
-                "status": "processing",
-                "message": "File đã được tải lên và đang xử lý OCR..."
+                "status": "completed",
+                "message": "File đã được tải lên, dùng lại kết quả OCR của file giống hệt"
             }
-            
-        except Exception as e:
-            # Clean up temp file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-            raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý file: {str(e)}")
+        
+        # Process OCR asynchronously
+        asyncio.create_task(self._process_ocr_async(
+            db, ocr_result.id, blob.path, file_ext, document.id
+        ))
+        
+        return {
+            "id": ocr_result.id,
+            "document_id": document.id,
+            "status": "processing",
+            "message": "File đã được tải lên và đang xử lý OCR..."
+        }
 
     async def _process_ocr_async(self, db: Session, ocr_result_id: UUID, file_path: str, file_ext: str, document_id: UUID):
         """Xử lý OCR bất đồng bộ"""
@@ -112,10 +212,11 @@ class OCRService:
             # Update OCR result
             ocr_result = db.query(OCRResult).filter(OCRResult.id == ocr_result_id).first()
             if ocr_result:
-                ocr_result.extracted_text = extracted_text
+                content = TextStore.put(db, extracted_text)
+                ocr_result.text_content = content
                 ocr_result.confidence = confidence
                 ocr_result.status = "completed"
-                ocr_result.metadata = {
+                ocr_result.ocr_metadata = {
                     "processing_time": datetime.now().isoformat(),
                     "text_length": len(extracted_text),
                     "engine_version": self._get_engine_version()
@@ -124,54 +225,50 @@ class OCRService:
                 # Also update the document with extracted text
                 document = db.query(Document).filter(Document.id == document_id).first()
                 if document:
-                    document.extracted_text = extracted_text
-                    document.is_processed = True
+                    set_document_content(document, content)
+                    self.blob_store.remember_ocr(db, document.content_hash, extracted_text, confidence)
                 
                 db.commit()
+                
+                # The text is there, the pipeline skips extraction and OCR and indexes it
+                if document:
+                    await start_pipeline([document.id], self.qa_service)
             
         except Exception as e:
             # Update status to failed
             ocr_result = db.query(OCRResult).filter(OCRResult.id == ocr_result_id).first()
             if ocr_result:
                 ocr_result.status = "failed"
-                ocr_result.metadata = {
+                ocr_result.ocr_metadata = {
                     "error": str(e),
                     "processing_time": datetime.now().isoformat()
                 }
                 db.commit()
-        
-        finally:
-            # Clean up temp file
-            if os.path.exists(file_path):
-                os.remove(file_path)
 
     async def _process_pdf(self, pdf_path: str) -> tuple[str, float]:
-        """Xử lý OCR cho file PDF"""
+        """Xử lý OCR cho file PDF, rasterize và nhận dạng lần lượt từng trang"""
         
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
-            
             all_text = []
             all_confidences = []
             
-            for i, image in enumerate(images):
-                # Save image temporarily
-                temp_image_path = f"{pdf_path}_page_{i}.png"
-                image.save(temp_image_path, 'PNG')
-                
-                try:
-                    # Process image
-                    text, confidence = await self._extract_text_from_image(temp_image_path)
-                    all_text.append(f"--- Trang {i+1} ---\n{text}")
+            pages = iter_pdf_pages(pdf_path)
+            try:
+                while True:
+                    # pdftoppm runs off the event loop, one window of pages at a time
+                    page = await asyncio.to_thread(next, pages, None)
+                    if page is None:
+                        break
+                    _, image = page
+                    # The image goes to the engine in memory, no PNG written and read back
+                    text, confidence = await self._extract_text_from_image(image)
+                    all_text.append(text)
                     all_confidences.append(confidence)
-                finally:
-                    # Clean up temp image
-                    if os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
+            finally:
+                pages.close()
             
             # Combine results
-            combined_text = "\n\n".join(all_text)
+            combined_text = join_pages(all_text)
             avg_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0.0
             
             return combined_text, avg_confidence
@@ -188,25 +285,31 @@ class OCRService:
         except Exception as e:
             raise Exception(f"Lỗi khi xử lý ảnh: {str(e)}")
 
-    async def _extract_text_from_image(self, image_path: str) -> tuple[str, float]:
-        """Trích xuất text từ ảnh sử dụng engine được cấu hình"""
+    async def _extract_text_from_image(self, image) -> tuple[str, float]:
+        """Trích xuất text từ ảnh (đường dẫn file hoặc PIL Image) sử dụng engine được cấu hình"""
         
         engine = settings.DEFAULT_OCR_ENGINE
         
-        if engine == "easyocr" and self.easyocr_reader:
-            return await self._extract_with_easyocr(image_path)
+        # First access builds the EasyOCR reader, keep that off the event loop
+        if engine == "easyocr" and await asyncio.to_thread(lambda: self.easyocr_reader):
+            return await self._extract_with_easyocr(image)
         else:
-            return await self._extract_with_tesseract(image_path)
+            return await self._extract_with_tesseract(image)
 
-    async def _extract_with_tesseract(self, image_path: str) -> tuple[str, float]:
+    async def _extract_with_tesseract(self, image) -> tuple[str, float]:
         """Trích xuất text bằng Tesseract"""
         
         try:
+            from PIL import Image
+            pytesseract = self._get_pytesseract()
+            
             # Load image
-            image = Image.open(image_path)
+            if isinstance(image, str):
+                image = Image.open(image)
             
-            # Extract text with confidence
-            data = pytesseract.image_to_data(
+            # Extract text with confidence (the tesseract process runs off the event loop)
+            data = await asyncio.to_thread(
+                pytesseract.image_to_data,
                 image, 
                 lang='vie+eng',  # Vietnamese + English
                 output_type=pytesseract.Output.DICT
@@ -230,12 +333,17 @@ class OCRService:
         except Exception as e:
             raise Exception(f"Lỗi Tesseract: {str(e)}")
 
-    async def _extract_with_easyocr(self, image_path: str) -> tuple[str, float]:
+    async def _extract_with_easyocr(self, image) -> tuple[str, float]:
         """Trích xuất text bằng EasyOCR"""
         
         try:
+            if not isinstance(image, str):
+                # EasyOCR reads numpy arrays directly
+                import numpy as np
+                image = np.asarray(image)
+            
             # Read image
-            results = self.easyocr_reader.readtext(image_path)
+            results = await asyncio.to_thread(self.easyocr_reader.readtext, image)
             
             # Extract text and confidences
             words = []
@@ -308,14 +416,22 @@ class OCRService:
         if not result:
             raise HTTPException(status_code=404, detail="Không tìm thấy kết quả OCR")
         
+        reindex = None
+        
         # Update fields
         if update_data.extracted_text is not None:
-            result.extracted_text = update_data.extracted_text
+            content = TextStore.put(db, update_data.extracted_text)
+            result.text_content = content
             
             # Also update the associated document
             document = db.query(Document).filter(Document.id == result.document_id).first()
             if document:
-                document.extracted_text = update_data.extracted_text
+                set_document_content(document, content)
+                reindex = (document.id, update_data.extracted_text, {
+                    "title": document.name,
+                    "type": document.type,
+                    "upload_date": document.upload_date.isoformat()
+                })
         
         if update_data.confidence is not None:
             result.confidence = update_data.confidence
@@ -325,34 +441,40 @@ class OCRService:
         
         db.commit()
         
+        # Replace the document's stale chunks in the background
+        if reindex and self.qa_service:
+            asyncio.create_task(self.qa_service.reindex_document(*reindex))
+        
         return {
             "message": "Kết quả OCR đã được cập nhật thành công",
             "id": result.id
         }
 
-    async def _create_document_record(self, db: Session, filename: str, file_path: str, user_id: UUID) -> Document:
-        """Tạo record document cho file OCR"""
+    def _create_document_record(self, db: Session, filename: str, blob: FileBlob, user_id: UUID) -> Document:
+        """Tạo record document cho file OCR (trỏ tới blob đã lưu, chưa commit)"""
         
         file_ext = filename.split('.')[-1].lower()
-        file_size = os.path.getsize(file_path)
         
         document = Document(
             name=filename,
             original_name=filename,
             type=file_ext.upper(),
-            size=self._format_file_size(file_size),
-            file_path=file_path,
+            size=self._format_file_size(blob.size),
+            size_bytes=blob.size,
+            file_path=blob.path,
+            content_hash=blob.sha256,
             user_id=user_id,
-            metadata={
+            doc_metadata={
                 "source": "ocr_upload",
-                "file_size_bytes": file_size,
+                "mime_type": blob.mime_type,
+                "file_size_bytes": blob.size,
+                "sha256": blob.sha256,
                 "upload_timestamp": datetime.now().isoformat()
             }
         )
         
         db.add(document)
-        db.commit()
-        db.refresh(document)
+        db.flush()
         
         return document
 
@@ -378,6 +500,6 @@ class OCRService:
                 import easyocr
                 return f"EasyOCR {easyocr.__version__}"
             else:
-                return f"Tesseract {pytesseract.get_tesseract_version()}"
+                return f"Tesseract {self._get_pytesseract().get_tesseract_version()}"
         except:
             return "Unknown"
\ No newline at end of file
@@ -0,0 +1,177 @@
+# app/services/previews.py
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from database import settings
+
+# Width in pixels of each preview size
+PREVIEW_SIZES = {"small": 160, "medium": 480}
+PREVIEWABLE_TYPES = ("PDF", "JPG", "JPEG", "PNG")
+WEBP_QUALITY = 80
+
+# Previews are keyed by content, a URL never changes what it shows
+PREVIEW_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Eviction scans the cache directory, run it at most this often per process
+EVICT_INTERVAL_SECONDS = 60
+# Evict down to this fraction of the limit so the next few renders don't trigger it again
+EVICT_TARGET_RATIO = 0.9
+# Temp files older than this were left by a crashed put() and are removed by evict()
+STALE_TEMP_SECONDS = 3600
+
+
+class PreviewUnavailable(Exception):
+    """Không tạo được ảnh xem trước (loại file không hỗ trợ, trang không tồn tại...)"""
+
+
+def preview_key(document) -> str:
+    # Files uploaded before the blob store have no content hash
+    return document.content_hash or f"doc-{document.id}"
+
+def render_previews(path: str, file_type: str, page: int = 1) -> Dict[str, bytes]:
+    """Render một trang thành ảnh WebP ở mọi cỡ trong PREVIEW_SIZES.
+
+    Trang chỉ được rasterize một lần, ở cỡ lớn nhất (poppler render thẳng ở độ
+    phân giải đó, không render cả trang 300 DPI rồi thu nhỏ); các cỡ nhỏ hơn
+    được thu nhỏ từ ảnh này.
+    """
+    from PIL import Image
+
+    file_type = file_type.upper()
+    if file_type not in PREVIEWABLE_TYPES:
+        raise PreviewUnavailable(f"No preview for {file_type} files")
+
+    width = max(PREVIEW_SIZES.values())
+    if file_type == "PDF":
+        from pdf2image import convert_from_path
+        images = convert_from_path(path, first_page=page, last_page=page, size=(width, None))
+        if not images:
+            raise PreviewUnavailable(f"Page {page} does not exist")
+        image = images[0]
+    else:
+        if page != 1:
+            raise PreviewUnavailable(f"Page {page} does not exist")
+        image = Image.open(path)
+        # JPEG can decode straight at a reduced scale
+        image.draft("RGB", (width, width * 4))
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    previews = {}
+    for name, size_width in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size_width, size_width * 4))
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+        previews[name] = buffer.getvalue()
+    return previews
+
+
+class PreviewCache:
+    """Cache ảnh xem trước trên đĩa, khoá theo (content hash, trang, cỡ).
+
+    Dung lượng bị giới hạn bởi max_bytes; khi vượt, các ảnh lâu không được dùng
+    nhất bị xoá (LRU theo mtime, được cập nhật mỗi lần đọc trúng cache).
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._last_evict = 0.0
+        self._evict_lock = threading.Lock()
+
+    def path_for(self, key: str, page: int, size: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}-p{page}-{size}.webp")
+
+    def get(self, key: str, page: int, size: str) -> Optional[str]:
+        path = self.path_for(key, page, size)
+        try:
+            # Mark as recently used (atime is unreliable on noatime mounts)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def has_all(self, key: str, page: int) -> bool:
+        return all(os.path.exists(self.path_for(key, page, size)) for size in PREVIEW_SIZES)
+
+    def put(self, key: str, page: int, previews: Dict[str, bytes]):
+        for size, data in previews.items():
+            path = self.path_for(key, page, size)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, readers never see a partial image
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    def evict(self) -> int:
+        """Xoá các ảnh ít được dùng nhất cho đến khi cache dưới giới hạn; trả về số file đã xoá"""
+        entries = []
+        total = 0
+        now = time.time()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat_result = os.stat(path)
+                    if name.endswith(".tmp"):
+                        # put() may still be writing it
+                        if now - stat_result.st_mtime > STALE_TEMP_SECONDS:
+                            os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, path))
+                total += stat_result.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def maybe_evict(self) -> int:
+        with self._evict_lock:
+            if time.monotonic() - self._last_evict < EVICT_INTERVAL_SECONDS:
+                return 0
+            self._last_evict = time.monotonic()
+        return self.evict()
+
+    def render(self, key: str, path: str, file_type: str, page: int = 1):
+        """Render và lưu các cỡ ảnh của một trang (bỏ qua nếu đã có trong cache)"""
+        if self.has_all(key, page):
+            return
+        self.put(key, page, render_previews(path, file_type, page))
+        self.maybe_evict()
+
+
+_cache: Optional[PreviewCache] = None
+
+def get_preview_cache() -> PreviewCache:
+    global _cache
+    if _cache is None:
+        _cache = PreviewCache(
+            os.path.join(settings.UPLOAD_DIR, ".previews"),
+            settings.PREVIEW_CACHE_MAX_BYTES
+        )
+    return _cache
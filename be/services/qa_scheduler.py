@@ -0,0 +1,131 @@
+# app/services/qa_scheduler.py
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any
+
+from services.metrics import metrics
+
+QUEUE_DEPTH = metrics.gauge("qa_queue_depth", "Questions waiting for an LLM slot")
+RUNNING = metrics.gauge("qa_running", "Questions currently holding an LLM slot")
+QUEUE_WAIT = metrics.histogram("qa_queue_wait_seconds", "Time spent waiting for an LLM slot")
+SERVICE_TIME = metrics.histogram("qa_service_seconds", "Time a question holds an LLM slot")
+REJECTED = metrics.counter("qa_rejected_total", "Questions rejected by the scheduler")
+
+
+class QueueFullError(Exception):
+    """Hàng đợi đã đầy hoặc chờ quá lâu; retry_after tính bằng giây"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"QA queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QAScheduler:
+    """Giới hạn số câu hỏi được xử lý đồng thời, chia lượt công bằng giữa người dùng.
+
+    Mỗi người dùng có một hàng đợi riêng; khi một slot được trả lại, nó được trao
+    cho người dùng kế tiếp theo vòng tròn, nên một người gửi liên tục không chặn
+    người khác.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_per_user: int,
+        max_queue_total: int,
+        queue_timeout: float
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue_total = max_queue_total
+        self.queue_timeout = queue_timeout
+
+        self._queues: "OrderedDict[Any, deque]" = OrderedDict()
+        self._waiting = 0
+        self._running = 0
+        self._avg_service_seconds = 5.0
+
+    def _retry_after(self) -> int:
+        # Expected time for the current backlog to drain
+        backlog = self._waiting + self._running
+        return max(1, math.ceil(self._avg_service_seconds * backlog / self.max_concurrency))
+
+    def _update_gauges(self):
+        QUEUE_DEPTH.set(self._waiting)
+        RUNNING.set(self._running)
+
+    async def acquire(self, user_id):
+        if self._running < self.max_concurrency and not self._waiting:
+            self._running += 1
+            self._update_gauges()
+            QUEUE_WAIT.observe(0.0)
+            return
+
+        queue = self._queues.get(user_id)
+        if (queue and len(queue) >= self.max_queue_per_user) or self._waiting >= self.max_queue_total:
+            REJECTED.inc(reason="queue_full")
+            raise QueueFullError(self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._waiting += 1
+        self._update_gauges()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                REJECTED.inc(reason="timeout")
+                raise QueueFullError(self._retry_after())
+            raise
+        finally:
+            QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    def _remove_waiter(self, user_id, waiter):
+        queue = self._queues.get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[user_id]
+            self._update_gauges()
+
+    def release(self):
+        # Hand the slot directly to the next user in round-robin order
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not waiter.done():
+                waiter.set_result(True)
+                self._update_gauges()
+                return
+
+        self._running -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        """Giữ một slot trong suốt quá trình xử lý câu hỏi"""
+        await self.acquire(user_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            SERVICE_TIME.observe(elapsed)
+            self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * elapsed
+            self.release()
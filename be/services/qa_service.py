@@ -1,17 +1,19 @@
 # app/services/qa_service.py
 import os
 import asyncio
+import threading
+import time
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, select, func
 from typing import List, Optional, Dict, Any
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
 # Fix imports - use relative imports or get settings from database
 try:
-    from database import settings
+    from database import settings, SessionLocal
 except ImportError:
     # Fallback settings if database not available
     class FallbackSettings:
@@ -23,54 +25,141 @@ except ImportError:
 
 from models import Document, ChatSession, ChatMessage, VectorStore
 from schemas import QARequest, ChatSessionCreate, QASource
+from services.reranker import get_reranker, rerank
+from services.chunker import iter_chunks
+from services.text_store import text_hash, text_contains
+from services.metrics import metrics, StageTimer, percentile
+from services.llm_clients import get_openai_clients, with_retries, astream_with_retries
+from services.chat_memory import build_history, estimate_tokens, format_message, truncate_to_tokens
 
-# Optional LangChain imports with fallbacks
-try:
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain.embeddings.openai import OpenAIEmbeddings
-    from langchain.embeddings.huggingface import HuggingFaceEmbeddings
-    from langchain.vectorstores.chroma import Chroma
-    # Fix deprecated imports
+# Optional LangChain imports with fallbacks. LangChain drags in torch, chromadb and
+# sentence-transformers, so the import is deferred until the service is first used.
+LANGCHAIN_AVAILABLE = None
+
+def _load_langchain() -> bool:
+    """Import LangChain lần đầu cần dùng, trả về True nếu có sẵn"""
+    global LANGCHAIN_AVAILABLE, OpenAIEmbeddings, HuggingFaceEmbeddings
+    global Chroma, ChatOpenAI, Ollama, LangChainDocument, ChatPromptTemplate, StrOutputParser
+    
+    if LANGCHAIN_AVAILABLE is not None:
+        return LANGCHAIN_AVAILABLE
+    
     try:
-        from langchain_community.chat_models import ChatOpenAI
-        from langchain_community.llms import Ollama
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        from langchain.embeddings.huggingface import HuggingFaceEmbeddings
+        from langchain.vectorstores.chroma import Chroma
+        # Fix deprecated imports
+        try:
+            from langchain_community.chat_models import ChatOpenAI
+            from langchain_community.llms import Ollama
+        except ImportError:
+            from langchain.chat_models import ChatOpenAI
+            from langchain.llms import Ollama
+        from langchain.schema import Document as LangChainDocument
+        from langchain.prompts import ChatPromptTemplate
+        from langchain.schema.output_parser import StrOutputParser
+        LANGCHAIN_AVAILABLE = True
     except ImportError:
-        from langchain.chat_models import ChatOpenAI
-        from langchain.llms import Ollama
-    from langchain.schema import Document as LangChainDocument
-    from langchain.prompts import ChatPromptTemplate
-    from langchain.schema.runnable import RunnablePassthrough
-    from langchain.schema.output_parser import StrOutputParser
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    print("Warning: LangChain not available, QA service will have limited functionality")
-    LANGCHAIN_AVAILABLE = False
+        print("Warning: LangChain not available, QA service will have limited functionality")
+        LANGCHAIN_AVAILABLE = False
+    
+    return LANGCHAIN_AVAILABLE
+
+QA_STAGE_SECONDS = metrics.histogram("qa_stage_seconds", "Duration of each QA pipeline stage")
+
+# Stages recorded in ChatMessage.msg_metadata["timings_ms"], in pipeline order
+QA_STAGES = ["session", "history", "retrieval", "rerank", "pack", "first_token", "generation", "persist", "total"]
+
+ANSWER_PROMPT = """
+Bạn là một trợ lý AI thông minh, giúp trả lời câu hỏi dựa trên các tài liệu được cung cấp.
+
+Ngữ cảnh từ các tài liệu:
+{context}
+
+Lịch sử hội thoại:
+{history}
+
+Câu hỏi của người dùng: {question}
+
+Hướng dẫn:
+1. Trả lời câu hỏi dựa trên thông tin trong các tài liệu được cung cấp
+2. Nếu không tìm thấy thông tin liên quan, hãy nói rõ điều đó
+3. Trả lời bằng tiếng Việt, rõ ràng và dễ hiểu
+4. Nếu có thể, hãy trích dẫn tên tài liệu chứa thông tin
+5. Dùng lịch sử hội thoại để hiểu các câu hỏi nối tiếp
+
+Câu trả lời:
+"""
+
+SUMMARY_PROMPT = """
+Cập nhật bản tóm tắt cuộc hội thoại giữa người dùng và trợ lý tài liệu.
+Giữ lại các chủ đề, tài liệu, số liệu và quyết định quan trọng; bỏ chi tiết thừa.
+Viết bằng tiếng Việt, tối đa {max_words} từ.
+
+Tóm tắt hiện tại:
+{summary}
+
+Các lượt mới:
+{transcript}
+
+Tóm tắt cập nhật:
+"""
 
 class QAService:
     def __init__(self):
-        if not LANGCHAIN_AVAILABLE:
+        # Models and the vector store are loaded by warm_up(), either from the
+        # startup warm-up task or on the first request that needs them
+        self.embeddings = None
+        self.llm = None
+        self.vector_store = None
+        self.answer_chain = None
+        self.summary_chain = None
+        self.reranker = get_reranker()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._summarizing = set()
+        # Summary tasks are referenced until done, the event loop only keeps weak references
+        self._background_tasks = set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._initialized
+
+    def warm_up(self):
+        """Khởi tạo embeddings, LLM và vector store (chỉ chạy một lần)"""
+        if self._initialized:
+            return
+        
+        with self._init_lock:
+            if self._initialized:
+                return
+            self._initialize()
+            if self.reranker:
+                self.reranker.load()
+            self._initialized = True
+
+    async def _ensure_initialized(self):
+        """Khởi tạo service ngoài event loop nếu chưa được warm up"""
+        if not self._initialized:
+            await asyncio.to_thread(self.warm_up)
+
+    def _initialize(self):
+        if not _load_langchain():
             print("QA Service initialized without LangChain - limited functionality")
-            self.embeddings = None
-            self.llm = None
-            self.text_splitter = None
-            self.vector_store = None
             return
             
         try:
             self.embeddings = self._initialize_embeddings()
             self.llm = self._initialize_llm()
-            if LANGCHAIN_AVAILABLE:
-                self.text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=200,
-                    length_function=len,
-                )
             self.vector_store = self._initialize_vector_store()
+            if self.llm:
+                # Prompts and chains are built once and shared by all questions
+                self.answer_chain = ChatPromptTemplate.from_template(ANSWER_PROMPT) | self.llm | StrOutputParser()
+                self.summary_chain = ChatPromptTemplate.from_template(SUMMARY_PROMPT) | self.llm | StrOutputParser()
         except Exception as e:
             print(f"Warning: Could not fully initialize QA service: {e}")
             self.embeddings = None
             self.llm = None
-            self.text_splitter = None
             self.vector_store = None
 
     def _initialize_embeddings(self):
@@ -78,9 +167,22 @@ class QAService:
         if not LANGCHAIN_AVAILABLE:
             return None
             
+        backend = getattr(settings, 'EMBEDDING_BACKEND', 'auto')
+        if backend == 'auto':
+            backend = 'openai' if getattr(settings, 'OPENAI_API_KEY', '') else 'huggingface'
+        
         try:
-            if hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
-                return OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
+            if backend == 'hash':
+                from services.fake_llm import HashEmbeddings
+                return HashEmbeddings(settings.FAKE_EMBEDDING_DIM)
+            elif backend == 'openai':
+                client, async_client = get_openai_clients(settings.OPENAI_API_KEY)
+                return OpenAIEmbeddings(
+                    openai_api_key=settings.OPENAI_API_KEY,
+                    client=client.embeddings,
+                    async_client=async_client.embeddings,
+                    max_retries=0
+                )
             else:
                 # Fallback to local embeddings
                 return HuggingFaceEmbeddings(
@@ -95,12 +197,24 @@ class QAService:
         if not LANGCHAIN_AVAILABLE:
             return None
             
+        backend = getattr(settings, 'LLM_BACKEND', 'auto')
+        if backend == 'auto':
+            backend = 'openai' if getattr(settings, 'OPENAI_API_KEY', '') else 'ollama'
+        
         try:
-            if hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
+            if backend == 'fake':
+                from services.fake_llm import create_fake_llm
+                return create_fake_llm(settings.FAKE_LLM_LATENCY_MS, settings.FAKE_LLM_TOKENS_PER_SECOND)
+            elif backend == 'openai':
+                # Pooled keep-alive clients; retries with jitter are done by with_retries
+                client, async_client = get_openai_clients(settings.OPENAI_API_KEY)
                 return ChatOpenAI(
                     model_name=getattr(settings, 'DEFAULT_LLM_MODEL', 'gpt-3.5-turbo'),
                     openai_api_key=settings.OPENAI_API_KEY,
-                    temperature=0.7
+                    temperature=0.7,
+                    client=client.chat.completions,
+                    async_client=async_client.chat.completions,
+                    max_retries=0
                 )
             else:
                 # Fallback to local LLM (Ollama)
@@ -115,6 +229,11 @@ class QAService:
             return None
             
         try:
+            if getattr(settings, 'VECTOR_DB_TYPE', 'chromadb') == 'native':
+                # Built-in numpy flat/HNSW index, no external service needed
+                from services.vector_index import NativeVectorStore
+                return NativeVectorStore(self.embeddings)
+            
             chroma_path = getattr(settings, 'CHROMA_DB_PATH', './chroma_db')
             return Chroma(
                 persist_directory=chroma_path,
@@ -127,6 +246,9 @@ class QAService:
     async def ask_question(self, db: Session, qa_request: QARequest, user_id: UUID):
         """Xử lý câu hỏi từ người dùng"""
         
+        timer = StageTimer()
+        await self._ensure_initialized()
+        
         if not LANGCHAIN_AVAILABLE or not self.llm:
             # Fallback response when LLM not available
             return {
@@ -139,27 +261,59 @@ class QAService:
             }
         
         try:
-            # Get or create chat session
-            session = await self._get_or_create_session(db, qa_request.session_id, user_id)
+            # Get or create chat session and save the question in one commit
+            with timer.stage("session"):
+                session = await self._get_or_create_session(db, qa_request.session_id, user_id)
+                
+                user_message = ChatMessage(
+                    session_id=session.id,
+                    type="user",
+                    content=qa_request.question,
+                    timestamp=datetime.now()
+                )
+                db.add(user_message)
+                db.commit()
             
-            # Save user message
-            user_message = ChatMessage(
-                session_id=session.id,
-                type="user",
-                content=qa_request.question,
-                timestamp=datetime.now()
-            )
-            db.add(user_message)
-            db.commit()
+            # Conversation memory: running summary plus the last few turns verbatim
+            with timer.stage("history"):
+                recent_messages = self._load_recent_messages(db, session.id, user_message.id)
+                history_text = build_history(
+                    session.summary,
+                    recent_messages,
+                    int(settings.QA_CONTEXT_TOKEN_BUDGET * settings.CHAT_HISTORY_TOKEN_SHARE)
+                )
+            timer.count("history_tokens", estimate_tokens(history_text))
+            
+            # Follow-up questions are retrieved together with the previous question
+            retrieval_question = qa_request.question
+            previous_questions = [msg.content for msg in recent_messages if msg.type == "user"]
+            if previous_questions:
+                retrieval_question = f"{previous_questions[-1]}\n{qa_request.question}"
+            
+            # Get a wide pool of candidate passages for context
+            with timer.stage("retrieval"):
+                candidates = await self._get_relevant_documents(
+                    db, retrieval_question, qa_request.context, user_id
+                )
+            timer.count("candidates", len(candidates))
+            
+            # Rerank the pool and keep only the best few passages for the prompt
+            with timer.stage("rerank"):
+                relevant_docs = await asyncio.to_thread(
+                    rerank, self.reranker, retrieval_question, candidates, settings.RERANK_TOP_K
+                )
+            timer.count("passages", len(relevant_docs))
             
-            # Get relevant documents for context
-            relevant_docs = await self._get_relevant_documents(
-                db, qa_request.question, qa_request.context, user_id
+            # Documents get whatever the history and question leave of the budget
+            context_budget = (
+                settings.QA_CONTEXT_TOKEN_BUDGET
+                - estimate_tokens(history_text)
+                - estimate_tokens(qa_request.question)
             )
             
             # Generate answer using LLM
             answer, sources = await self._generate_answer(
-                qa_request.question, relevant_docs
+                qa_request.question, relevant_docs, history_text, context_budget, timer
             )
             
             # Save assistant message
@@ -168,15 +322,38 @@ class QAService:
                 type="assistant",
                 content=answer,
                 timestamp=datetime.now(),
-                sources=json.dumps([source.dict() for source in sources]) if sources else None,
+                sources=[source.model_dump(mode="json") for source in sources] if sources else None,
                 msg_metadata={
                     "model_used": getattr(settings, 'DEFAULT_LLM_MODEL', 'unknown'),
-                    "context_docs_count": len(relevant_docs)
+                    "context_docs_count": len(relevant_docs),
+                    "candidates_count": len(candidates),
+                    "reranker": self.reranker.name if self.reranker else None,
+                    "history_tokens": estimate_tokens(history_text),
+                    **timer.snapshot()
                 }
             )
-            db.add(assistant_message)
+            with timer.stage("persist"):
+                db.add(assistant_message)
+                db.commit()
+                db.refresh(assistant_message)
+            timer.finish(QA_STAGE_SECONDS)
+            
+            # The row cannot contain the time of its own insert, add it (and the final total) afterwards
+            metadata = dict(assistant_message.msg_metadata or {})
+            metadata["timings_ms"] = {
+                **metadata.get("timings_ms", {}),
+                "persist": timer.timings["persist"],
+                "total": timer.timings["total"]
+            }
+            assistant_message.msg_metadata = metadata
             db.commit()
-            db.refresh(assistant_message)
+            
+            # Fold turns that left the verbatim window into the summary, off the request path
+            if session.id not in self._summarizing:
+                self._summarizing.add(session.id)
+                task = asyncio.create_task(self._update_summary(session.id))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
             
             return {
                 "id": str(assistant_message.id),
@@ -206,8 +383,7 @@ class QAService:
             title=f"Chat session {datetime.now().strftime('%Y-%m-%d %H:%M')}"
         )
         db.add(session)
-        db.commit()
-        db.refresh(session)
+        db.flush()  # Committed together with the first message
         
         return session
 
@@ -218,9 +394,11 @@ class QAService:
         context_doc_ids: Optional[List[str]], 
         user_id: UUID
     ) -> List[Dict[str, Any]]:
-        """Tìm các tài liệu liên quan đến câu hỏi"""
+        """Tìm các đoạn văn ứng viên liên quan đến câu hỏi (được rerank sau đó)"""
         
         relevant_docs = []
+        pool_size = settings.RERANK_CANDIDATES
+        keywords = self._extract_keywords(question)
         
         if context_doc_ids:
             # Use specific documents if provided
@@ -243,8 +421,14 @@ class QAService:
                         "type": document.type
                     })
         else:
+            # Semantic search over indexed chunks first
+            if self.vector_store:
+                relevant_chunks = await self._search_vector_store(db, question, user_id, k=pool_size)
+                if relevant_chunks:
+                    return relevant_chunks
+            
             # Fallback: search by keywords in document text
-            keywords = self._extract_keywords(question)
+            seen_ids = set()
             for keyword in keywords:
                 documents = db.query(Document).filter(
                     and_(
@@ -252,11 +436,14 @@ class QAService:
                             Document.user_id == user_id,
                             Document.shared == True
                         ),
-                        Document.extracted_text.ilike(f"%{keyword}%")
+                        text_contains(keyword)
                     )
                 ).limit(3).all()
                 
                 for doc in documents:
+                    if doc.id in seen_ids:
+                        continue
+                    seen_ids.add(doc.id)
                     relevant_docs.append({
                         "id": str(doc.id),
                         "title": doc.name,
@@ -264,24 +451,188 @@ class QAService:
                         "type": doc.type
                     })
         
-        return relevant_docs[:5]  # Limit to top 5 documents
+        # Whole documents are split into passages so the reranker can pick the best ones
+        return self._split_passages(relevant_docs, keywords, pool_size)
 
-    async def _generate_answer(self, question: str, relevant_docs: List[Dict[str, Any]]) -> tuple[str, List[QASource]]:
+    def _split_passages(self, documents: List[Dict[str, Any]], keywords: List[str], limit: int) -> List[Dict[str, Any]]:
+        """Cắt tài liệu thành các đoạn, ưu tiên đoạn có chứa từ khoá"""
+        
+        matching, others = [], []
+        for doc in documents:
+            for chunk in iter_chunks(doc["content"], settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+                lowered = chunk["text"].lower()
+                passage = {**doc, "content": chunk["text"], "page": chunk["page"]}
+                if any(keyword in lowered for keyword in keywords):
+                    matching.append(passage)
+                else:
+                    others.append(passage)
+        
+        return (matching + others)[:limit]
+
+    async def _search_vector_store(self, db: Session, question: str, user_id: UUID, k: int = 20) -> List[Dict[str, Any]]:
+        """Tìm các chunk gần nhất trong vector store, chỉ giữ tài liệu người dùng được truy cập"""
+        
+        try:
+            # Query embedding goes through the async client, only the index lookup needs a thread
+            embedding = await with_retries(self.embeddings.aembed_query, question)
+            chunks = await asyncio.to_thread(self.vector_store.similarity_search_by_vector, embedding, k=k)
+        except Exception as e:
+            print(f"Warning: vector search failed: {e}")
+            return []
+        
+        document_ids = {chunk.metadata.get("document_id") for chunk in chunks if chunk.metadata.get("document_id")}
+        if not document_ids:
+            return []
+        
+        documents = db.query(Document.id, Document.name, Document.type).filter(
+            and_(
+                Document.id.in_([UUID(document_id) for document_id in document_ids]),
+                or_(
+                    Document.user_id == user_id,
+                    Document.shared == True
+                )
+            )
+        ).all()
+        documents_by_id = {str(doc.id): doc for doc in documents}
+        
+        relevant_chunks = []
+        for chunk in chunks:
+            doc = documents_by_id.get(chunk.metadata.get("document_id"))
+            if doc:
+                relevant_chunks.append({
+                    "id": str(doc.id),
+                    "title": doc.name,
+                    "content": chunk.page_content,
+                    "type": doc.type,
+                    "page": chunk.metadata.get("page")
+                })
+        
+        return relevant_chunks
+
+    def _load_recent_messages(self, db: Session, session_id: UUID, exclude_id: UUID) -> List[ChatMessage]:
+        """Lấy các lượt hội thoại gần nhất (theo thứ tự thời gian), không gồm câu hỏi hiện tại"""
+        
+        messages = db.query(ChatMessage).filter(
+            ChatMessage.session_id == session_id,
+            ChatMessage.id != exclude_id
+        ).order_by(
+            ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+        ).limit(settings.CHAT_HISTORY_TURNS * 2).all()
+        
+        return list(reversed(messages))
+
+    async def _update_summary(self, session_id: UUID):
+        """Gộp các tin nhắn đã ra khỏi cửa sổ gần nhất vào bản tóm tắt của session"""
+        
+        try:
+            if not self.summary_chain:
+                return
+            # Synchronous SQLAlchemy, kept off the event loop
+            batch = await asyncio.to_thread(self._summary_batch, session_id)
+            if batch is None:
+                return
+            
+            previous, summarized_count, transcript, count = batch
+            summary = await with_retries(self.summary_chain.ainvoke, {
+                "summary": previous or "(chưa có)",
+                "transcript": transcript,
+                "max_words": settings.CHAT_SUMMARY_MAX_TOKENS // 2
+            })
+            await asyncio.to_thread(
+                self._save_summary, session_id, summarized_count,
+                truncate_to_tokens(summary.strip(), settings.CHAT_SUMMARY_MAX_TOKENS), count
+            )
+            
+        except Exception as e:
+            print(f"Warning: could not update summary for session {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+    
+    @staticmethod
+    def _summary_batch(session_id: UUID):
+        """(tóm tắt hiện tại, số tin đã tóm tắt, transcript, số tin) của lô cần gộp, None nếu chưa cần"""
+        
+        db = SessionLocal()
+        try:
+            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            if not session:
+                return None
+            
+            summarized_count = session.summarized_count or 0
+            total = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count()
+            pending = total - settings.CHAT_HISTORY_TURNS * 2 - summarized_count
+            if pending < 2:
+                return None
+            
+            # Bounded batch so one call never has to read a whole long session
+            messages = db.query(ChatMessage).filter(
+                ChatMessage.session_id == session_id
+            ).order_by(
+                ChatMessage.timestamp.asc(), ChatMessage.id.asc()
+            ).offset(summarized_count).limit(min(pending, 20)).all()
+            
+            transcript = "\n".join(
+                format_message(msg.type, truncate_to_tokens(msg.content, 300)) for msg in messages
+            )
+            return session.summary, summarized_count, transcript, len(messages)
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _save_summary(session_id: UUID, summarized_count: int, summary: str, count: int):
+        """Lưu bản tóm tắt mới, trừ khi session đã được tóm tắt tiếp trong lúc chờ LLM"""
+        
+        db = SessionLocal()
+        try:
+            db.query(ChatSession).filter(
+                ChatSession.id == session_id,
+                func.coalesce(ChatSession.summarized_count, 0) == summarized_count
+            ).update({
+                ChatSession.summary: summary,
+                ChatSession.summarized_count: summarized_count + count
+            }, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _generate_answer(
+        self,
+        question: str,
+        relevant_docs: List[Dict[str, Any]],
+        history_text: str = "",
+        context_budget: Optional[int] = None,
+        timer: Optional[StageTimer] = None
+    ) -> tuple[str, List[QASource]]:
         """Tạo câu trả lời sử dụng LLM"""
         
-        # Prepare context from relevant documents
+        timer = timer or StageTimer()
+        pack_start = time.perf_counter()
+        
+        # Prepare context from relevant documents, within the token budget left by the history
         context_text = ""
         sources = []
+        remaining = context_budget if context_budget is not None else settings.QA_CONTEXT_TOKEN_BUDGET
         
         for doc in relevant_docs:
-            context_text += f"\n\n--- {doc['title']} ---\n{doc['content'][:1000]}"
+            if remaining <= 0:
+                break
+            page = doc.get('page')
+            heading = f"{doc['title']} (trang {page})" if page else doc['title']
+            passage = f"\n\n--- {heading} ---\n{truncate_to_tokens(doc['content'][:1000], remaining)}"
+            remaining -= estimate_tokens(passage)
+            context_text += passage
             sources.append(QASource(
                 title=doc['title'],
+                page=page,
                 excerpt=doc['content'][:200] + "..." if len(doc['content']) > 200 else doc['content'],
                 document_id=doc['id']
             ))
+        timer.record("pack", time.perf_counter() - pack_start)
         
-        if not LANGCHAIN_AVAILABLE or not self.llm:
+        if not LANGCHAIN_AVAILABLE or not self.answer_chain:
             # Simple fallback answer
             if relevant_docs:
                 return f"Dựa trên tài liệu '{relevant_docs[0]['title']}', tôi tìm thấy thông tin liên quan nhưng cần cấu hình AI để đưa ra câu trả lời chi tiết.", sources
@@ -289,37 +640,19 @@ class QAService:
                 return "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu của bạn.", sources
         
         try:
-            # Create prompt template
-            prompt_template = ChatPromptTemplate.from_template("""
-Bạn là một trợ lý AI thông minh, giúp trả lời câu hỏi dựa trên các tài liệu được cung cấp.
-
-Ngữ cảnh từ các tài liệu:
-{context}
-
-Câu hỏi của người dùng: {question}
-
-Hướng dẫn:
-1. Trả lời câu hỏi dựa trên thông tin trong các tài liệu được cung cấp
-2. Nếu không tìm thấy thông tin liên quan, hãy nói rõ điều đó
-3. Trả lời bằng tiếng Việt, rõ ràng và dễ hiểu
-4. Nếu có thể, hãy trích dẫn tên tài liệu chứa thông tin
-
-Câu trả lời:
-""")
-            
-            # Create chain
-            chain = (
-                {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
-                | prompt_template
-                | self.llm
-                | StrOutputParser()
-            )
+            # Generate answer, streamed from the model over the pooled async client
+            inputs = {"context": context_text, "history": history_text or "(không có)", "question": question}
+            timer.count("tokens_in", estimate_tokens(ANSWER_PROMPT) + sum(estimate_tokens(v) for v in inputs.values()))
             
-            # Generate answer
-            answer = await asyncio.to_thread(
-                chain.invoke,
-                {"context": context_text, "question": question}
-            )
+            parts = []
+            generation_start = time.perf_counter()
+            async for token in astream_with_retries(self.answer_chain, inputs):
+                if not parts:
+                    timer.record("first_token", time.perf_counter() - generation_start)
+                parts.append(token)
+            timer.record("generation", time.perf_counter() - generation_start)
+            answer = "".join(parts)
+            timer.count("tokens_out", estimate_tokens(answer))
             
             return answer, sources
             
@@ -346,37 +679,107 @@ Câu trả lời:
         
         return keywords[:5]  # Return top 5 keywords
 
-    async def get_history(self, db: Session, user_id: UUID) -> List[dict]:
-        """Lấy lịch sử hỏi đáp của người dùng"""
+    async def get_history(self, db: Session, user_id: UUID, limit: int = 10, messages_per_session: int = 4) -> List[dict]:
+        """Lấy lịch sử hỏi đáp của người dùng (một truy vấn duy nhất)"""
         
-        sessions = db.query(ChatSession).filter(
+        sessions = select(
+            ChatSession.id, ChatSession.title, ChatSession.created_at, ChatSession.updated_at
+        ).where(
             ChatSession.user_id == user_id
-        ).order_by(ChatSession.updated_at.desc()).limit(10).all()
+        ).order_by(ChatSession.updated_at.desc()).limit(limit).subquery()
+        
+        # Last N messages of each selected session, numbered newest first
+        recent = select(
+            ChatMessage.id,
+            ChatMessage.session_id,
+            ChatMessage.type,
+            func.substr(ChatMessage.content, 1, 101).label("content"),
+            ChatMessage.timestamp,
+            func.row_number().over(
+                partition_by=ChatMessage.session_id,
+                order_by=(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+            ).label("rn")
+        ).where(
+            ChatMessage.session_id.in_(select(sessions.c.id))
+        ).subquery()
+        
+        rows = db.execute(
+            select(
+                sessions,
+                recent.c.id.label("message_id"),
+                recent.c.type,
+                recent.c.content,
+                recent.c.timestamp
+            ).outerjoin(
+                recent,
+                and_(recent.c.session_id == sessions.c.id, recent.c.rn <= messages_per_session)
+            ).order_by(sessions.c.updated_at.desc(), sessions.c.id, recent.c.rn.desc())
+        ).all()
         
         history = []
-        for session in sessions:
-            messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session.id
-            ).order_by(ChatMessage.timestamp.desc()).limit(4).all()
+        history_by_session = {}
+        for row in rows:
+            session_data = history_by_session.get(row.id)
+            if session_data is None:
+                session_data = {
+                    "session_id": str(row.id),
+                    "title": row.title,
+                    "created_at": row.created_at.isoformat(),
+                    "updated_at": row.updated_at.isoformat(),
+                    "recent_messages": []
+                }
+                history_by_session[row.id] = session_data
+                history.append(session_data)
             
-            session_data = {
-                "session_id": str(session.id),
-                "title": session.title,
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat(),
-                "recent_messages": [
-                    {
-                        "id": str(msg.id),
-                        "type": msg.type,
-                        "content": msg.content[:100] + "..." if len(msg.content) > 100 else msg.content,
-                        "timestamp": msg.timestamp.isoformat()
-                    } for msg in reversed(messages)
-                ]
-            }
-            history.append(session_data)
+            if row.message_id is not None:
+                session_data["recent_messages"].append({
+                    "id": str(row.message_id),
+                    "type": row.type,
+                    "content": row.content[:100] + "..." if len(row.content) > 100 else row.content,
+                    "timestamp": row.timestamp.isoformat()
+                })
         
         return history
 
+    async def get_latency_stats(self, db: Session, hours: int = 24, limit: int = 5000) -> Dict[str, Any]:
+        """Tổng hợp phân vị thời gian từng giai đoạn từ msg_metadata của các câu trả lời gần đây"""
+        
+        since = datetime.now() - timedelta(hours=hours)
+        rows = db.query(ChatMessage.msg_metadata).filter(
+            ChatMessage.type == "assistant",
+            ChatMessage.timestamp >= since
+        ).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
+        
+        timings = {stage: [] for stage in QA_STAGES}
+        counts = {}
+        for (metadata,) in rows:
+            for stage, ms in ((metadata or {}).get("timings_ms") or {}).items():
+                timings.setdefault(stage, []).append(ms)
+            for name, value in ((metadata or {}).get("counts") or {}).items():
+                counts.setdefault(name, []).append(value)
+        
+        return {
+            "window_hours": hours,
+            "answers": len(rows),
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 50),
+                    "p90_ms": percentile(values, 90),
+                    "p95_ms": percentile(values, 95),
+                    "p99_ms": percentile(values, 99),
+                    "max_ms": max(values, default=0.0)
+                } for stage, values in timings.items() if values
+            },
+            "counts": {
+                name: {
+                    "avg": round(sum(values) / len(values), 1),
+                    "p95": percentile(values, 95),
+                    "max": max(values)
+                } for name, values in counts.items() if values
+            }
+        }
+
     async def create_session(self, db: Session, session_data: ChatSessionCreate, user_id: UUID):
         """Tạo session chat mới"""
         
@@ -397,8 +800,15 @@ Câu trả lời:
             "message_count": 0
         }
 
-    async def get_session(self, db: Session, session_id: str, user_id: UUID):
-        """Lấy chi tiết session chat"""
+    async def get_session(
+        self,
+        db: Session,
+        session_id: str,
+        user_id: UUID,
+        before: Optional[str] = None,
+        limit: int = 50
+    ):
+        """Lấy chi tiết session chat, tin nhắn được phân trang theo cursor (mới nhất trước)"""
         
         session = db.query(ChatSession).filter(
             and_(ChatSession.id == session_id, ChatSession.user_id == user_id)
@@ -407,9 +817,23 @@ Câu trả lời:
         if not session:
             raise HTTPException(status_code=404, detail="Không tìm thấy session chat")
         
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session.id
-        ).order_by(ChatMessage.timestamp.asc()).all()
+        query = db.query(ChatMessage).filter(ChatMessage.session_id == session.id)
+        if before:
+            # Cursor is the id of the oldest message already loaded
+            cursor = select(ChatMessage.timestamp).where(ChatMessage.id == before).scalar_subquery()
+            query = query.filter(
+                or_(
+                    ChatMessage.timestamp < cursor,
+                    and_(ChatMessage.timestamp == cursor, ChatMessage.id < before)
+                )
+            )
+        
+        messages = query.order_by(
+            ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+        ).limit(limit + 1).all()
+        
+        has_more = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
         
         return {
             "id": str(session.id),
@@ -422,41 +846,156 @@ Câu trả lời:
                     "type": msg.type,
                     "content": msg.content,
                     "timestamp": msg.timestamp.isoformat(),
-                    "sources": json.loads(msg.sources) if msg.sources else None,
+                    "sources": self._load_sources(msg.sources),
                     "rating": msg.rating
                 } for msg in messages
-            ]
+            ],
+            "has_more": has_more,
+            "next_cursor": str(messages[0].id) if has_more else None
         }
 
+    @staticmethod
+    def _load_sources(sources):
+        """Đọc cột sources; các bản ghi cũ lưu chuỗi JSON lồng trong JSON"""
+        if isinstance(sources, str):
+            return json.loads(sources)
+        return sources
+
     async def index_document(self, document_id: UUID, document_text: str, document_metadata: dict):
         """Đánh index tài liệu vào vector store"""
         
-        if not self.vector_store or not self.text_splitter:
+        await self._ensure_initialized()
+        
+        if not self.vector_store:
             print(f"Vector store not available, skipping indexing for document {document_id}")
             return False
         
         try:
-            # Split document into chunks
-            texts = self.text_splitter.split_text(document_text)
-            
-            # Create documents for vector store
-            documents = []
-            for i, text in enumerate(texts):
-                doc = LangChainDocument(
-                    page_content=text,
-                    metadata={
-                        **document_metadata,
-                        "document_id": str(document_id),
-                        "chunk_index": i
-                    }
-                )
-                documents.append(doc)
+            # Chunks are produced lazily and embedded in batches, so memory use
+            # does not grow with the size of the document
+            batch = []
+            for chunk in iter_chunks(document_text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+                metadata = {
+                    **document_metadata,
+                    "document_id": str(document_id),
+                    "chunk_index": chunk["chunk_index"],
+                    "start": chunk["start"],
+                    "end": chunk["end"]
+                }
+                # Chroma rejects None metadata values
+                if chunk["page"] is not None:
+                    metadata["page"] = chunk["page"]
+                if chunk["heading"]:
+                    metadata["heading"] = chunk["heading"]
+                batch.append(LangChainDocument(page_content=chunk["text"], metadata=metadata))
+                
+                if len(batch) >= settings.INDEX_BATCH_SIZE:
+                    # Embedding is CPU/network bound, keep it off the event loop
+                    await asyncio.to_thread(self.vector_store.add_documents, batch)
+                    batch = []
             
-            # Add to vector store
-            self.vector_store.add_documents(documents)
+            if batch:
+                await asyncio.to_thread(self.vector_store.add_documents, batch)
             
             return True
             
         except Exception as e:
             print(f"Error indexing document {document_id}: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def copy_document_index(self, source_document_id: UUID, document_id: UUID, document_metadata: dict) -> int:
+        """Dùng lại chunk và embedding của tài liệu cùng nội dung thay vì embed lại.
+
+        Trả về số chunk đã sao chép (0 nếu tài liệu nguồn chưa được index).
+        """
+
+        await self._ensure_initialized()
+
+        if not self.vector_store:
+            return 0
+
+        metadata = {**document_metadata, "document_id": str(document_id)}
+        try:
+            if hasattr(self.vector_store, "copy_document"):
+                return await asyncio.to_thread(
+                    self.vector_store.copy_document, source_document_id, document_id, metadata
+                )
+
+            collection = self.vector_store._collection
+            existing = await asyncio.to_thread(
+                collection.get,
+                where={"document_id": str(source_document_id)},
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not existing["ids"]:
+                return 0
+
+            await asyncio.to_thread(
+                collection.add,
+                ids=[f"{document_id}-{i}" for i in range(len(existing["ids"]))],
+                embeddings=existing["embeddings"],
+                documents=existing["documents"],
+                metadatas=[{**m, **metadata} for m in existing["metadatas"]]
+            )
+            return len(existing["ids"])
+
+        except Exception as e:
+            print(f"Error copying index from {source_document_id} to {document_id}: {e}")
+            return 0
+
+    async def index_document_from_duplicate(
+        self, document_id: UUID, content_hash: Optional[str], document_text: str, document_metadata: dict
+    ) -> bool:
+        """Index tài liệu bằng cách sao chép từ tài liệu khác có cùng nội dung (nếu có).
+
+        Chỉ dùng nguồn có cùng content_hash và cùng extracted_text, để bản đã
+        chỉnh sửa OCR của một tài liệu không lan sang tài liệu khác.
+        """
+
+        if not content_hash or not document_text:
+            return False
+
+        db = SessionLocal()
+        try:
+            duplicates = db.query(Document.id).filter(
+                Document.content_hash == content_hash,
+                Document.id != document_id,
+                Document.is_processed == True,
+                Document.text_hash == text_hash(document_text)
+            ).limit(5).all()
+        finally:
+            db.close()
+
+        for (source_id,) in duplicates:
+            if await self.copy_document_index(source_id, document_id, document_metadata):
+                return True
+        return False
+
+    async def remove_document(self, document_id: UUID) -> bool:
+        """Gỡ toàn bộ chunk của tài liệu khỏi vector store (khi xoá hoặc cập nhật nội dung)"""
+        
+        await self._ensure_initialized()
+        
+        if not self.vector_store:
+            return False
+        
+        try:
+            if hasattr(self.vector_store, "delete_document"):
+                # Built-in index: delete rows and tombstone, compaction reclaims the space
+                await asyncio.to_thread(self.vector_store.delete_document, document_id)
+            else:
+                await asyncio.to_thread(
+                    self.vector_store._collection.delete,
+                    where={"document_id": str(document_id)}
+                )
+            return True
+            
+        except Exception as e:
+            print(f"Error removing document {document_id} from vector store: {e}")
+            return False
+
+    async def reindex_document(self, document_id: UUID, document_text: str, document_metadata: dict):
+        """Thay các chunk cũ của tài liệu bằng chunk từ nội dung mới"""
+        
+        await self.remove_document(document_id)
+        return await self.index_document(document_id, document_text, document_metadata)
\ No newline at end of file
@@ -0,0 +1,137 @@
+# app/services/reranker.py
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional
+
+from database import settings
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+class BM25Reranker:
+    """Reranker từ vựng BM25, IDF tính trên chính tập ứng viên. Không cần model."""
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def load(self):
+        pass
+
+    def score(self, question: str, passages: List[str]) -> List[float]:
+        query_terms = set(_tokenize(question))
+        if not query_terms or not passages:
+            return [0.0] * len(passages)
+
+        term_counts = [Counter(_tokenize(passage)) for passage in passages]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / len(lengths)) or 1.0
+
+        n = len(passages)
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for counts in term_counts if term in counts)
+            idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        scores = []
+        for counts, length in zip(term_counts, lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    score += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker:
+    """Cross-encoder nhỏ chạy trên CPU (sentence-transformers), nạp ở lần dùng đầu tiên"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Nạp model (gọi từ warm-up)"""
+        return self._get_model()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def score(self, question: str, passages: List[str]) -> List[float]:
+        if not passages:
+            return []
+        scores = self._get_model().predict([(question, passage) for passage in passages])
+        return [float(score) for score in scores]
+
+
+def get_reranker():
+    """Tạo reranker theo RERANKER_TYPE (bm25, cross-encoder, none)"""
+    if settings.RERANKER_TYPE == "none":
+        return None
+    if settings.RERANKER_TYPE == "cross-encoder":
+        try:
+            import sentence_transformers  # noqa: F401
+            return CrossEncoderReranker(settings.RERANKER_MODEL)
+        except ImportError:
+            print("Warning: sentence-transformers not available, falling back to BM25 reranker")
+    return BM25Reranker()
+
+
+def rerank(
+    reranker,
+    question: str,
+    candidates: List[Dict[str, Any]],
+    top_k: int,
+    batch_size: Optional[int] = None,
+    timeout_ms: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Chấm điểm ứng viên theo từng batch và giữ lại top_k tốt nhất.
+
+    Khi vượt quá thời gian cho phép, các ứng viên chưa được chấm giữ nguyên thứ
+    tự retrieval và xếp sau các ứng viên đã chấm.
+    """
+    if reranker is None or len(candidates) <= 1:
+        return candidates[:top_k]
+
+    batch_size = batch_size or settings.RERANK_BATCH_SIZE
+    timeout_ms = timeout_ms if timeout_ms is not None else settings.RERANK_TIMEOUT_MS
+
+    # BM25 needs corpus statistics, so it always scores the whole pool at once
+    if isinstance(reranker, BM25Reranker):
+        batch_size = len(candidates)
+
+    deadline = time.perf_counter() + timeout_ms / 1000.0
+    scored = []
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        scores = reranker.score(question, [f"{c.get('title', '')}\n{c['content']}" for c in batch])
+        scored.extend(zip(scores, range(start, start + len(batch))))
+        if time.perf_counter() > deadline:
+            break
+
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    order = [i for _, i in scored] + list(range(len(scored), len(candidates)))
+
+    results = []
+    for rank, i in enumerate(order[:top_k]):
+        candidate = dict(candidates[i])
+        if rank < len(scored):
+            candidate["rerank_score"] = scored[rank][0]
+        results.append(candidate)
+    return results
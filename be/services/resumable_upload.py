@@ -0,0 +1,295 @@
+# app/services/resumable_upload.py
+import asyncio
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+import aiofiles
+import magic
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+
+from models import UploadSession
+from schemas import UploadSessionCreate
+from database import settings
+from services.upload_stream import SNIFF_BYTES, StagedFile, too_large_error
+from services.folder_service import FolderService, normalize_path
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+HASH_BLOCK = 1024 * 1024
+
+def parse_content_range(header: Optional[str]) -> Tuple[int, int, int]:
+    """'bytes start-end/total' (end tính cả) -> (start, end_exclusive, total)"""
+    match = CONTENT_RANGE.match((header or "").strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Thiếu hoặc sai header Content-Range (bytes start-end/total)")
+    start, end, total = (int(group) for group in match.groups())
+    if start > end or end >= total:
+        raise HTTPException(status_code=416, detail="Khoảng byte không hợp lệ")
+    return start, end + 1, total
+
+def merge_ranges(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Thêm [start, end) vào danh sách khoảng đã sắp xếp và gộp các khoảng chồng/liền nhau"""
+    merged = []
+    for lo, hi in sorted([*ranges, [start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+class _PartFile(StagedFile):
+    """File .part đã ghép: chỉ complete() được xoá nó, để một lần tạo Document bị từ chối
+    (vd. vượt hạn mức) không buộc client upload lại toàn bộ"""
+
+    def discard(self):
+        pass
+
+
+def _hash_file(path: str) -> Tuple[str, bytes]:
+    """sha256 của file và SNIFF_BYTES đầu tiên (để nhận diện MIME)"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+        sha256.update(head)
+        while block := f.read(HASH_BLOCK):
+            sha256.update(block)
+    return sha256.hexdigest(), head
+
+
+class ResumableUploadService:
+    """Upload nhiều phần, có thể tiếp tục khi mất kết nối.
+
+    Client tạo phiên upload, PUT từng khoảng byte (Content-Range, thứ tự bất kỳ,
+    có thể gửi lại), hỏi phần đã nhận, rồi gọi complete. Mỗi khoảng được ghi
+    thẳng vào đúng vị trí trong file .part (không đệm trong bộ nhớ); khi hoàn tất,
+    checksum được kiểm tra và file được chuyển cho DocumentService.create_document.
+    """
+
+    def __init__(self, document_service):
+        self.document_service = document_service
+        self.parts_dir = os.path.join(settings.UPLOAD_DIR, ".resumable")
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+    def _get_session(self, db: Session, upload_id: str, user_id: UUID, lock: bool = False) -> UploadSession:
+        try:
+            upload_id = UUID(str(upload_id))
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Không tìm thấy phiên upload")
+
+        query = db.query(UploadSession).filter(
+            UploadSession.id == upload_id,
+            UploadSession.user_id == user_id
+        )
+        if lock:
+            query = query.with_for_update()
+        session = query.first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Không tìm thấy phiên upload")
+        return session
+
+    def _require_active(self, session: UploadSession):
+        if session.status == "active" and session.expires_at < datetime.utcnow():
+            raise HTTPException(status_code=410, detail="Phiên upload đã hết hạn")
+        if session.status != "active":
+            raise HTTPException(status_code=409, detail=f"Phiên upload không còn nhận dữ liệu (trạng thái: {session.status})")
+
+    def _status(self, session: UploadSession) -> dict:
+        ranges = session.received_ranges or []
+        # Contiguous prefix: what a client resuming sequentially should send next
+        offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+        return {
+            "upload_id": str(session.id),
+            "filename": session.filename,
+            "size": session.total_size,
+            "received_bytes": session.received_bytes,
+            "offset": offset,
+            "received_ranges": ranges,
+            "status": session.status,
+            "folder": session.folder,
+            "document_id": str(session.document_id) if session.document_id else None,
+            "part_size": settings.UPLOAD_PART_SIZE,
+            "expires_at": session.expires_at.isoformat()
+        }
+
+    async def create_session(self, db: Session, data: UploadSessionCreate, user_id: UUID):
+        """Tạo phiên upload và cấp phát sẵn file .part đủ kích thước"""
+
+        self.document_service._validate_filename(data.filename)
+        folder = normalize_path(data.folder)
+        if data.size > settings.MAX_FILE_SIZE:
+            raise too_large_error(settings.MAX_FILE_SIZE)
+        # Checked again, against the committed usage, when the upload completes
+        FolderService.check_quota(db, user_id, data.size)
+
+        session = UploadSession(
+            user_id=user_id,
+            filename=os.path.basename(data.filename.replace("\\", "/")),
+            total_size=data.size,
+            sha256=data.sha256.lower() if data.sha256 else None,
+            part_path="",
+            folder=folder,
+            received_ranges=[],
+            received_bytes=0,
+            status="active",
+            expires_at=self._expiry()
+        )
+        db.add(session)
+        db.flush()
+
+        session.part_path = os.path.join(self.parts_dir, f"{session.id}.part")
+        # Sparse file of the final size, so ranges can be written at their offsets in any order
+        with open(session.part_path, "wb") as f:
+            f.truncate(data.size)
+
+        db.commit()
+        db.refresh(session)
+        return self._status(session)
+
+    async def get_status(self, db: Session, upload_id: str, user_id: UUID):
+        """Trạng thái phiên upload: các khoảng byte đã nhận và offset liên tục"""
+        return self._status(self._get_session(db, upload_id, user_id))
+
+    async def upload_range(self, db: Session, upload_id: str, request: Request, user_id: UUID):
+        """Ghi một khoảng byte (body của PUT) vào file .part"""
+
+        session = self._get_session(db, upload_id, user_id)
+        self._require_active(session)
+
+        start, end, total = parse_content_range(request.headers.get("content-range"))
+        if total != session.total_size:
+            raise HTTPException(status_code=416, detail="Tổng kích thước không khớp với phiên upload")
+
+        # Optional per-range checksum, so a corrupted range is rejected now rather than at completion
+        expected_hash = request.headers.get("x-content-sha256")
+        range_hash = hashlib.sha256() if expected_hash else None
+
+        part_path = session.part_path
+        # Release the connection while the body streams in
+        db.commit()
+
+        written = 0
+        async with aiofiles.open(part_path, "r+b") as f:
+            await f.seek(start)
+            async for chunk in request.stream():
+                if written + len(chunk) > end - start:
+                    raise HTTPException(status_code=400, detail="Dữ liệu dài hơn khoảng byte đã khai báo")
+                await f.write(chunk)
+                if range_hash:
+                    range_hash.update(chunk)
+                written += len(chunk)
+
+        if written != end - start:
+            raise HTTPException(status_code=400, detail="Dữ liệu ngắn hơn khoảng byte đã khai báo, hãy gửi lại")
+        if range_hash and range_hash.hexdigest() != expected_hash.lower():
+            raise HTTPException(status_code=422, detail="Checksum của khoảng byte không khớp, hãy gửi lại")
+
+        # Record the range under a row lock, PUTs for the same upload may run concurrently
+        session = self._get_session(db, upload_id, user_id, lock=True)
+        self._require_active(session)
+        ranges = merge_ranges(session.received_ranges or [], start, end)
+        session.received_ranges = ranges
+        session.received_bytes = sum(hi - lo for lo, hi in ranges)
+        session.expires_at = self._expiry()
+        db.commit()
+
+        return self._status(session)
+
+    async def complete(self, db: Session, upload_id: str, user_id: UUID):
+        """Kiểm tra đủ dữ liệu và checksum rồi tạo Document từ file đã ghép"""
+
+        session = self._get_session(db, upload_id, user_id, lock=True)
+        if session.status == "completed":
+            return {**self._status(session), "message": "Phiên upload đã hoàn tất trước đó"}
+        self._require_active(session)
+
+        ranges = session.received_ranges or []
+        if ranges != [[0, session.total_size]]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Chưa nhận đủ dữ liệu ({session.received_bytes}/{session.total_size} bytes)"
+            )
+        # Before hashing: over the quota, the session stays active with all its data
+        FolderService.check_quota(db, user_id, session.total_size)
+
+        # Claim the session so a concurrent complete does not create a second document
+        session.status = "finalizing"
+        db.commit()
+
+        try:
+            sha256, head = await asyncio.to_thread(_hash_file, session.part_path)
+        except Exception:
+            self._reopen(db, session)
+            raise
+
+        if session.sha256 and sha256 != session.sha256:
+            # No way to tell which range is bad, the client has to send the file again
+            self._reopen(db, session, reset=True)
+            raise HTTPException(status_code=422, detail="Checksum của file không khớp, hãy upload lại")
+
+        mime_type = magic.from_buffer(head, mime=True) if head else "application/x-empty"
+        staged = _PartFile(session.part_path, session.filename, session.total_size, sha256, mime_type)
+        try:
+            result = await self.document_service.create_document(db, staged, user_id, folder=session.folder or "root")
+        except Exception:
+            # The part file is kept unless the blob store already took it
+            self._reopen(db, session, reset=not os.path.exists(session.part_path))
+            raise
+
+        # Left behind when the blob store already had the same content
+        if os.path.exists(session.part_path):
+            os.remove(session.part_path)
+        session.status = "completed"
+        session.document_id = UUID(result["id"])
+        db.commit()
+
+        return {**result, "upload_id": str(session.id)}
+
+    def _reopen(self, db: Session, session: UploadSession, reset: bool = False):
+        """Đưa phiên về trạng thái nhận dữ liệu sau khi complete thất bại"""
+        db.rollback()
+        if reset:
+            with open(session.part_path, "wb") as f:
+                f.truncate(session.total_size)
+            session.received_ranges = []
+            session.received_bytes = 0
+        session.status = "active"
+        db.commit()
+
+    async def abort(self, db: Session, upload_id: str, user_id: UUID):
+        """Huỷ phiên upload và xoá dữ liệu đã nhận"""
+
+        session = self._get_session(db, upload_id, user_id, lock=True)
+        if session.status not in ("active", "expired"):
+            raise HTTPException(status_code=409, detail=f"Không thể huỷ phiên upload (trạng thái: {session.status})")
+
+        if os.path.exists(session.part_path):
+            os.remove(session.part_path)
+        session.status = "aborted"
+        db.commit()
+
+        return {"message": "Đã huỷ phiên upload"}
+
+    @staticmethod
+    def expire_stale(db: Session) -> int:
+        """Đánh dấu hết hạn các phiên quá hạn và xoá file .part của chúng"""
+
+        stale = db.query(UploadSession).filter(
+            # A finalizing session past its expiry was interrupted by a crash
+            UploadSession.status.in_(["active", "finalizing"]),
+            UploadSession.expires_at < datetime.utcnow()
+        ).with_for_update(skip_locked=True).all()
+
+        for session in stale:
+            if os.path.exists(session.part_path):
+                os.remove(session.part_path)
+            session.status = "expired"
+        db.commit()
+
+        return len(stale)
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 
 from models import Document, SearchHistory, DocumentPermission
 from schemas import SearchRequest
+from services.text_store import text_contains
+from services.folder_service import in_subtree, normalize_path
 
 class SearchService:
     def __init__(self):
@@ -81,7 +83,7 @@ class SearchService:
                 text_conditions.append(
                     or_(
                         Document.name.ilike(f"%{term}%"),
-                        Document.extracted_text.ilike(f"%{term}%")
+                        text_contains(term)
                     )
                 )
             
@@ -119,9 +121,9 @@ class SearchService:
             except:
                 pass
         
-        # Filter by folder
+        # Filter by folder, subfolders included (an index range scan on the path)
         if filters.get("folder"):
-            query = query.filter(Document.folder == filters["folder"])
+            query = query.filter(in_subtree(Document.folder, normalize_path(filters["folder"])))
         
         # Filter by processing status
         if filters.get("processed") is not None:
@@ -285,19 +287,19 @@ class SearchService:
 # app/services/report_service.py
 import os
 import asyncio
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from typing import List, Dict, Any
 from uuid import UUID
 from datetime import datetime
-from docx import Document as DocxDocument
-from docx.shared import Inches
 import json
 
 from models import Report, Document, ChatMessage
 from schemas import ReportCreate
 from config import settings
+from services.file_delivery import serve_file
+from services.folder_service import FolderService
 
 class ReportService:
     def __init__(self):
@@ -392,6 +394,16 @@ class ReportService:
         if date_to:
             query = query.filter(Document.upload_date <= datetime.fromisoformat(date_to))
         
+        # Statistics are aggregated by the database, not from the loaded rows
+        type_stats = query.with_entities(
+            Document.type, func.count(Document.id), func.coalesce(func.sum(Document.size_bytes), 0)
+        ).group_by(Document.type).all()
+        if document_ids or date_from or date_to:
+            total_size = sum(size for _, _, size in type_stats)
+        else:
+            # All of the user's documents: the usage counter already holds the total
+            total_size = FolderService.usage(db, user_id)[1]
+        
         documents = query.all()
         
         # Generate summary content
@@ -399,21 +411,9 @@ class ReportService:
         content += f"**Ngày tạo:** {datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
         content += f"**Tổng số tài liệu:** {len(documents)}\n\n"
         
-        # Document statistics
-        type_stats = {}
-        total_size = 0
-        
-        for doc in documents:
-            doc_type = doc.type
-            type_stats[doc_type] = type_stats.get(doc_type, 0) + 1
-            
-            # Try to get file size from metadata
-            if doc.metadata and 'file_size_bytes' in doc.metadata:
-                total_size += doc.metadata['file_size_bytes']
-        
         content += "## Thống kê theo loại tài liệu\n\n"
-        for doc_type, count in type_stats.items():
-            content += f"- **{doc_type}:** {count} tài liệu\n"
+        for doc_type, count, size in type_stats:
+            content += f"- **{doc_type}:** {count} tài liệu ({self._format_file_size(size)})\n"
         
         content += f"\n**Tổng dung lượng:** {self._format_file_size(total_size)}\n\n"
         
@@ -488,20 +488,24 @@ class ReportService:
     async def _generate_activity_report(self, db: Session, config: Dict[str, Any], user_id: UUID) -> tuple[str, str]:
         """Tạo báo cáo hoạt động"""
         
-        # Get user's documents and activities
-        documents = db.query(Document).filter(Document.user_id == user_id).all()
+        # Totals from the usage counters and COUNT queries, documents are not loaded
+        total_documents, total_size = FolderService.usage(db, user_id)
+        user_documents = db.query(Document).filter(Document.user_id == user_id)
+        processed = user_documents.filter(Document.is_processed == True).count()
+        shared = user_documents.filter(Document.shared == True).count()
         
         content = f"# Báo cáo hoạt động người dùng\n\n"
         content += f"**Ngày tạo:** {datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
         
         # Document statistics
         content += "## Thống kê tài liệu\n\n"
-        content += f"- **Tổng số tài liệu:** {len(documents)}\n"
-        content += f"- **Tài liệu đã xử lý:** {sum(1 for doc in documents if doc.is_processed)}\n"
-        content += f"- **Tài liệu được chia sẻ:** {sum(1 for doc in documents if doc.shared)}\n\n"
+        content += f"- **Tổng số tài liệu:** {total_documents}\n"
+        content += f"- **Tổng dung lượng:** {self._format_file_size(total_size)}\n"
+        content += f"- **Tài liệu đã xử lý:** {processed}\n"
+        content += f"- **Tài liệu được chia sẻ:** {shared}\n\n"
         
         # Recent uploads
-        recent_docs = sorted(documents, key=lambda x: x.upload_date, reverse=True)[:10]
+        recent_docs = user_documents.order_by(Document.upload_date.desc()).limit(10).all()
         content += "## Tài liệu tải lên gần đây\n\n"
         for doc in recent_docs:
             content += f"- **{doc.name}** ({doc.type}) - {doc.upload_date.strftime('%d/%m/%Y %H:%M')}\n"
@@ -517,6 +521,8 @@ class ReportService:
         """Tạo file DOCX từ nội dung markdown"""
         
         try:
+            from docx import Document as DocxDocument
+            
             doc = DocxDocument()
             
             # Parse markdown content and add to document
@@ -600,8 +606,8 @@ class ReportService:
             "file_path": report.file_path
         }
 
-    async def download_report(self, db: Session, report_id: str, user_id: UUID):
-        """Tải báo cáo"""
+    async def download_report(self, db: Session, request: Request, report_id: str, user_id: UUID):
+        """Tải file báo cáo (DOCX)"""
         
         report = db.query(Report).filter(
             and_(Report.id == report_id, Report.created_by == user_id)
@@ -613,11 +619,13 @@ class ReportService:
         if not report.file_path or not os.path.exists(report.file_path):
             raise HTTPException(status_code=404, detail="File báo cáo không tồn tại")
         
-        return {
-            "file_path": report.file_path,
-            "filename": f"{report.title}.docx",
-            "content_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        }
+        # Report files are written once and never modified, the stat-based ETag is strong
+        return serve_file(
+            request,
+            report.file_path,
+            filename=f"{report.title}.docx",
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
 
     def _format_file_size(self, size_bytes: int) -> str:
         """Format file size to human readable string"""
@@ -0,0 +1,167 @@
+# app/services/text_store.py
+import codecs
+import functools
+import hashlib
+import io
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from models import TextContent, Document, OCRResult, FileBlob
+
+try:
+    import zstandard
+except ImportError:
+    # zlib is slower and compresses less, but always available
+    zstandard = None
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+READ_CHUNK_BYTES = 64 * 1024
+
+# No stemming or stop words: the documents are mostly Vietnamese
+SEARCH_CONFIG = "simple"
+# Text per to_tsvector call: the word positions of a whole book exceed the 1MB tsvector limit
+# before strip() removes them
+SEARCH_CHUNK_CHARS = 100_000
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def encode_text(text: str) -> Tuple[str, bytes]:
+    """Nén text (UTF-8), trả về (codec, data)"""
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+def _iter_raw(codec: str, data: bytes) -> Iterator[bytes]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Text was compressed with zstd but the zstandard package is not installed")
+        yield from zstandard.ZstdDecompressor().read_to_iter(io.BytesIO(data), write_size=READ_CHUNK_BYTES)
+    elif codec == "zlib":
+        decompressor = zlib.decompressobj()
+        pending = data
+        while pending:
+            yield decompressor.decompress(pending, READ_CHUNK_BYTES)
+            pending = decompressor.unconsumed_tail
+        yield decompressor.flush()
+    else:
+        raise ValueError(f"Unknown text codec: {codec}")
+
+def iter_decoded(codec: str, data: bytes) -> Iterator[str]:
+    """Giải nén dần từng đoạn text, không tạo chuỗi đầy đủ trong bộ nhớ"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for block in _iter_raw(codec, data):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def decode_text(codec: str, data: bytes) -> str:
+    return "".join(iter_decoded(codec, data))
+
+def search_vector(text: str):
+    """Biểu thức SQL tạo tsvector của text; strip() bỏ vị trí từ, chỉ cần biết từ có xuất hiện hay không"""
+    parts = []
+    start = 0
+    while start < len(text) or not parts:
+        end = min(start + SEARCH_CHUNK_CHARS, len(text))
+        if end < len(text):
+            # Cut on whitespace so no word is split between two chunks
+            space = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+            end = space if space > start else end
+        parts.append(func.strip(func.to_tsvector(SEARCH_CONFIG, text[start:end])))
+        start = end
+    return functools.reduce(lambda vector, part: vector.op("||")(part), parts)
+
+def text_contains(term: str):
+    """Điều kiện lọc Document có text chứa mọi từ của `term` (không phân biệt hoa thường, dùng GIN index)"""
+    return Document.text_hash.in_(
+        select(TextContent.hash).where(
+            TextContent.search_vector.op("@@")(func.plainto_tsquery(SEARCH_CONFIG, term))
+        )
+    )
+
+
+class TextStore:
+    """Kho text đã trích xuất (PDF/DOCX/OCR), nén và lưu một lần cho mỗi nội dung.
+
+    Document, OCRResult và FileBlob chỉ giữ hash (text_hash) trỏ tới dòng
+    text_contents, nên các bảng đó không phải chứa vài MB text mỗi dòng và text
+    giống nhau chỉ lưu một bản. Dòng không còn được tham chiếu bị dọn bởi
+    collect_garbage (task bảo trì).
+    """
+
+    @staticmethod
+    def put(db: Session, text: str) -> TextContent:
+        """Lưu text (nếu chưa có) và trả về dòng text_contents tương ứng (chưa commit)"""
+
+        digest = text_hash(text)
+        content = db.get(TextContent, digest)
+        if content is not None:
+            return content
+
+        codec, data = encode_text(text)
+        content = TextContent(hash=digest, codec=codec, data=data, length=len(text))
+        if db.get_bind().dialect.name == "postgresql":
+            # Words for keyword search, indexed once per distinct text like the text itself
+            content.search_vector = search_vector(text)
+        try:
+            with db.begin_nested():
+                db.add(content)
+        except IntegrityError:
+            # Stored concurrently by another request, the row is identical
+            content = db.get(TextContent, digest)
+        except (DataError, OperationalError):
+            # A tsvector holds at most 1MB of distinct words, such a text is only found by name
+            content = TextContent(hash=digest, codec=codec, data=data, length=len(text))
+            with db.begin_nested():
+                db.add(content)
+        return content
+
+    @staticmethod
+    def iter_text(content: TextContent) -> Iterator[str]:
+        """Đọc text theo từng đoạn (để stream), không giải nén toàn bộ vào bộ nhớ"""
+        return iter_decoded(content.codec, content.data)
+
+    @staticmethod
+    def read_prefix(content: TextContent, length: int) -> str:
+        """`length` ký tự đầu của text, chỉ giải nén tới đó"""
+        if "_text" in content.__dict__:
+            return content.text[:length]
+
+        parts, size = [], 0
+        for part in iter_decoded(content.codec, content.data):
+            parts.append(part)
+            size += len(part)
+            if size >= length:
+                break
+        return "".join(parts)[:length]
+
+    @staticmethod
+    def collect_garbage(db: Session, min_age_hours: int = 1) -> int:
+        """Xoá text không còn document, kết quả OCR hay blob nào tham chiếu"""
+
+        # Recent rows may belong to a transaction that has not committed its reference yet
+        cutoff = datetime.utcnow() - timedelta(hours=min_age_hours)
+        referenced = [
+            db.query(Document.text_hash).filter(Document.text_hash.isnot(None)),
+            db.query(OCRResult.text_hash).filter(OCRResult.text_hash.isnot(None)),
+            db.query(FileBlob.text_hash).filter(FileBlob.text_hash.isnot(None)),
+            db.query(FileBlob.ocr_text_hash).filter(FileBlob.ocr_text_hash.isnot(None)),
+        ]
+        query = db.query(TextContent).filter(TextContent.created_at < cutoff)
+        for subquery in referenced:
+            query = query.filter(TextContent.hash.notin_(subquery))
+
+        deleted = query.delete(synchronize_session=False)
+        db.commit()
+        return deleted
@@ -0,0 +1,220 @@
+# app/services/upload_stream.py
+import hashlib
+import os
+import tempfile
+from typing import Callable, List, Optional, Union
+
+import aiofiles
+import magic
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Bytes kept from the start of the file for MIME sniffing
+SNIFF_BYTES = 8192
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def too_large_error(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File quá lớn. Kích thước tối đa: {max_size / (1024*1024):.0f}MB"
+    )
+
+
+class StagedFile:
+    """File đã được ghi vào thư mục staging, kèm kích thước, sha256 và MIME type"""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str, mime_type: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StagingWriter:
+    """Ghi từng chunk xuống file staging, đồng thời tính sha256 và kích thước.
+
+    Bộ nhớ dùng cố định (một chunk + SNIFF_BYTES đầu file) bất kể file lớn đến đâu;
+    vượt quá max_size thì dừng ngay và xoá file tạm.
+    """
+
+    def __init__(self, staging_dir: str, max_size: int):
+        os.makedirs(staging_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=staging_dir, prefix="upload_", suffix=".part")
+        os.close(fd)
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._head = b""
+        self._file = None
+
+    async def open(self):
+        self._file = await aiofiles.open(self.path, "wb")
+        return self
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            await self.abort()
+            raise too_large_error(self.max_size)
+
+        self._sha256.update(data)
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+        await self._file.write(data)
+
+    async def finish(self, filename: str) -> StagedFile:
+        await self._file.close()
+        mime_type = magic.from_buffer(self._head, mime=True) if self._head else "application/x-empty"
+        return StagedFile(self.path, filename, self.size, self._sha256.hexdigest(), mime_type)
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def stream_multipart_file(
+    request: Request,
+    staging_dir: str,
+    max_size: int,
+    field_name: str = "file",
+    validate_filename: Optional[Callable[[str], None]] = None
+) -> StagedFile:
+    """Đọc body multipart/form-data dạng stream và ghi phần `field_name` vào file staging.
+
+    Không dùng UploadFile của Starlette (vốn đọc hết body trước khi gọi handler),
+    nên request quá lớn bị từ chối ngay khi vượt giới hạn.
+    """
+    staged = await stream_multipart_files(
+        request, staging_dir, max_size, field_name, validate_filename, max_files=1
+    )
+    return staged[0]
+
+
+async def stream_multipart_files(
+    request: Request,
+    staging_dir: str,
+    max_size: Union[int, Callable[[str], int]],
+    field_name: str = "file",
+    validate_filename: Optional[Callable[[str], None]] = None,
+    max_files: Optional[int] = None,
+    max_total_size: Optional[int] = None
+) -> List[StagedFile]:
+    """Như stream_multipart_file nhưng nhận mọi phần file tên `field_name` (tối đa max_files).
+
+    max_size có thể là hàm nhận tên file và trả về giới hạn cho file đó (vd. ZIP
+    được phép lớn hơn file thường); max_total_size giới hạn tổng dung lượng.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Yêu cầu phải là multipart/form-data")
+
+    size_limit = max_size if callable(max_size) else (lambda filename: max_size)
+    body_limit = max_total_size if max_total_size is not None else (None if callable(max_size) else max_size)
+    content_length = request.headers.get("content-length")
+    if body_limit and content_length and content_length.isdigit() and int(content_length) > body_limit + MULTIPART_OVERHEAD:
+        raise too_large_error(body_limit)
+
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "target": False, "files": 0}
+    # Parser callbacks are synchronous, file writes are async: queue events and apply them after each write
+    events = []
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = False
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name == field_name and filename and (max_files is None or state["files"] < max_files):
+            filename = os.path.basename(filename.decode("utf-8", "replace").replace("\\", "/"))
+            if validate_filename:
+                validate_filename(filename)
+            state["files"] += 1
+            state["target"] = True
+            events.append(("begin", filename))
+
+    def on_part_data(data, start, end):
+        # Other form fields are ignored
+        if state["target"]:
+            events.append(("data", data[start:end]))
+
+    def on_part_end():
+        if state["target"]:
+            events.append(("end", None))
+        state["target"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    staged = []
+    writer = None
+    filename = None
+    total = 0
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, value in events:
+                if kind == "begin":
+                    filename = value
+                    writer = await StagingWriter(staging_dir, size_limit(filename)).open()
+                elif kind == "data":
+                    total += len(value)
+                    if max_total_size is not None and total > max_total_size:
+                        raise too_large_error(max_total_size)
+                    await writer.write(value)
+                else:
+                    staged.append(await writer.finish(filename))
+                    writer = None
+            events.clear()
+        parser.finalize()
+    except Exception as e:
+        if writer is not None:
+            await writer.abort()
+        for item in staged:
+            item.discard()
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=f"Dữ liệu upload không hợp lệ: {str(e)}")
+
+    if writer is not None:
+        # Body ended in the middle of a file part
+        await writer.abort()
+        for item in staged:
+            item.discard()
+        raise HTTPException(status_code=400, detail="Dữ liệu upload không đầy đủ")
+
+    if not staged:
+        raise HTTPException(status_code=400, detail="Không tìm thấy file trong yêu cầu")
+
+    return staged
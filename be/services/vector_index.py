@@ -0,0 +1,804 @@
+# app/services/vector_index.py
+import os
+import json
+import threading
+import fcntl
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Tuple, Dict, Any
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+from database import settings, SessionLocal
+from models import VectorStore
+from services.embedding_codec import EMBEDDING_DTYPES, quantize, encode_embedding, decode_embedding
+
+# HNSW parameters (M links per node, 2*M on the base layer)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 100
+HNSW_EF_SEARCH = 64
+
+INITIAL_CAPACITY = 1024
+SCAN_BLOCK = 65536  # rows dequantized at a time by the flat scan
+RESCORE_FACTOR = 4  # approximate candidates per result re-scored exactly
+
+# The graph is re-saved once this share of its nodes is newer than hnsw.bin,
+# other processes insert the missing rows from the matrix themselves
+GRAPH_CHECKPOINT_RATIO = 0.1
+
+_VECTOR_FILE_SUFFIX = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+def default_index_path() -> str:
+    """Thư mục chỉ mục: VECTOR_INDEX_PATH hoặc 'vector_index' cạnh CHROMA_DB_PATH"""
+    if settings.VECTOR_INDEX_PATH:
+        return settings.VECTOR_INDEX_PATH
+    chroma_path = os.path.abspath(settings.CHROMA_DB_PATH)
+    return os.path.join(os.path.dirname(chroma_path), "vector_index")
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Chuẩn hoá L2 để dot product = cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HNSWGraph:
+    """Đồ thị HNSW của hnswlib trên các vector đã chuẩn hoá, similarity = dot product.
+
+    Node id chính là số thứ tự dòng trong ma trận vector; node bị xoá
+    (tombstone) vẫn nằm trong đồ thị nhưng bị lọc khỏi kết quả. hnswlib giữ
+    bản float32 của các vector trong bộ nhớ.
+    """
+
+    kind = "hnswlib"
+
+    def __init__(self, dim: int, capacity: int, index=None):
+        if index is None:
+            index = hnswlib.Index(space="ip", dim=dim)
+            index.init_index(
+                max_elements=max(capacity, INITIAL_CAPACITY),
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                M=HNSW_M,
+                random_seed=42
+            )
+        self.index = index
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "HNSWGraph":
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(path)
+        return cls(dim, 0, index)
+
+    def save(self, path: str):
+        self.index.save_index(path)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    def add_range(self, start: int, end: int, vectors):
+        if end > self.index.get_max_elements():
+            self.index.resize_index(max(end, 2 * self.index.get_max_elements()))
+        for block in range(start, end, SCAN_BLOCK):
+            block_end = min(block + SCAN_BLOCK, end)
+            self.index.add_items(vectors[block:block_end], np.arange(block, block_end))
+
+    def search(self, query: np.ndarray, k: int, ef: int, deleted: np.ndarray) -> Optional[List[Tuple[float, int]]]:
+        """None khi hnswlib không tìm đủ k node còn sống (phần lớn đã bị xoá), khi đó quét toàn bộ"""
+        self.index.set_ef(max(ef, k))
+        try:
+            labels, distances = self.index.knn_query(query, k=k, filter=lambda label: not deleted[label])
+        except RuntimeError:
+            return None
+        # Inner product space: distance = 1 - dot product
+        return [(1.0 - float(d), int(i)) for i, d in zip(labels[0], distances[0])]
+
+
+class _QuantizedView:
+    """Đọc các dòng đã lượng tử hoá như ma trận float32 (dựng đồ thị, compact)"""
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray]):
+        self.codes = codes
+        self.scales = scales
+
+    def __getitem__(self, rows):
+        vectors = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][..., None] if vectors.ndim == 2 else self.scales[rows]
+        return vectors
+
+
+class ChunkDocument:
+    """Chunk trả về từ similarity_search, cùng thuộc tính với Document của LangChain
+    (không import LangChain trên đường tìm kiếm)"""
+
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Dict[str, Any]):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class VectorIndex:
+    """Chỉ mục vector trên đĩa: ma trận memory-mapped + bảng dòng -> chunk id.
+
+    Vector được lưu ở dạng VECTOR_STORAGE_DTYPE (float32, float16 hoặc int8 với
+    scale riêng cho từng vector) và được chấm điểm trực tiếp trên dạng nén. Khi
+    bật VECTOR_RESCORE, bản float32 đầy đủ được giữ trên đĩa và chỉ đọc lại cho
+    các ứng viên tốt nhất để chấm điểm chính xác.
+
+    Dưới VECTOR_INDEX_HNSW_THRESHOLD vector, tìm kiếm quét toàn bộ ma trận bằng
+    numpy; từ ngưỡng đó trở lên dùng đồ thị HNSW của hnswlib (không cài hnswlib
+    thì vẫn quét toàn bộ). Xoá chỉ đánh dấu tombstone, compact() dựng lại chỉ
+    mục khi tỉ lệ tombstone đã cao.
+
+    Các file trong thư mục chỉ mục:
+        manifest.json   - dim, dtype, count, capacity, version, lineage, graph
+        vectors.<dtype> - ma trận capacity x dim (memory-mapped)
+        scales.f32      - scale của từng vector (chỉ với int8)
+        rescore.f32     - vector float32 đầy đủ để chấm lại (khi dtype != float32)
+        rows.tsv        - chunk_id<TAB>document_id cho từng dòng
+        tombstones.npy  - mảng bool các dòng đã xoá
+        hnsw.bin        - đồ thị HNSW (khi đã vượt ngưỡng), có thể thiếu các dòng mới nhất
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        hnsw_threshold: Optional[int] = None,
+        dtype: Optional[str] = None,
+        rescore: Optional[bool] = None
+    ):
+        self.path = path or default_index_path()
+        self.hnsw_threshold = hnsw_threshold if hnsw_threshold is not None else settings.VECTOR_INDEX_HNSW_THRESHOLD
+        self.default_dtype = dtype or settings.VECTOR_STORAGE_DTYPE
+        self.default_rescore = rescore if rescore is not None else settings.VECTOR_RESCORE
+        if self.default_dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported vector storage dtype: {self.default_dtype}")
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_shared = False  # mode of the flock held while _lock_depth > 0
+        self._manifest_mtime = None
+        self._reset()
+        with self._lock:
+            if os.path.exists(os.path.join(self._compact_path, "READY")):
+                with self._file_lock():
+                    self._finish_compaction()
+            with self._file_lock(shared=True):
+                self._load()
+
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.dtype = self.default_dtype
+        self.rescore = self.default_rescore and self.default_dtype != "float32"
+        self.count = 0
+        self.capacity = 0
+        self.version = 0
+        self._codes: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._exact: Optional[np.memmap] = None
+        self._view = None
+        self.chunk_ids: List[str] = []
+        self.document_ids: List[str] = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.lineage: Optional[str] = None  # changes when rows are renumbered (compact)
+        self.graph = None
+        self._graph_info: Dict[str, Any] = {}  # how the graph is saved, kept in the manifest
+        self._graph_saved = 0  # nodes covered by hnsw.bin
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def _vectors_file(self) -> str:
+        return self._file("vectors." + _VECTOR_FILE_SUFFIX[self.dtype])
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """Khoá liên tiến trình (API và Celery worker cùng ghi một chỉ mục).
+
+        Ghi giữ khoá độc quyền, đọc lại các file (shared=True) giữ khoá chia sẻ
+        để không thấy trạng thái ghi dở. Chỉ gọi khi đang giữ self._lock: bộ đếm
+        lồng nhau không được bảo vệ riêng. Gọi lồng nhau dùng lại khoá đang giữ
+        nếu nó đủ mạnh; xin khoá độc quyền khi chỉ đang giữ khoá chia sẻ là lỗi
+        (flock không nâng cấp nguyên tử được, hai tiến trình cùng nâng sẽ chờ nhau).
+        """
+        if self._lock_depth:
+            if self._lock_shared and not shared:
+                raise RuntimeError("Exclusive vector index lock requested while holding the shared lock")
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+
+        # Kept outside the index directory, compact() swaps the directory
+        with open(self.path.rstrip(os.sep) + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_depth, self._lock_shared = 1, shared
+            try:
+                yield
+            finally:
+                self._lock_depth, self._lock_shared = 0, False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ======================= PERSISTENCE =======================
+
+    def _open_matrices(self, capacity: int):
+        """Mở (và mở rộng nếu cần) các file ma trận với `capacity` dòng"""
+        files = [(self._vectors_file, EMBEDDING_DTYPES[self.dtype], self.dim)]
+        if self.dtype == "int8":
+            files.append((self._file("scales.f32"), np.float32, 1))
+        if self.rescore:
+            files.append((self._file("rescore.f32"), np.float32, self.dim))
+
+        matrices = []
+        for file_path, dtype, width in files:
+            with open(file_path, "ab") as f:
+                size = capacity * width * np.dtype(dtype).itemsize
+                if f.tell() < size:
+                    f.truncate(size)
+            shape = (capacity, width) if width > 1 else (capacity,)
+            matrices.append(np.memmap(file_path, dtype=dtype, mode="r+", shape=shape))
+
+        self._codes = matrices[0]
+        self._scales = matrices[1] if self.dtype == "int8" else None
+        self._exact = matrices[-1] if self.rescore else None
+        self._view = self._codes if self.dtype == "float32" else _QuantizedView(self._codes, self._scales)
+        self.capacity = capacity
+
+    def _load(self, previous_graph=None):
+        manifest_path = self._file("manifest.json")
+        if not os.path.exists(manifest_path):
+            self._manifest_mtime = None
+            return
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self._manifest_mtime = os.stat(manifest_path).st_mtime_ns
+
+        # The on-disk format wins over settings, use migrations to change it
+        self.dim = manifest["dim"]
+        self.dtype = manifest.get("dtype", "float32")
+        self.rescore = manifest.get("rescore", False)
+        self.count = manifest["count"]
+        self.version = manifest.get("version", 0)
+        self.lineage = manifest.get("lineage")
+        self._open_matrices(manifest["capacity"])
+
+        self.chunk_ids, self.document_ids = [], []
+        with open(self._file("rows.tsv")) as f:
+            for line in f:
+                chunk_id, document_id = line.rstrip("\n").split("\t")
+                self.chunk_ids.append(chunk_id)
+                self.document_ids.append(document_id)
+        if len(self.chunk_ids) > self.count:
+            # Rows appended by a writer that died before updating the manifest
+            del self.chunk_ids[self.count:], self.document_ids[self.count:]
+            self._write_rows()
+
+        self.deleted = np.zeros(self.capacity, dtype=bool)
+        if os.path.exists(self._file("tombstones.npy")):
+            tombstones = np.load(self._file("tombstones.npy"))
+            self.deleted[:min(len(tombstones), self.count)] = tombstones[:self.count]
+
+        self._load_graph(manifest, previous_graph)
+
+    def _load_graph(self, manifest: Dict[str, Any], previous):
+        """Dùng lại đồ thị đang có trong bộ nhớ nếu vẫn khớp với các dòng, nếu không đọc hnsw.bin.
+
+        previous là (graph, lineage) trước lần nạp lại. Đồ thị thiếu các dòng mới
+        nhất được bổ sung từ ma trận khi tìm kiếm (_extend_graph).
+        """
+        info = manifest.get("graph") or {}
+        # Graphs of another kind (older pure-Python ones) are rebuilt lazily
+        if hnswlib is None or self.dim is None or info.get("kind") != HNSWGraph.kind:
+            return
+
+        graph, lineage = previous or (None, None)
+        if graph is None or lineage != self.lineage:
+            try:
+                graph = HNSWGraph.load(self._file("hnsw.bin"), self.dim)
+            except (FileNotFoundError, RuntimeError):
+                return
+            if len(graph) != info.get("nodes"):
+                return
+        # A graph ahead of the manifest is from an interrupted write, rebuild it lazily
+        if len(graph) > self.count:
+            return
+
+        self.graph = graph
+        self._graph_info = info
+        self._graph_saved = len(graph)
+
+    def _refresh_if_stale(self):
+        """Nạp lại khi một tiến trình khác đã ghi chỉ mục"""
+        manifest_path = self._file("manifest.json")
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None  # emptied by compact()
+        if mtime != self._manifest_mtime:
+            with self._file_lock(shared=True):
+                previous_graph = (self.graph, self.lineage)
+                self._reset()
+                self._load(previous_graph)
+
+    def _write_rows(self):
+        with open(self._file("rows.tsv"), "w") as f:
+            f.writelines(f"{c}\t{d}\n" for c, d in zip(self.chunk_ids, self.document_ids))
+
+    def _save_state(self):
+        """Ghi tombstones/đồ thị rồi mới ghi manifest (manifest là mốc commit)"""
+        np.save(self._file("tombstones.npy"), self.deleted[:self.count])
+
+        if self.graph is not None and self._graph_save_due():
+            self._save_graph()
+
+        if self.lineage is None:
+            self.lineage = uuid.uuid4().hex
+        self.version += 1
+        tmp_path = self._file("manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "dim": self.dim,
+                "dtype": self.dtype,
+                "rescore": self.rescore,
+                "count": self.count,
+                "capacity": self.capacity,
+                "version": self.version,
+                "lineage": self.lineage,
+                "graph": self._graph_info
+            }, f)
+        os.replace(tmp_path, self._file("manifest.json"))
+        self._manifest_mtime = os.stat(self._file("manifest.json")).st_mtime_ns
+
+    def _graph_save_due(self) -> bool:
+        if self._graph_info.get("kind") != self.graph.kind:
+            return True
+        # Other processes insert the rows missing from hnsw.bin themselves
+        return len(self.graph) - self._graph_saved >= max(1, GRAPH_CHECKPOINT_RATIO * len(self.graph))
+
+    def _save_graph(self):
+        tmp_path = self._file("hnsw.bin.tmp")
+        self.graph.save(tmp_path)
+        os.replace(tmp_path, self._file("hnsw.bin"))
+        self._graph_info = {"kind": self.graph.kind, "nodes": len(self.graph)}
+        self._graph_saved = len(self.graph)
+
+    def _reserve(self, needed: int):
+        """Mở rộng các file ma trận (nhân đôi dung lượng) để chứa `needed` dòng"""
+        if needed <= self.capacity:
+            return
+
+        new_capacity = max(INITIAL_CAPACITY, self.capacity * 2, needed)
+        for matrix in (self._codes, self._scales, self._exact):
+            if matrix is not None:
+                matrix.flush()
+        self._open_matrices(new_capacity)
+
+        deleted = np.zeros(new_capacity, dtype=bool)
+        deleted[:self.count] = self.deleted[:self.count]
+        self.deleted = deleted
+
+    # ======================= MUTATIONS =======================
+
+    def add(self, chunk_ids: List[str], document_ids: List[str], embeddings) -> int:
+        """Thêm vector mới vào cuối ma trận (incremental, không dựng lại chỉ mục)"""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        if vectors.ndim != 2 or len(vectors) == 0:
+            return 0
+
+        with self._lock, self._file_lock():
+            self._refresh_if_stale()
+
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            start, end = self.count, self.count + len(vectors)
+            self._reserve(end)
+
+            codes, scales = quantize(vectors, self.dtype)
+            self._codes[start:end] = codes
+            self._codes.flush()
+            if self._scales is not None:
+                self._scales[start:end] = scales
+                self._scales.flush()
+            if self._exact is not None:
+                self._exact[start:end] = vectors
+                self._exact.flush()
+
+            with open(self._file("rows.tsv"), "a") as f:
+                f.writelines(f"{c}\t{d}\n" for c, d in zip(chunk_ids, document_ids))
+            self.chunk_ids.extend(chunk_ids)
+            self.document_ids.extend(document_ids)
+            self.count = end
+
+            self._extend_graph()
+            self._save_state()
+
+        return len(vectors)
+
+    def _extend_graph(self):
+        """Thêm các dòng chưa có vào đồ thị HNSW khi chỉ mục đã đủ lớn (cần hnswlib)"""
+        if hnswlib is None or (self.graph is None and self.count < self.hnsw_threshold):
+            return
+        if self.graph is None:
+            self.graph = HNSWGraph(self.dim, self.capacity)
+            self._graph_saved = 0
+
+        source = self._exact if self._exact is not None else self._view
+        self.graph.add_range(len(self.graph), self.count, source)
+
+    def delete_document(self, document_id: str) -> int:
+        """Đánh dấu tombstone mọi chunk của một tài liệu"""
+        document_id = str(document_id)
+        with self._lock, self._file_lock():
+            self._refresh_if_stale()
+            return self._tombstone([i for i, d in enumerate(self.document_ids) if d == document_id])
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """Đánh dấu tombstone các chunk theo id (vd. khi dòng vector_store tương ứng không được lưu)"""
+        wanted = set(chunk_ids)
+        with self._lock, self._file_lock():
+            self._refresh_if_stale()
+            return self._tombstone([i for i, c in enumerate(self.chunk_ids) if c in wanted])
+
+    def _tombstone(self, rows) -> int:
+        rows = [i for i in rows if not self.deleted[i]]
+        if rows:
+            self.deleted[rows] = True
+            self._save_state()
+        return len(rows)
+
+    @property
+    def _compact_path(self) -> str:
+        return self.path.rstrip(os.sep) + ".compact"
+
+    def compact(self) -> Dict[str, Any]:
+        """Dựng lại chỉ mục chỉ với các dòng còn sống rồi thay các file cũ.
+
+        Bản mới được dựng trong thư mục <path>.compact từ ảnh chụp các dòng
+        còn sống, không giữ khoá, nên search/add vẫn chạy trong lúc dựng (kể cả
+        đồ thị HNSW). Sau đó mới lấy khoá để thêm các dòng mới và tombstone
+        phát sinh trong lúc dựng, rồi os.replace từng file vào chỗ cũ (manifest
+        sau cùng).
+
+        Dạng lưu trữ mới theo cấu hình hiện tại (VECTOR_STORAGE_DTYPE,
+        VECTOR_RESCORE), nên compact cũng dùng để chuyển đổi định dạng.
+        """
+        new_path = self._compact_path
+        # Only one compaction per index at a time, across processes
+        with open(self.path.rstrip(os.sep) + ".compacting.lock", "w") as compact_lock:
+            fcntl.flock(compact_lock, fcntl.LOCK_EX)
+            try:
+                with self._lock, self._file_lock():
+                    self._finish_compaction()
+                    self._refresh_if_stale()
+                    snapshot_count = self.count
+                    snapshot_deleted = self.deleted[:self.count].copy()
+                    chunk_ids, document_ids = self.chunk_ids[:], self.document_ids[:]
+                    source = self._exact if self._exact is not None else self._view
+                    lineage = self.lineage
+
+                live = np.flatnonzero(~snapshot_deleted)
+                shutil.rmtree(new_path, ignore_errors=True)
+                compacted = VectorIndex(
+                    new_path,
+                    hnsw_threshold=self.hnsw_threshold,
+                    dtype=self.default_dtype,
+                    rescore=self.default_rescore
+                )
+                # Rows below snapshot_count are never rewritten in place, reading them needs no lock
+                for start in range(0, len(live), SCAN_BLOCK):
+                    rows = live[start:start + SCAN_BLOCK]
+                    compacted.add([chunk_ids[i] for i in rows], [document_ids[i] for i in rows], source[rows])
+
+                with self._lock, self._file_lock():
+                    self._refresh_if_stale()
+                    if self.lineage != lineage:
+                        raise RuntimeError("Vector index was replaced while compacting")
+                    rows_before = self.count
+
+                    # Rows added and deleted while the copy was being built
+                    added = snapshot_count + np.flatnonzero(~self.deleted[snapshot_count:self.count])
+                    source = self._exact if self._exact is not None else self._view
+                    for start in range(0, len(added), SCAN_BLOCK):
+                        rows = added[start:start + SCAN_BLOCK]
+                        compacted.add(
+                            [self.chunk_ids[i] for i in rows],
+                            [self.document_ids[i] for i in rows],
+                            source[rows]
+                        )
+                    removed = np.flatnonzero(self.deleted[:snapshot_count] & ~snapshot_deleted)
+                    compacted._tombstone(np.searchsorted(live, removed).tolist())
+
+                    if compacted.graph is not None and compacted._graph_saved < len(compacted.graph):
+                        # Complete hnsw.bin, so no process has to re-insert rows after the swap
+                        compacted._save_graph()
+                        compacted._save_state()
+                    empty = compacted.count == 0
+                    del compacted, source
+
+                    with open(os.path.join(new_path, "READY"), "w") as f:
+                        f.write("empty" if empty else "")
+                    self._finish_compaction()
+                    self._reset()
+                    self._load()
+            finally:
+                fcntl.flock(compact_lock, fcntl.LOCK_UN)
+
+        return {"rows_before": rows_before, "rows_after": self.count}
+
+    def _finish_compaction(self):
+        """Chuyển các file của bản đã compact xong (có READY) vào thư mục chỉ mục.
+
+        Gọi khi đang giữ khoá ghi. Chạy lại được nếu tiến trình trước bị dừng
+        giữa chừng: các file đã chuyển không còn trong <path>.compact.
+        """
+        new_path = self._compact_path
+        try:
+            with open(os.path.join(new_path, "READY")) as f:
+                empty = f.read() == "empty"
+        except FileNotFoundError:
+            return
+
+        if empty:
+            # Nothing left alive: an index directory without manifest is an empty index
+            wanted = set()
+            if os.path.exists(self._file("manifest.json")):
+                os.remove(self._file("manifest.json"))
+        else:
+            names = set(os.listdir(new_path)) - {"READY"}
+            for name in sorted(names - {"manifest.json"}):
+                os.replace(os.path.join(new_path, name), self._file(name))
+            if "manifest.json" in names:
+                # Readers keep their old memory maps until they see the new manifest
+                os.replace(os.path.join(new_path, "manifest.json"), self._file("manifest.json"))
+
+            with open(self._file("manifest.json")) as f:
+                manifest = json.load(f)
+            # Files the new format does not use (old dtype, older graph formats)
+            wanted = {"manifest.json", "rows.tsv", "tombstones.npy", "vectors." + _VECTOR_FILE_SUFFIX[manifest["dtype"]]}
+            if manifest["dtype"] == "int8":
+                wanted.add("scales.f32")
+            if manifest.get("rescore"):
+                wanted.add("rescore.f32")
+            if (manifest.get("graph") or {}).get("kind") == HNSWGraph.kind:
+                wanted.add("hnsw.bin")
+
+        for name in os.listdir(self.path):
+            if name not in wanted:
+                os.remove(self._file(name))
+        shutil.rmtree(new_path, ignore_errors=True)
+        if os.path.exists(new_path + ".lock"):
+            os.remove(new_path + ".lock")
+
+    # ======================= SEARCH =======================
+
+    def search(self, query_embedding, k: int = 5) -> List[Tuple[str, str, float]]:
+        """Top-k theo cosine similarity, trả về (chunk_id, document_id, score)"""
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+        with self._lock:
+            self._refresh_if_stale()
+            if self.count == 0:
+                return []
+
+            # Score on the compact vectors, then re-score a wider pool exactly
+            n_candidates = k * RESCORE_FACTOR if self._exact is not None else k
+
+            if hnswlib is not None and self.count >= self.hnsw_threshold and (
+                self.graph is None or len(self.graph) < self.count
+            ):
+                with self._file_lock():
+                    self._refresh_if_stale()
+                    self._extend_graph()
+                    if self.graph is not None and self._graph_save_due():
+                        self._save_state()
+
+            hits = None
+            if self.count >= self.hnsw_threshold and self.graph is not None:
+                hits = self.graph.search(query, n_candidates, HNSW_EF_SEARCH, self.deleted)
+            if hits is None:
+                hits = self._scan(query, n_candidates)
+
+            if self._exact is not None and hits:
+                hits = self._rescore(query, hits, k)
+
+            return [(self.chunk_ids[i], self.document_ids[i], score) for score, i in hits[:k]]
+
+    def _scan(self, query: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """Quét toàn bộ ma trận theo từng khối, chấm điểm trực tiếp trên dạng nén"""
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, self.count)
+            block = self._codes[start:end]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            scores[start:end] = block @ query
+            if self._scales is not None:
+                scores[start:end] *= self._scales[start:end]
+        scores[self.deleted[:self.count]] = -np.inf
+
+        k = min(k, self.count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top if np.isfinite(scores[i])]
+
+    def _rescore(self, query: np.ndarray, hits: List[Tuple[float, int]], k: int) -> List[Tuple[float, int]]:
+        rows = np.array(sorted(i for _, i in hits))
+        exact_scores = self._exact[rows] @ query
+        order = np.argsort(-exact_scores)[:k]
+        return [(float(exact_scores[j]), int(rows[j])) for j in order]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_if_stale()
+            tombstones = int(self.deleted[:self.count].sum())
+            resident_bytes = self._codes.nbytes if self._codes is not None else 0
+            if self._scales is not None:
+                resident_bytes += self._scales.nbytes
+            return {
+                "path": self.path,
+                "dim": self.dim,
+                "dtype": self.dtype,
+                "rescore": self.rescore,
+                "rows": self.count,
+                "live": self.count - tombstones,
+                "tombstones": tombstones,
+                "tombstone_ratio": tombstones / self.count if self.count else 0.0,
+                "algorithm": "hnsw" if hnswlib is not None and self.count >= self.hnsw_threshold else "flat",
+                "resident_bytes": resident_bytes,
+                "bytes_per_vector": resident_bytes / self.capacity if self.capacity else 0
+            }
+
+
+class NativeVectorStore:
+    """Vector store nội bộ thay cho Chroma (VECTOR_DB_TYPE=native).
+
+    Nội dung chunk và embedding (dạng nhị phân nén) được lưu trong bảng
+    vector_store, vector để tìm kiếm nằm trong VectorIndex. Cung cấp các hàm
+    add_documents/similarity_search giống vector store của LangChain mà
+    QAService đang dùng.
+    """
+
+    def __init__(self, embeddings, index: Optional[VectorIndex] = None):
+        self.embeddings = embeddings
+        self.index = index or VectorIndex()
+
+    def add_documents(self, documents) -> List[str]:
+        if not documents:
+            return []
+
+        embeddings = self.embeddings.embed_documents([doc.page_content for doc in documents])
+
+        db = SessionLocal()
+        try:
+            dtype = self.index.dtype
+            rows = []
+            for i, (doc, embedding) in enumerate(zip(documents, embeddings)):
+                blob, scale = encode_embedding(embedding, dtype)
+                rows.append(VectorStore(
+                    id=uuid.uuid4(),
+                    document_id=uuid.UUID(str(doc.metadata["document_id"])),
+                    chunk_index=doc.metadata.get("chunk_index", i),
+                    content=doc.page_content,
+                    embedding_blob=blob,
+                    embedding_dtype=dtype,
+                    embedding_scale=scale,
+                    vec_metadata=doc.metadata
+                ))
+            chunk_ids = [str(row.id) for row in rows]
+            document_ids = [str(row.document_id) for row in rows]
+
+            self._add_and_commit(db, rows, chunk_ids, document_ids, embeddings)
+        finally:
+            db.close()
+
+        return chunk_ids
+
+    def _add_and_commit(self, db, rows, chunk_ids: List[str], document_ids: List[str], embeddings):
+        """Thêm vector vào chỉ mục trước rồi mới commit các dòng, để không có dòng nào thiếu vector;
+        commit lỗi thì các vector vừa thêm bị tombstone"""
+        self.index.add(chunk_ids, document_ids, embeddings)
+        try:
+            db.add_all(rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.index.delete_chunks(chunk_ids)
+            raise
+
+    def copy_document(self, source_document_id, target_document_id, metadata: Optional[dict] = None) -> int:
+        """Sao chép chunk và embedding đã có của một tài liệu sang tài liệu khác (cùng nội dung),
+        không phải gọi lại model embedding"""
+        db = SessionLocal()
+        try:
+            source_rows = db.query(VectorStore).filter(
+                VectorStore.document_id == uuid.UUID(str(source_document_id))
+            ).order_by(VectorStore.chunk_index).all()
+            if not source_rows:
+                return 0
+
+            target_id = uuid.UUID(str(target_document_id))
+            rows = [
+                VectorStore(
+                    id=uuid.uuid4(),
+                    document_id=target_id,
+                    chunk_index=row.chunk_index,
+                    content=row.content,
+                    embedding_blob=row.embedding_blob,
+                    embedding_dtype=row.embedding_dtype,
+                    embedding_scale=row.embedding_scale,
+                    vec_metadata={**(row.vec_metadata or {}), **(metadata or {}), "document_id": str(target_id)}
+                )
+                for row in source_rows if row.embedding_blob is not None
+            ]
+            embeddings = [
+                decode_embedding(row.embedding_blob, row.embedding_dtype, row.embedding_scale)
+                for row in rows
+            ]
+
+            chunk_ids = [str(row.id) for row in rows]
+
+            self._add_and_commit(db, rows, chunk_ids, [str(target_id)] * len(chunk_ids), embeddings)
+        finally:
+            db.close()
+
+        return len(chunk_ids)
+
+    def delete_document(self, document_id) -> int:
+        """Xoá các chunk của tài liệu khỏi bảng và đánh dấu tombstone trong chỉ mục"""
+        db = SessionLocal()
+        try:
+            db.query(VectorStore).filter(
+                VectorStore.document_id == uuid.UUID(str(document_id))
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        return self.index.delete_document(str(document_id))
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Any, float]]:
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4) -> List[Tuple[ChunkDocument, float]]:
+        hits = self.index.search(embedding, k)
+        if not hits:
+            return []
+
+        db = SessionLocal()
+        try:
+            rows = db.query(VectorStore).filter(
+                VectorStore.id.in_([uuid.UUID(chunk_id) for chunk_id, _, _ in hits])
+            ).all()
+            rows_by_id = {str(row.id): row for row in rows}
+        finally:
+            db.close()
+
+        results = []
+        for chunk_id, document_id, score in hits:
+            row = rows_by_id.get(chunk_id)
+            if row is None:
+                continue
+            metadata = {**(row.vec_metadata or {}), "document_id": document_id, "chunk_index": row.chunk_index}
+            results.append((ChunkDocument(row.content, metadata), score))
+        return results
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Any]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> List[Any]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
@@ -0,0 +1,72 @@
+# app/services/warmup.py
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+
+class WarmupService:
+    """Theo dõi việc khởi tạo các thành phần nặng (database, OCR, QA) sau khi server khởi động.
+
+    Mỗi thành phần là một hàm đồng bộ, được chạy trong thread riêng để event loop
+    vẫn phục vụ /health trong lúc torch, easyocr, langchain... đang được nạp.
+    """
+
+    def __init__(self):
+        self._components: List[Dict[str, Any]] = []
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[datetime] = None
+
+    def register(self, name: str, loader: Callable[[], Any], required: bool = True):
+        """Đăng ký một thành phần cần warm up"""
+        self._components.append({"name": name, "loader": loader, "required": required})
+        self._status[name] = {"state": "pending", "required": required}
+
+    async def run(self, names: Optional[List[str]] = None):
+        """Chạy lần lượt các thành phần (hoặc chỉ những thành phần trong `names`)"""
+        if self.started_at is None:
+            self.started_at = datetime.now()
+
+        for component in self._components:
+            name = component["name"]
+            if names is not None and name not in names:
+                continue
+            if self._status[name]["state"] in ("loading", "ready"):
+                continue
+
+            self._status[name]["state"] = "loading"
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(component["loader"])
+                self._status[name].update({
+                    "state": "ready",
+                    "seconds": round(time.perf_counter() - start, 3),
+                })
+            except Exception as e:
+                print(f"Warning: warm-up of {name} failed: {e}")
+                self._status[name].update({
+                    "state": "failed",
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "error": str(e),
+                })
+
+    def mark_lazy(self, names: List[str]):
+        """Đánh dấu các thành phần sẽ được nạp khi dùng lần đầu (không chặn /ready)"""
+        for name in names:
+            if name in self._status and self._status[name]["state"] == "pending":
+                self._status[name]["state"] = "lazy"
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            status["state"] in ("ready", "lazy")
+            for status in self._status.values()
+            if status["required"]
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "components": self._status,
+        }
@@ -1,72 +1,84 @@
 # app/tasks/document_tasks.py
 from celery import current_task
-from sqlalchemy.orm import Session
 from celery_app import celery_app
-from database import SessionLocal
-from models import Document
 from services.qa_service import QAService
-import os
+from services.document_pipeline import DocumentPipeline
+from services.previews import PREVIEWABLE_TYPES
+from tasks.preview_tasks import render_document_preview
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# One QAService per worker process: loading the embedding model per task would
+# dominate the cost of bulk ingests
+_qa_service = None
+
+def get_qa_service() -> QAService:
+    global _qa_service
+    if _qa_service is None:
+        _qa_service = QAService()
+    return _qa_service
+
+def _queue_preview(document_id: str):
+    """First-page thumbnails for the document list, rendered before anyone asks"""
+    from database import SessionLocal
+    from models import Document
+    from uuid import UUID
+    
+    db = SessionLocal()
+    try:
+        document = db.query(Document.type).filter(Document.id == UUID(document_id)).first()
+    finally:
+        db.close()
+    if document and document.type.upper() in PREVIEWABLE_TYPES:
+        render_document_preview.delay(document_id, 1)
+
+# The three stages below are chained by services.document_pipeline.enqueue_pipeline.
+# A stage that raises stops the chain; its error is recorded on the document.
+
+@celery_app.task(bind=True)
+def extract_document_text(self, document_id: str):
+    """Pipeline stage 1: extract the text layer of PDF/DOCX/TXT files"""
+    
+    current_task.update_state(state='PROGRESS', meta={'step': 'extracting_text', 'document_id': document_id})
+    return {'document_id': document_id, 'found': asyncio.run(DocumentPipeline().extract(document_id))}
+
+# A long scanned PDF takes well over the default 30 minute limit
+@celery_app.task(bind=True, time_limit=3 * 3600, soft_time_limit=3 * 3600 - 300)
+def ocr_document(self, document_id: str):
+    """Pipeline stage 2: OCR images and PDFs without a usable text layer"""
+    
+    current_task.update_state(state='PROGRESS', meta={'step': 'ocr', 'document_id': document_id})
+    return {'document_id': document_id, 'found': asyncio.run(DocumentPipeline().ocr(document_id))}
+
 @celery_app.task(bind=True)
+def index_document(self, document_id: str):
+    """Pipeline stage 3: index the document for vector search"""
+    
+    current_task.update_state(state='PROGRESS', meta={'step': 'indexing_vectors', 'document_id': document_id})
+    found = asyncio.run(DocumentPipeline(get_qa_service()).index(document_id))
+    if found:
+        _queue_preview(document_id)
+    return {'document_id': document_id, 'found': found}
+
+@celery_app.task(bind=True, time_limit=3 * 3600, soft_time_limit=3 * 3600 - 300)
 def process_document_for_search(self, document_id: str):
-    """Process document for search indexing"""
+    """Process document for search indexing (all pipeline stages in one task)"""
     
-    db = SessionLocal()
     try:
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            raise ValueError(f"Document {document_id} not found")
-        
-        # Update task progress
         current_task.update_state(
             state='PROGRESS',
-            meta={'step': 'extracting_text', 'progress': 25}
+            meta={'step': 'processing', 'document_id': document_id}
         )
         
-        # Extract text if not already done
-        if not document.extracted_text and document.file_path and os.path.exists(document.file_path):
-            from services.document_service import DocumentService
-            doc_service = DocumentService()
-            
-            try:
-                extracted_text = doc_service._extract_text_from_file(
-                    document.file_path, document.type
-                )
-                document.extracted_text = extracted_text
-                document.is_processed = True
-                db.commit()
-            except Exception as e:
-                logger.error(f"Failed to extract text from {document_id}: {e}")
-                raise
-        
-        # Update task progress
-        current_task.update_state(
-            state='PROGRESS',
-            meta={'step': 'indexing_vectors', 'progress': 75}
-        )
-        
-        # Index document for vector search
-        if document.extracted_text:
-            qa_service = QAService()
-            success = qa_service.index_document(
-                document.id,
-                document.extracted_text,
-                {
-                    "title": document.name,
-                    "type": document.type,
-                    "upload_date": document.upload_date.isoformat()
-                }
-            )
-            
-            if not success:
-                logger.warning(f"Failed to index document {document_id} for vector search")
+        if not asyncio.run(DocumentPipeline(get_qa_service()).run(document_id)):
+            raise ValueError(f"Document {document_id} not found")
+        _queue_preview(document_id)
         
         return {
             'status': 'completed',
-            'document_id': str(document.id),
+            'document_id': document_id,
             'message': 'Document processed successfully'
         }
         
@@ -77,8 +89,6 @@ def process_document_for_search(self, document_id: str):
             meta={'error': str(e)}
         )
         raise
-    finally:
-        db.close()
 
 @celery_app.task(bind=True)
 def batch_process_documents(self, document_ids: list):
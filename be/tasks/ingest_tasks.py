@@ -0,0 +1,34 @@
+# app/tasks/ingest_tasks.py
+from celery import current_task
+from celery_app import celery_app
+from services.document_service import DocumentService
+from services.bulk_ingest import BulkIngestService
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Expanding a large archive takes longer than the default 30 minute limit;
+# the per-document work runs in separate pipeline task chains (see services.document_pipeline)
+@celery_app.task(bind=True, time_limit=4 * 3600, soft_time_limit=4 * 3600 - 300)
+def ingest_bulk_job(self, job_id: str):
+    """Expand a bulk ingest job into documents"""
+    
+    try:
+        current_task.update_state(
+            state='PROGRESS',
+            meta={'step': 'expanding', 'job_id': job_id}
+        )
+        
+        service = BulkIngestService(DocumentService())
+        result = asyncio.run(service.run_job(job_id))
+        
+        return {'job_id': job_id, **result}
+        
+    except Exception as e:
+        logger.error(f"Bulk ingest job {job_id} failed: {e}")
+        current_task.update_state(
+            state='FAILURE',
+            meta={'error': str(e)}
+        )
+        raise
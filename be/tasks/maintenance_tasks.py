@@ -11,6 +11,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Documents re-queued per update_search_index run
+PIPELINE_RETRY_BATCH = 500
+
+# Re-queues per document before it is left failed (or stuck) for good
+PIPELINE_MAX_RETRIES = 3
+
 @celery_app.task
 def cleanup_temp_files():
     """Clean up temporary files older than 24 hours"""
@@ -18,6 +24,7 @@ def cleanup_temp_files():
     try:
         temp_dirs = [
             os.path.join(settings.UPLOAD_DIR, "temp"),
+            os.path.join(settings.UPLOAD_DIR, ".staging"),  # Uploads interrupted before reaching the blob store
             "/tmp"
         ]
         
@@ -39,8 +46,38 @@ def cleanup_temp_files():
                     except Exception as e:
                         logger.warning(f"Could not remove temp file {file_path}: {e}")
         
-        logger.info(f"Cleaned up {cleaned_files} temporary files")
-        return {"cleaned_files": cleaned_files}
+        # Resumable uploads past their expiry: drop the partial file and mark the session
+        db = SessionLocal()
+        try:
+            from services.resumable_upload import ResumableUploadService
+            expired_uploads = ResumableUploadService.expire_stale(db)
+            
+            # Extracted text no longer referenced by any document, OCR result or blob
+            from services.text_store import TextStore
+            removed_texts = TextStore.collect_garbage(db)
+            
+            # Blob files without a row: releases interrupted between rename and commit
+            from services.blob_store import BlobStore
+            removed_blobs = BlobStore(settings.UPLOAD_DIR).collect_garbage(db)
+        finally:
+            db.close()
+        
+        # Keep the preview cache under its size limit even when nothing renders
+        from services.previews import get_preview_cache
+        evicted_previews = get_preview_cache().evict()
+        
+        logger.info(
+            f"Cleaned up {cleaned_files} temporary files, expired {expired_uploads} upload sessions, "
+            f"removed {removed_texts} unused texts and {removed_blobs} orphaned blob files, "
+            f"evicted {evicted_previews} previews"
+        )
+        return {
+            "cleaned_files": cleaned_files,
+            "expired_uploads": expired_uploads,
+            "removed_texts": removed_texts,
+            "removed_blobs": removed_blobs,
+            "evicted_previews": evicted_previews
+        }
         
     except Exception as e:
         logger.error(f"Error during temp file cleanup: {e}")
@@ -101,52 +138,48 @@ def backup_database():
 
 @celery_app.task
 def update_search_index():
-    """Update search index for all documents"""
+    """Re-queue documents whose processing pipeline never finished
+    
+    Uploads are processed as they arrive (services.document_pipeline), so this
+    only picks up documents that failed or were left behind, e.g. by a worker
+    restart, instead of re-indexing the whole corpus. Each document is re-queued
+    at most PIPELINE_MAX_RETRIES times, oldest uploads first.
+    """
     
     db = SessionLocal()
     try:
-        from services.qa_service import QAService
-        
-        qa_service = QAService()
-        if not qa_service.vector_store:
-            logger.warning("Vector store not available, skipping search index update")
-            return {"status": "skipped", "reason": "Vector store not available"}
-        
-        # Get documents that need indexing
-        documents = db.query(Document).filter(
-            Document.extracted_text.isnot(None),
-            Document.is_processed == True
-        ).all()
-        
-        indexed_count = 0
-        failed_count = 0
-        
-        for document in documents:
-            try:
-                success =  qa_service.index_document(
-                    document.id,
-                    document.extracted_text,
-                    {
-                        "title": document.name,
-                        "type": document.type,
-                        "upload_date": document.upload_date.isoformat()
-                    }
-                )
-                
-                if success:
-                    indexed_count += 1
-                else:
-                    failed_count += 1
-                    
-            except Exception as e:
-                logger.error(f"Failed to index document {document.id}: {e}")
-                failed_count += 1
-        
-        logger.info(f"Search index update completed: {indexed_count} indexed, {failed_count} failed")
+        from services.document_pipeline import enqueue_pipeline
+        
+        # Give running pipelines time to finish before treating them as stuck
+        cutoff = datetime.utcnow() - timedelta(hours=1)
+        # A document that keeps failing (or keeps killing its worker) stops being retried
+        document_ids = [
+            row.id for row in db.query(Document.id).filter(
+                Document.processing_status != "completed",
+                Document.processing_attempts < PIPELINE_MAX_RETRIES,
+                Document.upload_date < cutoff
+            ).order_by(Document.upload_date).limit(PIPELINE_RETRY_BATCH).all()
+        ]
+        if not document_ids:
+            return {"status": "completed", "queued": 0}
+        
+        db.query(Document).filter(Document.id.in_(document_ids)).update(
+            {Document.processing_attempts: Document.processing_attempts + 1}, synchronize_session=False
+        )
+        db.commit()
+        
+        if not enqueue_pipeline(document_ids):
+            # Not an attempt: nothing ran
+            db.query(Document).filter(Document.id.in_(document_ids)).update(
+                {Document.processing_attempts: Document.processing_attempts - 1}, synchronize_session=False
+            )
+            db.commit()
+            return {"status": "error", "error": "Could not queue document processing"}
+        
+        logger.info(f"Search index update: {len(document_ids)} documents re-queued")
         return {
             "status": "completed",
-            "indexed": indexed_count,
-            "failed": failed_count
+            "queued": len(document_ids)
         }
         
     except Exception as e:
@@ -155,6 +188,30 @@ def update_search_index():
     finally:
         db.close()
 
+@celery_app.task
+def compact_vector_index(force: bool = False):
+    """Rebuild the built-in vector index when the tombstone ratio exceeds the threshold"""
+    
+    if settings.VECTOR_DB_TYPE != "native":
+        return {"status": "skipped", "reason": "Built-in vector index not in use"}
+    
+    try:
+        from services.vector_index import VectorIndex
+        
+        index = VectorIndex()
+        stats = index.stats()
+        
+        if not force and stats["tombstone_ratio"] < settings.VECTOR_COMPACT_TOMBSTONE_RATIO:
+            return {"status": "skipped", "tombstone_ratio": stats["tombstone_ratio"]}
+        
+        result = index.compact()
+        logger.info(f"Vector index compacted: {result['rows_before']} -> {result['rows_after']} rows")
+        return {"status": "completed", **result}
+        
+    except Exception as e:
+        logger.error(f"Vector index compaction failed: {e}")
+        return {"status": "error", "error": str(e)}
+
 @celery_app.task
 def clean_old_activity_logs():
     """Clean up activity logs older than 90 days"""
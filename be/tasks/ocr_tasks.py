@@ -5,6 +5,11 @@ from celery_app import celery_app
 from database import SessionLocal
 from models import OCRResult, Document
 from services.ocr_service import OCRService
+from services.blob_store import BlobStore
+from services.document_pages import set_document_content
+from services.text_store import TextStore
+from datetime import datetime
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -29,9 +34,9 @@ def process_ocr_task(self, ocr_result_id: str, file_path: str, file_ext: str, do
         )
         
         if file_ext == 'pdf':
-            extracted_text, confidence =  ocr_service._process_pdf(file_path)
+            extracted_text, confidence = asyncio.run(ocr_service._process_pdf(file_path))
         else:
-            extracted_text, confidence =  ocr_service._process_image(file_path)
+            extracted_text, confidence = asyncio.run(ocr_service._process_image(file_path))
         
         current_task.update_state(
             state='PROGRESS',
@@ -41,10 +46,11 @@ def process_ocr_task(self, ocr_result_id: str, file_path: str, file_ext: str, do
         # Update OCR result
         ocr_result = db.query(OCRResult).filter(OCRResult.id == ocr_result_id).first()
         if ocr_result:
-            ocr_result.extracted_text = extracted_text
+            content = TextStore.put(db, extracted_text)
+            ocr_result.text_content = content
             ocr_result.confidence = confidence
             ocr_result.status = "completed"
-            ocr_result.metadata = {
+            ocr_result.ocr_metadata = {
                 "processing_time": datetime.now().isoformat(),
                 "text_length": len(extracted_text),
                 "engine_version": ocr_service._get_engine_version()
@@ -53,8 +59,8 @@ def process_ocr_task(self, ocr_result_id: str, file_path: str, file_ext: str, do
             # Also update the document with extracted text
             document = db.query(Document).filter(Document.id == document_id).first()
             if document:
-                document.extracted_text = extracted_text
-                document.is_processed = True
+                set_document_content(document, content)
+                BlobStore.remember_ocr(db, document.content_hash, extracted_text, confidence)
             
             db.commit()
         
@@ -72,7 +78,7 @@ def process_ocr_task(self, ocr_result_id: str, file_path: str, file_ext: str, do
         ocr_result = db.query(OCRResult).filter(OCRResult.id == ocr_result_id).first()
         if ocr_result:
             ocr_result.status = "failed"
-            ocr_result.metadata = {
+            ocr_result.ocr_metadata = {
                 "error": str(e),
                 "processing_time": datetime.now().isoformat()
             }
@@ -85,7 +91,5 @@ def process_ocr_task(self, ocr_result_id: str, file_path: str, file_ext: str, do
         raise
         
     finally:
-        # Clean up temp file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # file_path is the document's stored blob, it is kept
         db.close()
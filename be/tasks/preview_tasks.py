@@ -0,0 +1,36 @@
+# app/tasks/preview_tasks.py
+from celery_app import celery_app
+from database import SessionLocal
+from models import Document
+from services.previews import get_preview_cache, preview_key, PreviewUnavailable, PREVIEWABLE_TYPES
+from uuid import UUID
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rendering one page at preview resolution takes well under a second; a file that
+# takes minutes is broken and should not hold a worker
+@celery_app.task(bind=True, time_limit=120, soft_time_limit=100)
+def render_document_preview(self, document_id: str, page: int = 1):
+    """Render WebP previews of one page of a document into the preview cache"""
+    
+    db = SessionLocal()
+    try:
+        document = db.query(Document).filter(Document.id == UUID(document_id)).first()
+        if not document or document.type.upper() not in PREVIEWABLE_TYPES:
+            return {'status': 'skipped', 'document_id': document_id}
+        if not document.file_path or not os.path.exists(document.file_path):
+            return {'status': 'missing', 'document_id': document_id}
+        
+        key, path, file_type = preview_key(document), document.file_path, document.type
+    finally:
+        db.close()
+    
+    try:
+        get_preview_cache().render(key, path, file_type, page)
+    except PreviewUnavailable as e:
+        logger.info(f"No preview for document {document_id} page {page}: {e}")
+        return {'status': 'unavailable', 'document_id': document_id, 'page': page}
+    
+    return {'status': 'completed', 'document_id': document_id, 'page': page}